@@ -530,7 +530,99 @@ IMPORTERS = {
     'xls': 'organization.importers.xls.XLSImporter'
 }
 
+# Number of random IDs each process reserves per model at a time
+ID_POOL_SIZE = 100
+
+# Number of rows an importer buffers before writing them with bulk_create
+IMPORT_BATCH_SIZE = 1000
+
+# Number of threads per process that run import jobs in the background.
+# With 0, imports run in the request that starts them.
+IMPORT_WORKERS = 2
+
+# Seconds after which a running import job that has not recorded a
+# checkpoint is considered lost and can be resumed
+IMPORT_JOB_TIMEOUT = 600
+
+# Number of processes, and rows per process, used to validate an import
+# file without importing it. Validation runs in the import jobs, and the
+# processes would be forked from web workers running threads, so by
+# default shards are validated in the job's own thread.
+IMPORT_VALIDATION_WORKERS = 0
+IMPORT_VALIDATION_SHARD_SIZE = 5000
+
+# Number of threads per process building project exports. With 0, exports
+# are built in the request that asks for them.
+EXPORT_WORKERS = 2
+
+# Seconds between the updates a running export job records, and seconds
+# after which a pending or running export job that was not updated is
+# considered lost, so that a new export is queued instead
+EXPORT_JOB_HEARTBEAT = 30
+EXPORT_JOB_TIMEOUT = 300
+
+# Maximum number of records of projects whose exports are streamed to the
+# client while they are built, where the format allows it. Exports of
+# larger projects are built in the background, as they would not complete
+# before the request times out.
+EXPORT_STREAM_MAX_RECORDS = 5000
+
+# Maximum total size in bytes of the cached exports in MEDIA_ROOT/exports
+EXPORT_CACHE_MAX_SIZE = 2 * 1024 ** 3
+
+# Number of resource files fetched at the same time for search exports,
+# attempts per file, and the total bandwidth they may use in bytes per
+# second (None for no limit)
+EXPORT_RESOURCE_WORKERS = 8
+EXPORT_RESOURCE_ATTEMPTS = 3
+EXPORT_RESOURCE_BANDWIDTH = None
+
+# Number of processes decoding the Elasticsearch dumps of search exports,
+# entities per batch, and the size in bytes from which a dump is decoded
+# by the processes rather than by the exporter itself. Search exports run
+# in web workers running threads, so by default dumps are decoded in the
+# export's own thread; the processes are started by a fork server when
+# enabled.
+EXPORT_DUMP_WORKERS = 0
+EXPORT_DUMP_BATCH_SIZE = 2000
+EXPORT_DUMP_PARALLEL_SIZE = 16 * 1024 ** 2
+
 ES_SCHEME = 'http'
 ES_HOST = 'localhost'
 ES_PORT = '9200'
 ES_MAX_RESULTS = 10000
+
+# Connections kept open to Elasticsearch, seconds to wait for a response,
+# and the number of consecutive failed requests after which requests are
+# refused for ES_CIRCUIT_RESET_TIMEOUT seconds
+ES_POOL_SIZE = 10
+ES_TIMEOUT = 10
+ES_CIRCUIT_THRESHOLD = 5
+ES_CIRCUIT_RESET_TIMEOUT = 30
+
+# Seconds for which rendered pages of search results are cached, and for
+# which the index timestamp of a project is trusted before checking again
+# whether the project was reindexed
+SEARCH_CACHE_TIMEOUT = 300
+SEARCH_TIMESTAMP_CACHE_TIMEOUT = 30
+
+# Whether saved and deleted entities are indexed as they change, the number
+# of threads per process sending the changes to Elasticsearch (with 0, in
+# the request making them), and the number of changes sent per bulk request
+SEARCH_INDEX_CHANGES = True
+SEARCH_INDEX_WORKERS = 1
+SEARCH_INDEX_BATCH_SIZE = 500
+
+# URL prepended to the resource file URLs of indexed documents
+ES_FILE_BASE_URL = ''
+
+# Search backends queried by the project search, in order, until one is
+# available
+SEARCH_BACKENDS = (
+    'search.backends.ElasticsearchBackend',
+    'search.backends.PostgresBackend',
+)
+
+# Seconds for which the roles of a user in a project, derived from their
+# policies, are cached
+ROLES_CACHE_TIMEOUT = 300
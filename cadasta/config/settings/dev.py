@@ -101,3 +101,4 @@ LOGGING = {
 }
 
 ES_PORT = '8000'
+ES_FILE_BASE_URL = 'http://localhost:8000'
@@ -1,3 +1,8 @@
 from .dev import *  # NOQA
 
 MEDIA_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'core/media/test')
+
+IMPORT_WORKERS = 0
+EXPORT_WORKERS = 0
+SEARCH_INDEX_CHANGES = False
+SEARCH_INDEX_WORKERS = 0
@@ -0,0 +1,64 @@
+"""Allocation of random primary keys for ``RandomIDModel`` subclasses.
+
+Saving a model used to check each new random ID with a query before
+inserting the row. Instead, each process keeps a pool of IDs per model.
+The pool is filled in batches, and one query checks a whole batch for
+collisions with existing rows. Code that creates many rows can take a
+batch of IDs at once with ``allocate_ids``.
+"""
+import threading
+
+from django.conf import settings
+
+from .util import random_ids
+
+
+def reserve_ids(model, count):
+    """Returns ``count`` unique random IDs that are not yet used by
+    ``model``, checking for collisions with one query per round."""
+    ids = set()
+    while len(ids) < count:
+        candidates = set(random_ids(count - len(ids))) - ids
+        taken = model._base_manager.filter(
+            pk__in=candidates).values_list('pk', flat=True)
+        ids.update(candidates.difference(taken))
+    return list(ids)
+
+
+class IDPool():
+    """Per-process pool of reserved IDs, kept separately for each model.
+    It is shared by all threads of the process."""
+
+    def __init__(self, size):
+        self.size = size
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def take(self, model, count):
+        if count <= 0:
+            return []
+        model = model._meta.concrete_model
+        with self._lock:
+            ids = self._ids.setdefault(model, [])
+            if count > len(ids):
+                if count >= self.size:
+                    return reserve_ids(model, count)
+                ids.extend(reserve_ids(model, self.size))
+            taken = ids[-count:]
+            del ids[-count:]
+            return taken
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+pool = IDPool(settings.ID_POOL_SIZE)
+
+
+def allocate_id(model):
+    return pool.take(model, 1)[0]
+
+
+def allocate_ids(model, count):
+    return pool.take(model, count)
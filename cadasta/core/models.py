@@ -3,7 +3,8 @@ import math
 from core.util import slugify
 from django.db import models
 
-from .util import random_id, ID_FIELD_LENGTH
+from .ids import allocate_id
+from .util import ID_FIELD_LENGTH
 
 
 class RandomIDModel(models.Model):
@@ -15,17 +16,9 @@ class RandomIDModel(models.Model):
     def save(self, *args, **kwargs):
         if not self.id:
             kwargs['force_insert'] = True
+            self.id = allocate_id(type(self))
 
-            ok = False
-            while not ok:
-                self.id = random_id()
-
-                if not type(self).objects.filter(pk=self.id).exists():
-                    ok = True
-                    super(RandomIDModel, self).save(*args, **kwargs)
-
-        else:
-            super(RandomIDModel, self).save(*args, **kwargs)
+        super(RandomIDModel, self).save(*args, **kwargs)
 
 
 class SlugModel:
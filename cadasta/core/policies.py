@@ -0,0 +1,108 @@
+"""Cached lookups of the permission policies and of the roles of users.
+
+Policies are looked up by name from a per-process registry, which is
+cleared whenever a policy is saved or deleted in the process; policies
+are only changed when they are loaded, so other processes pick up new
+policies once restarted.
+
+The roles of a user in the projects they contribute to are derived from
+their assigned policies, and cached by project in the default cache so
+that a permission check needs no query. The cached roles of a user are
+cleared by ``clear_user_roles`` when the policies of their organization
+or project roles are assigned, and expire after ``ROLES_CACHE_TIMEOUT``
+seconds in case their policies are assigned otherwise.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from tutelary.models import Policy
+
+# Role policies, by the variables they are assigned with
+GLOBAL_ROLES = ('superuser',)
+ORGANIZATION_ROLES = ('org-admin', 'org-member')
+PROJECT_ROLES = ('project-manager', 'project-user', 'data-collector')
+
+ROLES_KEY_PREFIX = 'policies:roles:'
+
+
+class PolicyRegistry():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.policies = {}
+
+    def get(self, name):
+        """Returns the policy named ``name``. Raises ``Policy.DoesNotExist``
+        if there is none."""
+        policy = self.policies.get(name)
+        if policy is None:
+            policy = Policy.objects.get(name=name)
+            with self.lock:
+                self.policies[name] = policy
+        return policy
+
+    def clear(self):
+        with self.lock:
+            self.policies = {}
+
+
+registry = PolicyRegistry()
+
+
+@receiver(post_save, sender=Policy)
+@receiver(post_delete, sender=Policy)
+def clear_registry(sender, **kwargs):
+    registry.clear()
+
+
+def get_policy_instance(policy_name, variables=None):
+    return (registry.get(policy_name), variables)
+
+
+def get_user_roles(user, project):
+    """Returns the set of the names of the role policies the user holds in
+    the project, including the roles held in its organization or over all
+    projects."""
+    key = ROLES_KEY_PREFIX + str(user.id)
+    user_roles = cache.get(key) or {}
+    roles = user_roles.get(project.id)
+    if roles is None:
+        roles = find_roles(user.assigned_policies(),
+                           project.organization.slug, project.slug)
+        user_roles[project.id] = roles
+        cache.set(key, user_roles, settings.ROLES_CACHE_TIMEOUT)
+    return roles
+
+
+def find_roles(assigned_policies, org_slug, project_slug):
+    """Returns the names of the role policies in ``assigned_policies``
+    that apply to the project."""
+    org_variables = {'organization': org_slug}
+    project_variables = {'organization': org_slug, 'project': project_slug}
+
+    roles = set()
+    for assigned in assigned_policies:
+        if isinstance(assigned, tuple):
+            policy, variables = assigned
+        else:
+            # A policy without variables, or a role
+            policy, variables = assigned, None
+
+        if policy.name in GLOBAL_ROLES:
+            if not variables:
+                roles.add(policy.name)
+        elif policy.name in ORGANIZATION_ROLES:
+            if variables == org_variables:
+                roles.add(policy.name)
+        elif policy.name in PROJECT_ROLES:
+            if variables == project_variables:
+                roles.add(policy.name)
+    return frozenset(roles)
+
+
+def clear_user_roles(user):
+    """Clears the cached roles of the user, once their policies changed."""
+    cache.delete(ROLES_KEY_PREFIX + str(user.id))
@@ -0,0 +1,62 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from .. import ids
+from ..util import ID_FIELD_LENGTH, alphabet, random_id, random_ids
+from .test_models import MyRandomIdModel
+
+
+class RandomIdTest(TestCase):
+    def test_random_id(self):
+        id = random_id()
+        assert len(id) == ID_FIELD_LENGTH
+        assert all(c in alphabet for c in id)
+
+    def test_random_ids(self):
+        generated = random_ids(50)
+        assert len(generated) == 50
+        assert len(set(generated)) == 50
+        for id in generated:
+            assert len(id) == ID_FIELD_LENGTH
+            assert all(c in alphabet for c in id)
+
+
+class ReserveIdsTest(TestCase):
+    def test_reserve_ids(self):
+        reserved = ids.reserve_ids(MyRandomIdModel, 50)
+        assert len(reserved) == 50
+        assert len(set(reserved)) == 50
+
+    def test_reserve_ids_skips_taken_ids(self):
+        taken = MyRandomIdModel.objects.create()
+        fresh = random_ids(2)
+        with patch('core.ids.random_ids',
+                   side_effect=[[taken.id, fresh[0]], [fresh[1]]]):
+            reserved = ids.reserve_ids(MyRandomIdModel, 2)
+        assert sorted(reserved) == sorted(fresh)
+
+
+class IDPoolTest(TestCase):
+    def test_take(self):
+        pool = ids.IDPool(10)
+        with patch('core.ids.reserve_ids',
+                   wraps=ids.reserve_ids) as reserve_ids:
+            taken = [pool.take(MyRandomIdModel, 1)[0] for _ in range(10)]
+            assert reserve_ids.call_count == 1
+            taken.extend(pool.take(MyRandomIdModel, 3))
+            assert reserve_ids.call_count == 2
+        assert len(set(taken)) == 13
+
+    def test_take_more_than_pool_size(self):
+        pool = ids.IDPool(10)
+        assert len(set(pool.take(MyRandomIdModel, 25))) == 25
+        assert pool.take(MyRandomIdModel, 0) == []
+
+    def test_save_uses_pool(self):
+        with patch('core.models.allocate_id',
+                   return_value='a' * ID_FIELD_LENGTH) as allocate_id:
+            instance = MyRandomIdModel()
+            instance.save()
+        allocate_id.assert_called_once_with(MyRandomIdModel)
+        assert instance.id == 'a' * ID_FIELD_LENGTH
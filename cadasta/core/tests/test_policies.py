@@ -0,0 +1,98 @@
+import pytest
+from django.test import TestCase
+from tutelary.models import Policy, Role
+
+from accounts.tests.factories import UserFactory
+from organization.models import OrganizationRole, ProjectRole
+from organization.tests.factories import OrganizationFactory, ProjectFactory
+from .factories import PolicyFactory
+from .. import policies
+
+
+class PolicyRegistryTest(TestCase):
+
+    def setUp(self):
+        PolicyFactory.load_policies()
+        self.registry = policies.PolicyRegistry()
+
+    def test_get(self):
+        with self.assertNumQueries(1):
+            policy = self.registry.get('org-admin')
+            assert self.registry.get('org-admin') is policy
+        assert policy == Policy.objects.get(name='org-admin')
+
+    def test_get_missing_policy(self):
+        with pytest.raises(Policy.DoesNotExist):
+            self.registry.get('missing')
+        assert self.registry.policies == {}
+
+    def test_cleared_when_policies_change(self):
+        policy = policies.registry.get('org-admin')
+        policy.save()
+        assert policies.registry.policies == {}
+
+    def test_get_policy_instance(self):
+        policy, variables = policies.get_policy_instance(
+            'org-admin', {'organization': 'org'})
+        assert policy.name == 'org-admin'
+        assert variables == {'organization': 'org'}
+
+
+class UserRolesTest(TestCase):
+
+    def setUp(self):
+        PolicyFactory.load_policies()
+        self.user = UserFactory.create()
+        self.org = OrganizationFactory.create(add_users=[self.user])
+        self.project = ProjectFactory.create(organization=self.org)
+
+    def test_find_roles(self):
+        org_admin = Policy.objects.get(name='org-admin')
+        collector = Policy.objects.get(name='data-collector')
+        superuser = Role.objects.get(name='superuser')
+        assigned = [
+            superuser,
+            (org_admin, {'organization': 'other-org'}),
+            (collector, {'organization': 'org', 'project': 'prj'}),
+        ]
+        assert policies.find_roles(assigned, 'org', 'prj') == {
+            'superuser', 'data-collector'}
+        assert policies.find_roles(assigned, 'other-org', 'prj') == {
+            'superuser', 'org-admin'}
+
+    def test_get_user_roles(self):
+        ProjectRole.objects.create(
+            project=self.project, user=self.user, role='DC')
+        assert policies.get_user_roles(self.user, self.project) == {
+            'org-member', 'data-collector'}
+
+        with self.assertNumQueries(0):
+            assert policies.get_user_roles(self.user, self.project) == {
+                'org-member', 'data-collector'}
+
+    def test_roles_cleared_when_project_role_changes(self):
+        role = ProjectRole.objects.create(
+            project=self.project, user=self.user, role='DC')
+        assert 'data-collector' in policies.get_user_roles(
+            self.user, self.project)
+
+        role.role = 'PM'
+        role.save()
+        roles = policies.get_user_roles(self.user, self.project)
+        assert 'data-collector' not in roles
+        assert 'project-manager' in roles
+
+        role.delete()
+        assert policies.get_user_roles(self.user, self.project) == {
+            'org-member'}
+
+    def test_roles_cleared_when_org_role_changes(self):
+        assert policies.get_user_roles(self.user, self.project) == {
+            'org-member'}
+
+        role = OrganizationRole.objects.get(
+            organization=self.org, user=self.user)
+        role.admin = True
+        role.save()
+        assert policies.get_user_roles(self.user, self.project) == {
+            'org-member', 'org-admin'}
@@ -0,0 +1,33 @@
+import threading
+
+from django.test import TestCase
+
+from ..workers import Heartbeat
+
+
+class HeartbeatTest(TestCase):
+    def test_beats_while_running(self):
+        beats = []
+        beaten = threading.Event()
+
+        def beat():
+            beats.append(threading.current_thread())
+            beaten.set()
+
+        with Heartbeat(beat, 0.01):
+            assert beaten.wait(5)
+        count = len(beats)
+        assert threading.current_thread() not in beats
+
+        beaten.clear()
+        assert not beaten.wait(0.05)
+        assert len(beats) == count
+
+    def test_stops_after_error(self):
+        def beat():
+            raise ValueError()
+
+        heartbeat = Heartbeat(beat, 0.01)
+        with heartbeat:
+            heartbeat._thread.join(5)
+            assert not heartbeat._thread.is_alive()
@@ -0,0 +1,96 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest.mock import patch
+from zipfile import ZIP_STORED, ZipFile
+
+from django.test import TestCase
+
+from .. import zipstream
+
+
+class ZipStreamTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_file(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def read_zip(self, chunks):
+        return ZipFile(io.BytesIO(b''.join(chunks)))
+
+    def test_zip_stream(self):
+        data = os.urandom(3 * zipstream.CHUNK_SIZE + 10)
+        path = self.make_file('data.bin', data)
+        entries = [
+            ('README.txt', 'Read me'.encode('utf-8')),
+            ('data.bin', path),
+            ('shape_files/empty.csv', b''),
+        ]
+
+        with self.read_zip(zipstream.zip_stream(entries)) as archive:
+            assert archive.testzip() is None
+            assert archive.namelist() == ['README.txt', 'data.bin',
+                                          'shape_files/empty.csv']
+            assert archive.read('README.txt') == b'Read me'
+            assert archive.read('data.bin') == data
+            assert archive.read('shape_files/empty.csv') == b''
+
+    def test_zip_stream_file_objects(self):
+        f = tempfile.SpooledTemporaryFile(max_size=10)
+        f.write(b'spooled data')
+        f.seek(0)
+        with self.read_zip(zipstream.zip_stream([('a.txt', f)])) as archive:
+            assert archive.read('a.txt') == b'spooled data'
+
+    def test_zip_stream_stored(self):
+        chunks = zipstream.zip_stream([('a.txt', b'abc')], ZIP_STORED)
+        with self.read_zip(chunks) as archive:
+            assert archive.getinfo('a.txt').compress_type == ZIP_STORED
+            assert archive.read('a.txt') == b'abc'
+
+    def test_zip_stream_empty(self):
+        with self.read_zip(zipstream.zip_stream([])) as archive:
+            assert archive.namelist() == []
+
+    def test_zip_stream_reads_entries_lazily(self):
+        read = []
+
+        def entries():
+            for name in ('a.txt', 'b.txt'):
+                read.append(name)
+                yield name, name.encode('utf-8')
+
+        chunks = zipstream.zip_stream(entries())
+        next(chunks)
+        assert read == ['a.txt']
+        list(chunks)
+        assert read == ['a.txt', 'b.txt']
+
+    def test_zip64_entries(self):
+        with patch.object(zipstream, 'ZIP64_LIMIT', 10):
+            chunks = list(zipstream.zip_stream([('big.txt', b'x' * 100),
+                                                ('small.txt', b'abc')]))
+        with self.read_zip(chunks) as archive:
+            assert archive.testzip() is None
+            assert archive.read('big.txt') == b'x' * 100
+            assert archive.read('small.txt') == b'abc'
+
+    def test_zip64_end_record(self):
+        entries = (('{}.txt'.format(i), b'') for i in range(0x10000))
+        chunks = zipstream.zip_stream(entries, ZIP_STORED)
+        with self.read_zip(chunks) as archive:
+            assert len(archive.namelist()) == 0x10000
+
+    def test_write_zip(self):
+        path = os.path.join(self.dir, 'test.zip')
+        zipstream.write_zip(path, [('a.txt', b'abc')])
+        with ZipFile(path) as archive:
+            assert archive.read('a.txt') == b'abc'
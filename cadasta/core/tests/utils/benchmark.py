@@ -0,0 +1,43 @@
+"""Helpers of the benchmarks in the ``test_benchmarks`` modules.
+
+Benchmarks are skipped unless the ``BENCHMARK`` environment variable is
+set, and use small sizes unless it is ``large``::
+
+    BENCHMARK=large py.test -s -k Benchmark
+"""
+import os
+import time
+
+import pytest
+
+benchmark = pytest.mark.skipif(not os.environ.get('BENCHMARK'),
+                               reason='Set BENCHMARK to run benchmarks')
+
+
+def get_size(default, large):
+    """Returns the ``large`` size with ``BENCHMARK=large``, and ``default``
+    otherwise."""
+    if os.environ.get('BENCHMARK') == 'large':
+        return large
+    return default
+
+
+def measure(func, repeat=1):
+    """Calls ``func`` ``repeat`` times and returns the elapsed seconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return time.perf_counter() - start
+
+
+def report(title, columns, rows):
+    """Prints a benchmark result table. Run pytest with ``-s`` to see it."""
+    widths = [
+        max([len(str(c))] + [len(str(r[i])) for r in rows])
+        for i, c in enumerate(columns)
+    ]
+    line = '  '.join('{:>%d}' % w for w in widths)
+    print('\n' + title)
+    print(line.format(*columns))
+    for row in rows:
+        print(line.format(*row))
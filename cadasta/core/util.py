@@ -1,5 +1,5 @@
 from collections import OrderedDict
-import random
+import os
 import string
 
 import django.utils.text as base_utils
@@ -19,9 +19,21 @@ def byte_to_base32_chr(byte):
     return alphabet[byte & 31]
 
 
+# Translation table mapping every byte value to its base32 character
+base32_table = bytes(ord(byte_to_base32_chr(byte)) for byte in range(256))
+
+
 def random_id():
-    rand_id = [random.randint(0, 0xFF) for i in range(ID_FIELD_LENGTH)]
-    return ''.join(map(byte_to_base32_chr, rand_id))
+    return os.urandom(ID_FIELD_LENGTH).translate(base32_table).decode()
+
+
+def random_ids(count):
+    """Returns ``count`` random IDs generated from a single read of
+    ``os.urandom``."""
+    chars = os.urandom(count * ID_FIELD_LENGTH).translate(
+        base32_table).decode()
+    return [chars[i:i + ID_FIELD_LENGTH]
+            for i in range(0, len(chars), ID_FIELD_LENGTH)]
 
 
 def slugify(text, max_length=None, allow_unicode=False):
@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger('core.workers')
+
+
+def setup_process():
+    import django
+    django.setup()
+
+
+def get_process_pool(processes):
+    """Returns a ``multiprocessing`` pool of ``processes`` processes with
+    Django set up.
+
+    The processes are started by a fork server rather than forked from the
+    calling process, as forking a process that runs threads, such as a web
+    worker running background jobs, is unsafe. Under uWSGI,
+    ``py-sys-executable`` must point at the Python interpreter of the
+    virtualenv so that the fork server can be started.
+    """
+    context = multiprocessing.get_context('forkserver')
+    return context.Pool(processes, initializer=setup_process)
+
+
+class WorkerPool():
+    """A per-process pool of threads running background jobs.
+
+    The number of threads is read from the setting named ``setting``. If
+    it is 0, jobs run right away in the calling thread instead, which is
+    what tests rely on.
+    """
+
+    def __init__(self, setting):
+        self.setting = setting
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def max_workers(self):
+        return getattr(settings, self.setting)
+
+    @property
+    def is_inline(self):
+        return not self.max_workers
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers)
+            return self._executor
+
+    def shutdown(self):
+        """Waits for the submitted jobs to complete and stops the threads.
+        New threads are started if more jobs are submitted."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def submit(self, func, *args):
+        """Runs ``func(*args)`` on the pool once the current transaction is
+        committed. Inline pools call it immediately and return its
+        result."""
+        if self.is_inline:
+            return func(*args)
+        transaction.on_commit(
+            lambda: self.get_executor().submit(self.work, func, *args))
+
+    def work(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Background job %s%r failed',
+                             func.__name__, args)
+        finally:
+            # Worker threads open their own database connection
+            connection.close()
+
+
+class Heartbeat():
+    """Calls ``func()`` every ``interval`` seconds on a thread of its own,
+    for as long as the ``with`` block it is used in runs.
+
+    Long running jobs use it to show that they are still alive while they
+    are busy in code that does not report its progress.
+    """
+
+    def __init__(self, func, interval):
+        self.func = func
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                self.func()
+        except Exception:
+            logger.exception('Heartbeat %s failed', self.func.__name__)
+        finally:
+            connection.close()
@@ -0,0 +1,209 @@
+"""Writes zip archives as a stream of byte chunks.
+
+The standard library's ``zipfile`` can write to unseekable streams, but it
+compresses each entry in one go, so the complete entry has to be held in
+memory before any of it can be sent. ``ZipStream`` compresses entries in
+small chunks and uses data descriptors, so that archives can be sent while
+they are being built and only one chunk is held in memory at a time.
+"""
+import os
+import struct
+import time
+import zlib
+from zipfile import ZIP_DEFLATED, ZIP_STORED
+
+CHUNK_SIZE = 64 * 1024
+
+# Entries larger than this are written in ZIP64 format, as zipfile does
+ZIP64_LIMIT = (1 << 31) - 1
+MAX_32 = 0xFFFFFFFF
+MAX_16 = 0xFFFF
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_RECORD = struct.Struct('<IHHHHIIH')
+END_RECORD_64 = struct.Struct('<IQHHIIQQQQ')
+END_LOCATOR_64 = struct.Struct('<IIQI')
+
+
+def dos_date_time(timestamp):
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+class ZipStream():
+    """Builds a zip archive chunk by chunk.
+
+    ``write`` and ``writestr`` return iterators over the chunks of an
+    entry, and ``close`` returns the central directory that ends the
+    archive::
+
+        stream = ZipStream()
+        for chunk in stream.write('/tmp/locations.csv', 'locations.csv'):
+            out.write(chunk)
+        out.write(stream.close())
+    """
+
+    def __init__(self, compression=ZIP_DEFLATED):
+        if compression not in (ZIP_DEFLATED, ZIP_STORED):
+            raise ValueError('Unsupported compression method')
+        self.compression = compression
+        self.offset = 0
+        self.entries = []
+
+    def write(self, path, arcname):
+        """Yields the chunks of an entry holding the file at ``path``."""
+        st = os.stat(path)
+
+        def read():
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+
+        return self.write_entry(arcname, read(), st.st_size, st.st_mtime,
+                                st.st_mode)
+
+    def writefile(self, fileobj, arcname):
+        """Yields the chunks of an entry holding the rest of the open binary
+        file ``fileobj``."""
+        start = fileobj.tell()
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell() - start
+        fileobj.seek(start)
+
+        def read():
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+        return self.write_entry(arcname, read(), size, time.time(),
+                                0o100644)
+
+    def writestr(self, arcname, data):
+        """Yields the chunks of an entry holding ``data``, which is bytes or
+        a string that is encoded as UTF-8."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return self.write_entry(arcname, [data], len(data), time.time(),
+                                0o100644)
+
+    def write_entry(self, arcname, chunks, size, mtime, mode):
+        name = arcname.encode('utf-8')
+        zip64 = size > ZIP64_LIMIT
+        version = 45 if zip64 else 20
+        flags = FLAG_DATA_DESCRIPTOR | FLAG_UTF8
+        dos_time, dos_date = dos_date_time(mtime)
+        offset = self.offset
+
+        extra = struct.pack('<HHQQ', 1, 16, 0, 0) if zip64 else b''
+        sizes = MAX_32 if zip64 else 0
+        yield self._emit(LOCAL_HEADER.pack(
+            0x04034b50, version, flags, self.compression, dos_time,
+            dos_date, 0, sizes, sizes, len(name), len(extra)) + name + extra)
+
+        compressor = None
+        if self.compression == ZIP_DEFLATED:
+            compressor = zlib.compressobj(
+                zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        crc = usize = csize = 0
+        for chunk in chunks:
+            usize += len(chunk)
+            crc = zlib.crc32(chunk, crc)
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                csize += len(chunk)
+                yield self._emit(chunk)
+        if compressor:
+            chunk = compressor.flush()
+            csize += len(chunk)
+            yield self._emit(chunk)
+
+        yield self._emit(struct.pack(
+            '<IIQQ' if zip64 else '<IIII', 0x08074b50, crc, csize, usize))
+        self.entries.append((name, version, flags, dos_time, dos_date, crc,
+                             csize, usize, offset, mode))
+
+    def close(self):
+        """Returns the central directory that ends the archive."""
+        cd_offset = self.offset
+        records = []
+        for (name, version, flags, dos_time, dos_date, crc, csize, usize,
+                offset, mode) in self.entries:
+            zip64 = []
+            if usize >= MAX_32:
+                zip64.append(usize)
+                usize = MAX_32
+            if csize >= MAX_32:
+                zip64.append(csize)
+                csize = MAX_32
+            if offset >= MAX_32:
+                zip64.append(offset)
+                offset = MAX_32
+            extra = b''
+            if zip64:
+                version = 45
+                extra = struct.pack('<HH' + 'Q' * len(zip64),
+                                    1, 8 * len(zip64), *zip64)
+            records.append(CENTRAL_HEADER.pack(
+                0x02014b50, (3 << 8) | version, version, flags,
+                self.compression, dos_time, dos_date, crc, csize, usize,
+                len(name), len(extra), 0, 0, 0, (mode & 0xFFFF) << 16,
+                offset) + name + extra)
+        cd = b''.join(records)
+
+        count = len(self.entries)
+        cd_size = len(cd)
+        end = b''
+        if count >= MAX_16 or cd_size >= MAX_32 or cd_offset >= MAX_32:
+            end = (END_RECORD_64.pack(0x06064b50, 44, 45, 45, 0, 0, count,
+                                      count, cd_size, cd_offset) +
+                   END_LOCATOR_64.pack(0x07064b50, 0, cd_offset + cd_size,
+                                       1))
+        end += END_RECORD.pack(
+            0x06054b50, 0, 0, min(count, MAX_16), min(count, MAX_16),
+            min(cd_size, MAX_32), min(cd_offset, MAX_32), 0)
+        return self._emit(cd + end)
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+
+def zip_stream(entries, compression=ZIP_DEFLATED):
+    """Yields the chunks of a zip archive holding ``entries``, an iterable of
+    ``(arcname, source)`` tuples. A source is the path of a file (a
+    string), an open binary file, or the contents of the entry (bytes).
+
+    ``entries`` is read lazily, so a generator can build each file just
+    before it is needed and remove it once the next entry is requested.
+    """
+    stream = ZipStream(compression)
+    for arcname, source in entries:
+        if isinstance(source, bytes):
+            chunks = stream.writestr(arcname, source)
+        elif hasattr(source, 'read'):
+            chunks = stream.writefile(source, arcname)
+        else:
+            chunks = stream.write(source, arcname)
+        for chunk in chunks:
+            if chunk:
+                yield chunk
+    yield stream.close()
+
+
+def write_zip(path, entries, compression=ZIP_DEFLATED):
+    """Writes a zip archive holding ``entries`` to ``path``."""
+    with open(path, 'wb') as f:
+        for chunk in zip_stream(entries, compression):
+            f.write(chunk)
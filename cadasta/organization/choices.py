@@ -10,3 +10,8 @@ ROLE_CHOICES = (('PU', _('Project User')),
 
 ACCESS_CHOICES = [("public", _("Public")),
                   ("private", _("Private"))]
+
+JOB_STATUS_CHOICES = (('pending', _('Pending')),
+                      ('running', _('Running')),
+                      ('completed', _('Completed')),
+                      ('failed', _('Failed')))
@@ -1,6 +1,103 @@
-from collections import OrderedDict
+from operator import attrgetter
+
 from core.mixins import SchemaSelectorMixin
-from django.contrib.contenttypes.models import ContentType
+from django.db.models import BinaryField, Func
+
+
+class AsWKB(Func):
+    """Selects a geometry as WKB, or NULL if the geometry is empty."""
+    function = 'ST_AsBinary'
+    template = ('CASE WHEN ST_IsEmpty(%(expressions)s) THEN NULL '
+                'ELSE %(function)s(%(expressions)s) END')
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, output_field=BinaryField(), **extra)
+
+
+class Record():
+    """Gives attribute access to a row returned by ``QuerySet.values()``,
+    so rows can be exported like model instances. Related fields are read
+    with a dot, i.e. ``record.tenure_type.label`` returns the value of
+    ``tenure_type__label``."""
+
+    def __init__(self, values):
+        self._values = values
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+
+        prefix = name + '__'
+        values = {k[len(prefix):]: v for k, v in self._values.items()
+                  if k.startswith(prefix)}
+        if not values:
+            raise AttributeError(name)
+        return Record(values)
+
+
+def get_geometry_attr(attr):
+    get = attrgetter(attr)
+
+    def get_geometry_value(item):
+        if not item.geometry:
+            return None
+        return get(item)
+    return get_geometry_value
+
+
+class RowSerializer():
+    """Compiled description of how exported items map to rows.
+
+    The column order, the attribute getters, the field selecting an
+    item's schema and the attribute columns of each schema are worked
+    out once per content type, so that each item is turned into a list
+    row without any lookups.
+    """
+
+    def __init__(self, exporter, content_type, model_attrs, schema_attrs,
+                 empty=''):
+        self.columns = list(model_attrs)
+        for attrs in schema_attrs.values():
+            for a in attrs.values():
+                if a.name not in self.columns:
+                    self.columns.append(a.name)
+        index = {name: i for i, name in enumerate(self.columns)}
+
+        self.template = ([''] * len(model_attrs) +
+                         [empty] * (len(self.columns) - len(model_attrs)))
+        self.getters = [
+            (index[attr], get_geometry_attr(attr)
+             if attr.split('.')[0] == 'geometry' else attrgetter(attr))
+            for attr in model_attrs
+        ]
+
+        selector = exporter.get_conditional_selector(content_type)
+        self.get_selector = attrgetter(selector) if selector else None
+        self.attributes = {
+            selector_value: [(index[key], key) for key in attrs.keys()]
+            for selector_value, attrs in schema_attrs.items()
+        }
+        self.default_attributes = (
+            [] if selector else self.attributes.get('DEFAULT', []))
+
+    def serialize(self, item):
+        row = self.template[:]
+        for i, get in self.getters:
+            row[i] = get(item)
+
+        if self.get_selector:
+            attributes = self.attributes.get(self.get_selector(item), ())
+        else:
+            attributes = self.default_attributes
+        values = item.attributes
+        for i, key in attributes:
+            value = values.get(key, '')
+            if type(value) == list:
+                value = ', '.join(value)
+            row[i] = value
+        return row
 
 
 class Exporter(SchemaSelectorMixin):
@@ -14,30 +111,36 @@ class Exporter(SchemaSelectorMixin):
             self._schema_attrs = self.get_attributes(self.project)
         return self._schema_attrs[label]
 
-    def get_values(self, item, model_attrs, schema_attrs):
-        values = OrderedDict()
-        for attr in model_attrs:
-
-            if attr.split('.')[0] == 'geometry' and not item.geometry:
-                values[attr] = None
-                continue
+    def get_serializer(self, content_type, model_attrs, empty=''):
+        return RowSerializer(self, content_type, model_attrs,
+                             self.get_schema_attrs(content_type), empty)
 
-            value = item
-            for a in attr.split('.'):
-                value = getattr(value, a)
-            values[attr] = value
+    def get_value_fields(self, content_type, model_attrs):
+        """Returns the fields to select with ``QuerySet.values()`` to export
+        ``model_attrs`` and the attributes of a model."""
+        opts = content_type.model_class()._meta
+        fields = ['attributes']
+        selector = self.get_conditional_selector(content_type)
+        if selector:
+            fields.append(selector)
+        for attr in model_attrs:
+            name, _, path = attr.partition('.')
+            field = opts.get_field(name)
+            if path and field.is_relation:
+                # e.g. tenure_type.label
+                name = '{}__{}'.format(name, path.replace('.', '__'))
+            if name not in fields:
+                fields.append(name)
+        return fields
 
-        content_type = ContentType.objects.get_for_model(item)
-        conditional_selector = self.get_conditional_selector(content_type)
-        if conditional_selector:
-            entity_type = getattr(item, conditional_selector)
-            attributes = schema_attrs.get(entity_type, {})
-        else:
-            attributes = schema_attrs.get('DEFAULT', {})
-        for key, attr in attributes.items():
-            attr_value = item.attributes.get(key, '')
-            if type(attr_value) == list:
-                attr_value = (', ').join(attr_value)
-            values[key] = attr_value
-
-        return values
+    def iter_records(self, queryset, content_type, model_attrs, **extra):
+        """Streams the rows of ``queryset`` needed to export ``model_attrs``
+        as records, without building model instances or filling the
+        queryset's result cache. ``extra`` annotates the rows with
+        additional expressions."""
+        fields = self.get_value_fields(content_type, model_attrs)
+        if extra:
+            queryset = queryset.annotate(**extra)
+            fields.extend(extra.keys())
+        for values in queryset.values(*fields).iterator():
+            yield Record(values)
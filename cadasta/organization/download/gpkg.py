@@ -0,0 +1,271 @@
+"""GeoPackage export of project data.
+
+A GeoPackage is an SQLite database laid out as the OGC GeoPackage
+standard (version 1.2) describes, so it is written with ``sqlite3`` and
+does not need the GPKG driver of GDAL. Geometries are stored as
+GeoPackage binary blobs: a header naming the spatial reference system,
+followed by the WKB that PostGIS selects for each location.
+"""
+import os
+import sqlite3
+import struct
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.gis.db.models import Extent
+
+from .base import AsWKB, Exporter
+
+MIME_TYPE = 'application/geopackage+sqlite3'
+
+# "GPKG", and version 1.2 of the standard
+APPLICATION_ID = 0x47504B47
+USER_VERSION = 10200
+
+# Number of features written to a table per transaction
+TRANSACTION_SIZE = 10000
+
+SRS_ID = 4326
+
+# "GP", version 0, flags for a little endian header without envelope, and
+# the SRS ID of the geometry
+GEOMETRY_HEADER = b'GP' + struct.pack('<BBi', 0, 1, SRS_ID)
+
+WGS84_DEFINITION = (
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,'
+    '298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],'
+    'PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",'
+    '0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]')
+
+# The two undefined systems are required by the standard
+SPATIAL_REF_SYS = (
+    ('WGS 84', SRS_ID, 'EPSG', SRS_ID, WGS84_DEFINITION, None),
+    ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+    ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+)
+
+METADATA_TABLES = (
+    """CREATE TABLE gpkg_spatial_ref_sys (
+        srs_name TEXT NOT NULL,
+        srs_id INTEGER NOT NULL PRIMARY KEY,
+        organization TEXT NOT NULL,
+        organization_coordsys_id INTEGER NOT NULL,
+        definition TEXT NOT NULL,
+        description TEXT
+    )""",
+    """CREATE TABLE gpkg_contents (
+        table_name TEXT NOT NULL PRIMARY KEY,
+        data_type TEXT NOT NULL,
+        identifier TEXT UNIQUE,
+        description TEXT DEFAULT '',
+        last_change DATETIME NOT NULL
+            DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+        min_x DOUBLE,
+        min_y DOUBLE,
+        max_x DOUBLE,
+        max_y DOUBLE,
+        srs_id INTEGER,
+        CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id)
+            REFERENCES gpkg_spatial_ref_sys(srs_id)
+    )""",
+    """CREATE TABLE gpkg_geometry_columns (
+        table_name TEXT NOT NULL,
+        column_name TEXT NOT NULL,
+        geometry_type_name TEXT NOT NULL,
+        srs_id INTEGER NOT NULL,
+        z TINYINT NOT NULL,
+        m TINYINT NOT NULL,
+        CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+        CONSTRAINT uk_gc_table_name UNIQUE (table_name),
+        CONSTRAINT fk_gc_tn FOREIGN KEY (table_name)
+            REFERENCES gpkg_contents(table_name),
+        CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id)
+            REFERENCES gpkg_spatial_ref_sys(srs_id)
+    )""",
+)
+
+FIELD_TYPES = {
+    'integer': 'INTEGER',
+    'decimal': 'DOUBLE',
+}
+
+# SQLite stores integers in 64 bits
+MIN_INTEGER = -2 ** 63
+MAX_INTEGER = 2 ** 63 - 1
+
+
+def quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def to_geometry(wkb):
+    if wkb is None:
+        return None
+    return GEOMETRY_HEADER + bytes(wkb)
+
+
+def to_integer(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        try:
+            value = int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            return None
+    if MIN_INTEGER <= value <= MAX_INTEGER:
+        return value
+    return None
+
+
+def to_real(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_text(value):
+    if value is None or value == '':
+        return None
+    return str(value)
+
+
+CONVERTERS = {
+    'INTEGER': to_integer,
+    'DOUBLE': to_real,
+    'TEXT': to_text,
+}
+
+
+class GeoPackageExporter(Exporter):
+    """Exports a project to a single GeoPackage.
+
+    Locations, with their geometries, are written to a features table, and
+    parties and relationships to attributes tables. Unlike the shapefile
+    export, the attributes of each record are written as typed columns of
+    its table, so no joins are needed to analyse them in a GIS.
+    """
+
+    def get_field_types(self, content_type, columns):
+        types = {}
+        for attrs in self.get_schema_attrs(content_type).values():
+            for a in attrs.values():
+                types.setdefault(
+                    a.name, FIELD_TYPES.get(a.attr_type.name, 'TEXT'))
+        return [types.get(column, 'TEXT') for column in columns]
+
+    def create_database(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        db = sqlite3.connect(path)
+        db.execute('PRAGMA application_id = {}'.format(APPLICATION_ID))
+        db.execute('PRAGMA user_version = {}'.format(USER_VERSION))
+        for sql in METADATA_TABLES:
+            db.execute(sql)
+        db.executemany(
+            'INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)',
+            SPATIAL_REF_SYS)
+        db.commit()
+        return db
+
+    def create_table(self, db, name, columns, field_types, geometry,
+                     bounds=None):
+        """Creates a features table, if ``geometry`` is set, or an
+        attributes table, and registers it in the GeoPackage contents.
+        Returns the statement inserting a row into the table."""
+        names = [quote(column.replace('.', '_')) for column in columns]
+        fields = ['fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL']
+        if geometry:
+            fields.append('geom GEOMETRY')
+        fields.extend('{} {}'.format(column_name, field_type)
+                      for column_name, field_type in zip(names, field_types))
+        if geometry:
+            names.insert(0, 'geom')
+        db.execute('CREATE TABLE {} ({})'.format(quote(name),
+                                                 ', '.join(fields)))
+
+        if geometry:
+            db.execute(
+                'INSERT INTO gpkg_contents (table_name, data_type, '
+                'identifier, min_x, min_y, max_x, max_y, srs_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (name, 'features', name) + tuple(bounds or (None,) * 4) +
+                (SRS_ID,))
+            db.execute(
+                'INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, ?, ?)',
+                (name, 'geom', 'GEOMETRY', SRS_ID, 0, 0))
+        else:
+            db.execute(
+                'INSERT INTO gpkg_contents (table_name, data_type, '
+                'identifier) VALUES (?, ?, ?)',
+                (name, 'attributes', name))
+        db.commit()
+
+        return 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(name), ', '.join(names), ', '.join(['?'] * len(names)))
+
+    def write_table(self, db, name, queryset, content_type, model_attrs,
+                    geometry=False, bounds=None):
+        """Writes the records of ``queryset`` to a new table in one pass,
+        committing every ``TRANSACTION_SIZE`` rows."""
+        serializer = self.get_serializer(content_type, model_attrs,
+                                         empty=None)
+        field_types = self.get_field_types(content_type, serializer.columns)
+        converters = [CONVERTERS[t] for t in field_types]
+        insert = self.create_table(db, name, serializer.columns,
+                                   field_types, geometry, bounds)
+
+        extra = {'geometry_wkb': AsWKB('geometry')} if geometry else {}
+        records = self.iter_records(queryset, content_type, model_attrs,
+                                    **extra)
+
+        def get_row(record):
+            row = [convert(value) for convert, value in
+                   zip(converters, serializer.serialize(record))]
+            if geometry:
+                row.insert(0, to_geometry(record.geometry_wkb))
+            return row
+
+        rows = (get_row(record) for record in records)
+        while True:
+            batch = list(islice(rows, TRANSACTION_SIZE))
+            if not batch:
+                break
+            with db:
+                db.executemany(insert, batch)
+
+    def write_locations(self, db):
+        content_type = ContentType.objects.get(app_label='spatial',
+                                               model='spatialunit')
+        queryset = self.project.spatial_units.all()
+        bounds = queryset.aggregate(extent=Extent('geometry'))['extent']
+        self.write_table(db, 'locations', queryset, content_type,
+                         ('id', 'type'), geometry=True, bounds=bounds)
+
+    def write_parties(self, db):
+        content_type = ContentType.objects.get(app_label='party',
+                                               model='party')
+        self.write_table(db, 'parties', self.project.parties.all(),
+                         content_type, ('id', 'name', 'type'))
+
+    def write_relationships(self, db):
+        content_type = ContentType.objects.get(app_label='party',
+                                               model='tenurerelationship')
+        self.write_table(db, 'relationships',
+                         self.project.tenure_relationships.all(),
+                         content_type,
+                         ('id', 'party_id', 'spatial_unit_id',
+                          'tenure_type.id', 'tenure_type.label'))
+
+    def make_download(self, f_name):
+        path = os.path.join(settings.MEDIA_ROOT,
+                            'temp/{}.gpkg'.format(f_name))
+        db = self.create_database(path)
+        try:
+            self.write_locations(db)
+            self.write_parties(db)
+            self.write_relationships(db)
+        finally:
+            db.close()
+        return path, MIME_TYPE
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import shutil
+import time
+from datetime import timedelta
+
+from core.workers import Heartbeat, WorkerPool
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils.timezone import now
+from party.models import Party, TenureRelationship
+from spatial.models import SpatialUnit
+
+from . import gpkg, shape, xls
+from .store import store
+
+EXPORTERS = {
+    'shp': (shape.ShapeExporter, '.zip', shape.MIME_TYPE),
+    'xls': (xls.XLSExporter, '.xlsx', xls.MIME_TYPE),
+    'gpkg': (gpkg.GeoPackageExporter, '.gpkg', gpkg.MIME_TYPE),
+}
+
+pool = WorkerPool('EXPORT_WORKERS')
+
+
+def get_data_version(project):
+    """Returns a stamp that changes whenever the exported data of
+    ``project`` may have changed.
+
+    It combines the project's own last update and questionnaire (which
+    decides the attribute columns) with the high-water mark of the
+    history of its locations, parties and relationships. History records
+    are written for every create, update and delete, including bulk
+    imports.
+    """
+    parts = [project.last_updated.isoformat(),
+             project.current_questionnaire or '']
+    for model in (SpatialUnit, Party, TenureRelationship):
+        parts.append(str(model.history.filter(
+            project_id=project.id).aggregate(v=Max('history_id'))['v']))
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def get_artifact(job):
+    """Returns the path of the job's export in the export cache, or
+    ``None`` if it has not been built or was evicted."""
+    key = store.get_key(job.project, job.type, job.version)
+    return store.get(key, EXPORTERS[job.type][1])
+
+
+def get_extension(job):
+    return EXPORTERS[job.type][1]
+
+
+def get_mime_type(job):
+    return EXPORTERS[job.type][2]
+
+
+def find_export(project, type, version):
+    """Returns the job of a cached export, or of an export that is being
+    built in the background, for ``version`` of the project data. Stale
+    jobs, whose worker has gone away, are ignored."""
+    from ..models import ExportJob
+    updated_since = now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+    job = ExportJob.objects.filter(
+        Q(status='completed') |
+        Q(status__in=('pending', 'running'), streamed=False,
+          last_updated__gt=updated_since),
+        project=project, type=type, version=version).first()
+    if job is not None and (job.status != 'completed' or get_artifact(job)):
+        return job
+
+
+def request_export(project, user, type):
+    """Returns an export job for the current version of the project data.
+
+    If an export of this version is already cached or being built, its job
+    is returned. Otherwise, a new job is queued."""
+    from ..models import ExportJob
+    version = get_data_version(project)
+    job = find_export(project, type, version)
+    if job is not None:
+        return job
+
+    job = ExportJob.objects.create(
+        project=project, user=user, type=type, version=version)
+    pool.submit(work, job.id)
+    job.refresh_from_db()
+    return job
+
+
+def can_stream(type):
+    return hasattr(EXPORTERS[type][0], 'stream')
+
+
+def count_records(project):
+    """Returns the number of locations, parties and relationships of the
+    project."""
+    return sum(model.objects.filter(project=project).count()
+               for model in (SpatialUnit, Party, TenureRelationship))
+
+
+def stream_export(project, user, type):
+    """Returns ``(job, chunks)`` for the current version of the project
+    data.
+
+    If an export of this version is already cached or being built,
+    ``chunks`` is ``None``. Projects with more than
+    ``EXPORT_STREAM_MAX_RECORDS`` records would take longer to export than
+    a request may run, so their export is queued like other exports, and
+    ``chunks`` is ``None`` as well. Otherwise a new job is created, and
+    ``chunks`` iterates over the export while it is being built; the
+    export is stored in the cache once all chunks have been read."""
+    from ..models import ExportJob
+    version = get_data_version(project)
+    job = find_export(project, type, version)
+    if job is not None:
+        return job, None
+
+    if count_records(project) > settings.EXPORT_STREAM_MAX_RECORDS:
+        return request_export(project, user, type), None
+
+    job = ExportJob.objects.create(
+        project=project, user=user, type=type, version=version,
+        streamed=True)
+    return job, stream(job)
+
+
+def stream(job):
+    job.status = 'running'
+    job.save(update_fields=['status', 'last_updated'])
+
+    exporter_class, ext, _ = EXPORTERS[job.type]
+    file_name = get_file_name(job)
+    path = os.path.join(settings.MEDIA_ROOT, 'temp', file_name + ext)
+    chunks = exporter_class(job.project).stream(file_name)
+    completed = False
+    beat = time.monotonic()
+    try:
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+                if time.monotonic() - beat > settings.EXPORT_JOB_HEARTBEAT:
+                    touch(job)
+                    beat = time.monotonic()
+        store.put(store.get_key(job.project, job.type, job.version),
+                  ext, path)
+        completed = True
+    except Exception as e:
+        fail(job, str(e))
+        raise
+    finally:
+        if not completed:
+            chunks.close()
+            if os.path.exists(path):
+                os.remove(path)
+            if job.status == 'running':
+                # The client went away before the export was sent
+                fail(job, 'The download was interrupted.')
+
+    job.status = 'completed'
+    job.save(update_fields=['status', 'last_updated'])
+
+
+def work(job_id):
+    from ..models import ExportJob
+    run(ExportJob.objects.get(id=job_id))
+
+
+def run(job):
+    job.status = 'running'
+    job.save(update_fields=['status', 'last_updated'])
+
+    exporter_class, ext, _ = EXPORTERS[job.type]
+    file_name = get_file_name(job)
+    # The shapefile exporter builds its files in a directory next to the
+    # archive
+    build_dir = os.path.join(settings.MEDIA_ROOT, 'temp', file_name)
+    try:
+        with Heartbeat(lambda: touch(job), settings.EXPORT_JOB_HEARTBEAT):
+            path, _ = exporter_class(job.project).make_download(file_name)
+        store.put(store.get_key(job.project, job.type, job.version),
+                  ext, path)
+    except Exception as e:
+        fail(job, str(e))
+        raise
+    finally:
+        if os.path.isdir(build_dir):
+            shutil.rmtree(build_dir)
+
+    job.status = 'completed'
+    job.save(update_fields=['status', 'last_updated'])
+
+
+def get_file_name(job):
+    return '{}-{}-{}-{}'.format(job.project.id, job.user.id,
+                                round(time.time() * 1000), job.type)
+
+
+def touch(job):
+    """Records that the job is still running."""
+    from ..models import ExportJob
+    ExportJob.objects.filter(id=job.id).update(last_updated=now())
+
+
+def fail(job, error):
+    job.status = 'failed'
+    job.error = error
+    job.save(update_fields=['status', 'error', 'last_updated'])
@@ -1,15 +1,16 @@
 import csv
+import itertools
 import os
-from collections import OrderedDict
-from zipfile import ZipFile
+import shutil
 
+from core.zipstream import zip_stream
 from osgeo import ogr, osr
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.template.loader import render_to_string
 
-from .base import Exporter
+from .base import AsWKB, Exporter
 
 MIME_TYPE = 'application/zip'
 
@@ -17,68 +18,76 @@ MIME_TYPE = 'application/zip'
 class ShapeExporter(Exporter):
 
     def write_items(self, filename, queryset, content_type, model_attrs):
-        schema_attrs = self.get_schema_attrs(content_type)
-
-        # build column labels
-        attr_columns = OrderedDict()
-        for a in model_attrs:
-            attr_columns[a] = ''
-        for _, attrs in schema_attrs.items():
-            for a in attrs.values():
-                if a.name not in attr_columns.keys():
-                    attr_columns[a.name] = None
-
+        for item in self.write_rows(filename, queryset, content_type,
+                                    model_attrs):
+            pass
+
+    def write_rows(self, filename, queryset, content_type, model_attrs):
+        """Writes the items in ``queryset`` to a CSV file, yielding each item
+        after its row is written."""
+        serializer = self.get_serializer(content_type, model_attrs,
+                                         empty=None)
         with open(filename, 'w+', newline='') as csvfile:
             csvwriter = csv.writer(csvfile)
-            csvwriter.writerow(attr_columns.keys())
+            csvwriter.writerow(serializer.columns)
 
             for item in queryset:
-                values = self.get_values(item, model_attrs, schema_attrs)
-                data = attr_columns.copy()
-                data.update(values)
-                csvwriter.writerow(data.values())
+                csvwriter.writerow(serializer.serialize(item))
+                yield item
 
-    def write_relationships(self, filename):
-        relationships = self.project.tenure_relationships.all()
-        if relationships.count() == 0:
+    def write_csv(self, filename, queryset, content_type, model_attrs):
+        records = self.iter_records(queryset, content_type, model_attrs)
+        first = next(records, None)
+        if first is None:
             return
+        self.write_items(filename, itertools.chain([first], records),
+                         content_type, model_attrs)
 
+    def write_relationships(self, filename):
         content_type = ContentType.objects.get(app_label='party',
                                                model='tenurerelationship')
-        self.write_items(filename, relationships, content_type,
-                         ('id', 'party_id', 'spatial_unit_id',
-                          'tenure_type.id', 'tenure_type.label'))
+        self.write_csv(filename, self.project.tenure_relationships.all(),
+                       content_type,
+                       ('id', 'party_id', 'spatial_unit_id',
+                        'tenure_type.id', 'tenure_type.label'))
 
     def write_parties(self, filename):
-        parties = self.project.parties.all()
-        if parties.count() == 0:
-            return
-
         content_type = ContentType.objects.get(app_label='party',
                                                model='party')
-        self.write_items(filename, parties, content_type,
-                         ('id', 'name', 'type'))
+        self.write_csv(filename, self.project.parties.all(), content_type,
+                       ('id', 'name', 'type'))
 
     def write_features(self, ds, filename):
-        spatial_units = self.project.spatial_units.all()
-        if spatial_units.count() == 0:
-            return
-
+        """Writes the project's locations to ``filename`` and their
+        geometries to one layer per geometry type, in a single pass over
+        the locations."""
         content_type = ContentType.objects.get(app_label='spatial',
                                                model='spatialunit')
         model_attrs = ('id', 'type')
 
-        self.write_items(
-            filename, spatial_units, content_type, model_attrs)
-
+        records = self.iter_records(
+            self.project.spatial_units.all(), content_type, model_attrs,
+            geometry_wkb=AsWKB('geometry'))
+        first = next(records, None)
+        if first is None:
+            return
+        return self.write_locations(ds, filename,
+                                    itertools.chain([first], records),
+                                    content_type, model_attrs)
+
+    def write_locations(self, ds, filename, records, content_type,
+                        model_attrs):
+        """Writes location records, which have their geometry as WKB in
+        ``geometry_wkb``, to ``filename`` and the layers of ``ds``."""
         layers = {}
 
-        for su in spatial_units:
+        for su in self.write_rows(filename, records, content_type,
+                                  model_attrs):
             # Excluding empty geometries from export
-            if not su.geometry:
+            if su.geometry_wkb is None:
                 continue
 
-            geom = ogr.CreateGeometryFromWkt(su.geometry.wkt)
+            geom = ogr.CreateGeometryFromWkb(bytes(su.geometry_wkb))
             layer_type = geom.GetGeometryName().lower()
             layer = layers.get(layer_type, None)
             if layer is None:
@@ -118,25 +127,44 @@ class ShapeExporter(Exporter):
             layer.CreateField(field)
             return layer
 
-    def make_download(self, f_name):
-        dst_dir = os.path.join(settings.MEDIA_ROOT, 'temp/{}'.format(f_name))
-
-        ds = self.create_datasource(dst_dir)
-
-        self.write_features(ds, os.path.join(dst_dir, 'locations.csv'))
-        self.write_relationships(os.path.join(dst_dir, 'relationships.csv'))
-        self.write_parties(os.path.join(dst_dir, 'parties.csv'))
-
-        ds.Destroy()
-
-        path = os.path.join(settings.MEDIA_ROOT, 'temp/{}.zip'.format(f_name))
+    def iter_files(self, dst_dir):
+        """Builds the files of the export in ``dst_dir`` and yields them as
+        ``(arcname, path or contents)`` entries for a zip archive. Each
+        file is removed once the next entry is requested, so at most one
+        pass over the data is held on disk."""
         readme = render_to_string(
             'organization/download/shp_readme.txt',
             {'project_name': self.project.name}
         )
-        with ZipFile(path, 'a') as myzip:
-            myzip.writestr('README.txt', readme)
-            for f in os.listdir(dst_dir):
-                myzip.write(os.path.join(dst_dir, f), arcname=f)
+        yield 'README.txt', readme.encode('utf-8')
+
+        try:
+            ds = self.create_datasource(dst_dir)
+            self.write_features(ds, os.path.join(dst_dir, 'locations.csv'))
+            ds.Destroy()
+            yield from self.consume_files(dst_dir)
+
+            self.write_relationships(
+                os.path.join(dst_dir, 'relationships.csv'))
+            self.write_parties(os.path.join(dst_dir, 'parties.csv'))
+            yield from self.consume_files(dst_dir)
+        finally:
+            shutil.rmtree(dst_dir, ignore_errors=True)
+
+    def consume_files(self, dst_dir):
+        for f in sorted(os.listdir(dst_dir)):
+            path = os.path.join(dst_dir, f)
+            yield f, path
+            os.remove(path)
+
+    def stream(self, f_name):
+        """Returns an iterator over the chunks of the zipped export."""
+        dst_dir = os.path.join(settings.MEDIA_ROOT, 'temp/{}'.format(f_name))
+        return zip_stream(self.iter_files(dst_dir))
 
+    def make_download(self, f_name):
+        path = os.path.join(settings.MEDIA_ROOT, 'temp/{}.zip'.format(f_name))
+        with open(path, 'wb') as f:
+            for chunk in self.stream(f_name):
+                f.write(chunk)
         return path, MIME_TYPE
@@ -0,0 +1,91 @@
+import os
+import threading
+
+from django.conf import settings
+
+
+class ArtifactStore():
+    """A size-bounded directory of built exports.
+
+    Artifacts are stored as ``<key><ext>``. Keys start with
+    ``<project id>-<export type>-``, followed by the version of the
+    project data. Serving an artifact updates its modification time; when
+    the store grows beyond ``max_size`` bytes, the least recently used
+    artifacts are removed.
+    """
+
+    def __init__(self, location=None, max_size=None):
+        self._location = location
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    @property
+    def location(self):
+        return self._location or os.path.join(settings.MEDIA_ROOT, 'exports')
+
+    @property
+    def max_size(self):
+        if self._max_size is None:
+            return settings.EXPORT_CACHE_MAX_SIZE
+        return self._max_size
+
+    def get_key(self, project, type, version):
+        return '{}-{}-{}'.format(project.id, type, version)
+
+    def path(self, key, ext):
+        return os.path.join(self.location, key + ext)
+
+    def get(self, key, ext):
+        """Returns the path of the artifact stored under ``key``, or
+        ``None`` if it is not in the store."""
+        path = self.path(key, ext)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, ext, src):
+        """Moves the file at ``src`` into the store, replacing older versions
+        of the same export, and returns its new path."""
+        os.makedirs(self.location, exist_ok=True)
+        path = self.path(key, ext)
+        os.replace(src, path)
+
+        prefix = key.rsplit('-', 1)[0] + '-'
+        with self._lock:
+            for entry in os.scandir(self.location):
+                if (entry.name.startswith(prefix) and
+                        entry.name != key + ext):
+                    self._remove(entry.path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep=None):
+        """Removes the least recently used artifacts until the store fits
+        in ``max_size``. ``keep`` is never removed."""
+        with self._lock:
+            try:
+                entries = [(e.stat().st_mtime, e.stat().st_size, e.path)
+                           for e in os.scandir(self.location)
+                           if e.is_file()]
+            except FileNotFoundError:
+                return
+            size = sum(entry[1] for entry in entries)
+            for mtime, file_size, path in sorted(entries):
+                if size <= self.max_size:
+                    break
+                if path == keep:
+                    continue
+                if self._remove(path):
+                    size -= file_size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+
+store = ArtifactStore()
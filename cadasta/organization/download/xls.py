@@ -1,5 +1,5 @@
+import itertools
 import os
-from collections import OrderedDict
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
@@ -13,53 +13,38 @@ MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 class XLSExporter(Exporter):
 
     def write_items(self, worksheet, queryset, content_type, model_attrs):
-        schema_attrs = self.get_schema_attrs(content_type)
-
-        # build column labels
-        attr_columns = OrderedDict()
-        for a in model_attrs:
-            attr_columns[a] = ''
-        for _, attrs in schema_attrs.items():
-            for a in attrs.values():
-                if a.name not in attr_columns.keys():
-                    attr_columns[a.name] = ''
-        worksheet.append(list(attr_columns.keys()))
-
-        # write data
-        for i, item in enumerate(queryset):
-            values = self.get_values(item, model_attrs, schema_attrs)
-            data = attr_columns.copy()
-            data.update(values)
-            worksheet.append(list(data.values()))
+        serializer = self.get_serializer(content_type, model_attrs)
+        worksheet.append(serializer.columns)
+        for item in queryset:
+            worksheet.append(serializer.serialize(item))
+
+    def write_sheet(self, title, queryset, content_type, model_attrs):
+        records = self.iter_records(queryset, content_type, model_attrs)
+        first = next(records, None)
+        if first is None:
+            return
+        worksheet = self.workbook.create_sheet(title=title)
+        self.write_items(worksheet, itertools.chain([first], records),
+                         content_type, model_attrs)
 
     def write_locations(self):
-        locations = self.project.spatial_units.all()
-        if locations.count() == 0:
-            return
-        worksheet = self.workbook.create_sheet(title='locations')
         content_type = ContentType.objects.get(app_label='spatial',
                                                model='spatialunit')
-        self.write_items(worksheet, locations, content_type,
-                         ['id', 'geometry.ewkt', 'type'])
+        self.write_sheet('locations', self.project.spatial_units.all(),
+                         content_type, ['id', 'geometry.ewkt', 'type'])
 
     def write_parties(self):
-        parties = self.project.parties.all()
-        if parties.count() == 0:
-            return
-        worksheet = self.workbook.create_sheet(title='parties')
         content_type = ContentType.objects.get(app_label='party',
                                                model='party')
-        self.write_items(worksheet, parties, content_type,
-                         ['id', 'name', 'type'])
+        self.write_sheet('parties', self.project.parties.all(),
+                         content_type, ['id', 'name', 'type'])
 
     def write_relationships(self):
-        relationships = self.project.tenure_relationships.all()
-        if relationships.count() == 0:
-            return
-        worksheet = self.workbook.create_sheet(title='relationships')
         content_type = ContentType.objects.get(app_label='party',
                                                model='tenurerelationship')
-        self.write_items(worksheet, relationships, content_type,
+        self.write_sheet('relationships',
+                         self.project.tenure_relationships.all(),
+                         content_type,
                          ['party_id', 'spatial_unit_id', 'tenure_type.id',
                           'tenure_type.label'])
 
@@ -4,10 +4,11 @@ from core.mixins import SchemaSelectorMixin
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import transaction
-from party.models import Party, TenureRelationship, TenureRelationshipType
+from party.models import Party, TenureRelationship
 from spatial.models import SpatialUnit
 
-from . import exceptions, validators
+from . import bulk, exceptions, validators
+from .plan import RowPlan
 
 ATTRIBUTE_GROUPS = settings.ATTRIBUTE_GROUPS
 
@@ -48,6 +49,7 @@ class Importer(SchemaSelectorMixin):
         self._schema_attrs = {}
         self._parties_created = {}
         self._locations_created = {}
+        self.batch_size = settings.IMPORT_BATCH_SIZE
 
     def get_headers(self):
         raise NotImplementedError(
@@ -154,144 +156,131 @@ class Importer(SchemaSelectorMixin):
         return (attribute_map,
                 sorted(extra_attrs), sorted(extra_headers))
 
-    def _import(self, config, csvfile):
-        attributes = config.get('attributes', None)
+    def validate_data(self, config):
+        raise NotImplementedError(
+            "Your %s class has not defined a validate_data() method."
+            % self.__class__.__name__
+        )
+
+    def count_rows(self, config):
+        raise NotImplementedError(
+            "Your %s class has not defined a count_rows() method."
+            % self.__class__.__name__
+        )
+
+    def _import(self, config, csvfile, job=None):
+        reader = csv.reader(
+            csvfile, delimiter=self.delimiter, quotechar=self.quotechar
+        )
+        headers = [h.lower() for h in next(reader)]
+        self._import_rows(
+            config, headers, ((reader.line_num, row) for row in reader),
+            job=job)
+
+    def _validate(self, config, csvfile):
+        reader = csv.reader(
+            csvfile, delimiter=self.delimiter, quotechar=self.quotechar
+        )
+        headers = [h.lower() for h in next(reader)]
+        return validators.validate_rows(
+            headers, ((reader.line_num, row) for row in reader), config)
+
+    def _import_rows(self, config, headers, rows, job=None):
+        """Imports ``rows``, an iterable of ``(line_num, row)`` tuples where
+        each row is a list of strings matching ``headers``.
+
+        Without a ``job`` the import runs in a single transaction. With a
+        ``job``, rows are committed in chunks of ``batch_size`` instances
+        and a checkpoint is saved on the job with each chunk; rows up to
+        the job's last checkpoint are skipped."""
         entity_types = config.get('entity_types', None)
         type = config.get('type', None)
         (attr_map,
             extra_attrs, extra_headers) = self.get_attribute_map(
                 type, entity_types)
+
+        resume_from = 0
+        history_user = bulk.get_history_user()
+        if job is not None:
+            resume_from = job.line_num
+            history_user = job.user
+            self._parties_created = dict(job.parties_created)
+            self._locations_created = dict(job.locations_created)
+
+        self._creator = bulk.BulkCreator(
+            (SpatialUnit, Party, TenureRelationship),
+            batch_size=self.batch_size,
+            history_user=history_user,
+            auto_flush=job is None
+        )
+        rows = iter(rows)
+        line_num = 1
         try:
-            with transaction.atomic():
-                reader = csv.reader(
-                    csvfile, delimiter=self.delimiter,
-                    quotechar=self.quotechar
-                )
-                headers = [h.lower() for h in next(reader)]
-
-                for row in reader:
-                    content_types = dict(
-                        (key, None) for key in self.get_content_type_keys()
-                    )
-                    (party_name, party_type, geometry, location_type,
-                        tenure_type) = validators.validate_row(
-                            headers, row, config
-                    )
-                    if 'PT' in entity_types and party_type:
-                        content_types['party.party'] = {
-                            'project': self.project,
-                            'name': party_name,
-                            'type': party_type,
-                            'attributes': {}
-                        }
-                    if 'SU' in entity_types and location_type:
-                        content_types['spatial.spatialunit'] = {
-                            'project': self.project,
-                            'type': location_type,
-                            'geometry': geometry,
-                            'attributes': {}
-                        }
-                    if location_type and party_type and tenure_type:
-                        content_types['party.tenurerelationship'] = {
-                            'project': self.project,
-                            'attributes': {}
-                        }
-                    content_types = self._map_attrs_to_content_types(
-                        headers, row, content_types, attributes, attr_map)
-                    self._create_models(
-                        type, headers, row, content_types, tenure_type
-                    )
+            plan = RowPlan(self, headers, config, attr_map)
+
+            more = True
+            while more:
+                more = False
+                num_rows = 0
+                with transaction.atomic():
+                    for line_num, row in rows:
+                        if line_num <= resume_from:
+                            continue
+                        content_types, tenure_type = plan.get_content_types(
+                            row)
+                        self._create_models(
+                            plan, row, content_types, tenure_type
+                        )
+                        num_rows += 1
+                        if (job is not None and
+                                self._creator.num_pending >= self.batch_size):
+                            more = True
+                            break
+                    self._creator.flush()
+                    if job is not None and num_rows:
+                        if not job.save_checkpoint(
+                                line_num, num_rows, self._parties_created,
+                                self._locations_created):
+                            # Roll back the chunk, the job has a new run
+                            raise exceptions.JobClaimedError()
         except ValidationError as e:
             raise exceptions.DataImportError(
-                e.messages[0], line_num=reader.line_num)
+                e.messages[0], line_num=line_num)
 
-    def _create_models(self, type, headers, row, content_types, tenure_type):
+    def _create_models(self, plan, row, content_types, tenure_type):
+        """Builds the model instances for a row and hands them to the bulk
+        creator. Rows referring to a party or location that was already
+        imported are linked to it using the IDs assigned by the creator."""
 
         party_ct = content_types['party.party']
         spatial_ct = content_types['spatial.spatialunit']
-
-        s_id = (
-            'tenurerelationship::spatial_unit_id'
-            if type == 'xls' else 'spatial_unit_id')
-        p_id = (
-            'tenurerelationship::party_id'
-            if type == 'xls' else 'party_id'
-        )
+        tenure_ct = content_types['party.tenurerelationship']
 
         if spatial_ct:
-            try:
-                spatial_unit_id = row[headers.index(s_id)]
-            except ValueError:
-                su = SpatialUnit.objects.create(**spatial_ct)
+            if plan.spatial_unit_id_index is None:
+                su_id = self._creator.add(SpatialUnit(**spatial_ct)).pk
             else:
-                if spatial_unit_id:
-                    created_su_id = self._locations_created.get(
-                        spatial_unit_id, None
-                    )
-                    if created_su_id:
-                        su = SpatialUnit.objects.get(id=created_su_id)
-                    else:
-                        su = SpatialUnit.objects.create(**spatial_ct)
-                        self._locations_created[spatial_unit_id] = su.pk
-                else:
-                    su = SpatialUnit.objects.create(**spatial_ct)
-                    self._locations_created[spatial_unit_id] = su.pk
+                spatial_unit_id = row[plan.spatial_unit_id_index]
+                su_id = self._locations_created.get(spatial_unit_id, None)
+                if not (spatial_unit_id and su_id):
+                    su_id = self._creator.add(SpatialUnit(**spatial_ct)).pk
+                    self._locations_created[spatial_unit_id] = su_id
 
         if party_ct:
-            try:
-                party_id = row[headers.index(p_id)]
-            except ValueError:
-                party = Party.objects.create(**party_ct)
+            if plan.party_id_index is None:
+                pty_id = self._creator.add(Party(**party_ct)).pk
             else:
-                if party_id:
-                    created_party_id = self._parties_created.get(
-                        party_id, None)
-                    if created_party_id:
-                        party = Party.objects.get(id=created_party_id)
-                    else:
-                        party = Party.objects.create(**party_ct)
-                        self._parties_created[party_id] = party.pk
-                else:
-                    party = Party.objects.create(**party_ct)
-                    self._parties_created[party_id] = party.pk
-
-        if party_ct and spatial_ct:
-            tt = TenureRelationshipType.objects.get(id=tenure_type)
-            content_types['party.tenurerelationship']['party'] = party
-            content_types['party.tenurerelationship']['spatial_unit'] = su
-            content_types['party.tenurerelationship']['tenure_type'] = tt
-            TenureRelationship.objects.create(
-                **content_types['party.tenurerelationship']
-            )
-
-    def _map_attrs_to_content_types(self, headers, row, content_types,
-                                    attributes, attr_map):
-        for model, selectors in attr_map.items():
-            for selector, attrs in selectors.items():
-                content_type = content_types.get(model, None)
-                if not content_type:
-                    continue
-                if selector in ['DEFAULT', content_type.get('type', '')]:
-                    for attr in attrs:
-                        attribute = attrs[attr][0]
-                        attr_label = '{0}::{1}'.format(
-                            model.split('.')[1], attr)
-                        if attr_label not in attributes:
-                            continue
-                        try:
-                            val = row[headers.index(attribute.name.lower())]
-                        except:
-                            val = row[headers.index(attr_label)]
-                        if not attribute.required and val == '':
-                            continue
-                        if attribute.attr_type.name == 'select_multiple':
-                            val = [v.strip() for v in val.split(',')]
-                        if attribute.attr_type.name in ['integer', 'decimal']:
-                            val = self._cast_to_type(
-                                val, attribute.attr_type.name)
-                        if content_type:
-                            content_type['attributes'][attribute.name] = val
-        return content_types
+                party_id = row[plan.party_id_index]
+                pty_id = self._parties_created.get(party_id, None)
+                if not (party_id and pty_id):
+                    pty_id = self._creator.add(Party(**party_ct)).pk
+                    self._parties_created[party_id] = pty_id
+
+        if party_ct and spatial_ct and tenure_ct:
+            tenure_ct['party_id'] = pty_id
+            tenure_ct['spatial_unit_id'] = su_id
+            tenure_ct['tenure_type_id'] = tenure_type
+            self._creator.add(TenureRelationship(**tenure_ct))
 
     def _cast_to_type(self, val, type):
         if type == 'integer':
@@ -0,0 +1,94 @@
+from collections import OrderedDict
+
+from core.ids import allocate_ids
+from django.db import router
+from django.db.models.signals import pre_save
+from django.utils.timezone import now
+from search.indexer import record_changes
+from simple_history.models import HistoricalRecords
+
+
+def get_history_user():
+    """Returns the user simple_history would record for the current request,
+    mirroring ``HistoricalRecords.get_history_user``."""
+    try:
+        user = HistoricalRecords.thread.request.user
+    except AttributeError:
+        return None
+    return user if user.is_authenticated() else None
+
+
+class BulkCreator():
+    """Buffers model instances and writes them with ``bulk_create``.
+
+    Instances are given their primary key as soon as they are added, so
+    callers can reference them (e.g. as foreign keys) before they are
+    written. Models are flushed in the order they are passed in, which
+    must respect foreign key dependencies. Historical records are written
+    in bulk alongside each model, and their changes are recorded for the
+    search indexes.
+
+    Pending instances are flushed once ``batch_size`` of them have been
+    added, unless ``auto_flush`` is disabled, in which case the caller is
+    responsible for calling ``flush``.
+    """
+
+    def __init__(self, models, batch_size, history_user=None,
+                 auto_flush=True):
+        self.batch_size = batch_size
+        self.auto_flush = auto_flush
+        self.history_user = history_user
+        self.pending = OrderedDict((model, []) for model in models)
+        self.num_pending = 0
+        self.created = dict((model, 0) for model in models)
+        self._ids = dict((model, []) for model in models)
+
+    def add(self, instance):
+        model = type(instance)
+        if not instance.pk:
+            instance.pk = self.allocate_id(model)
+
+        # bulk_create does not send signals, so run the pre_save receivers
+        # (attribute validation, geometry clean-up) when buffering
+        pre_save.send(sender=model, instance=instance, raw=False,
+                      using=router.db_for_write(model), update_fields=None)
+
+        self.pending[model].append(instance)
+        self.num_pending += 1
+        if self.auto_flush and self.num_pending >= self.batch_size:
+            self.flush()
+        return instance
+
+    def allocate_id(self, model):
+        if not self._ids[model]:
+            self._ids[model] = allocate_ids(model, self.batch_size)
+        return self._ids[model].pop()
+
+    def flush(self):
+        history_date = now()
+        for model, instances in self.pending.items():
+            if not instances:
+                continue
+            model.objects.bulk_create(instances, batch_size=self.batch_size)
+            self.create_historical_records(model, instances, history_date)
+            # Nor post_save, so record the changes to the search indexes
+            record_changes(instances)
+            self.created[model] += len(instances)
+            self.pending[model] = []
+        self.num_pending = 0
+
+    def create_historical_records(self, model, instances, history_date):
+        history = getattr(model, 'history', None)
+        if history is None:
+            return
+        historical_model = history.model
+        fields = model._meta.fields
+        historical_model.objects.bulk_create([
+            historical_model(
+                history_date=history_date,
+                history_type='+',
+                history_user=self.history_user,
+                **dict((f.attname, getattr(instance, f.attname))
+                       for f in fields)
+            ) for instance in instances
+        ], batch_size=self.batch_size)
@@ -24,6 +24,17 @@ class CSVImporter(base.Importer):
         ]
         return headers
 
-    def import_data(self, config_dict, **kwargs):
+    def count_rows(self, config):
         with open(self.path, 'r', newline='') as csvfile:
-            self._import(config_dict, csvfile)
+            reader = csv.reader(
+                csvfile, delimiter=self.delimiter, quotechar=self.quotechar
+            )
+            return max(sum(1 for row in reader) - 1, 0)
+
+    def validate_data(self, config):
+        with open(self.path, 'r', newline='') as csvfile:
+            return self._validate(config, csvfile)
+
+    def import_data(self, config_dict, job=None, **kwargs):
+        with open(self.path, 'r', newline='') as csvfile:
+            self._import(config_dict, csvfile, job=job)
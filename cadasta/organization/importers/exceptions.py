@@ -13,3 +13,8 @@ class DataImportError(Exception):
             )
         else:
             return _("Error importing file: %s" % self.args[0])
+
+
+class JobClaimedError(Exception):
+    """Raised when an import job was resumed by another run while this run
+    was importing it."""
@@ -0,0 +1,95 @@
+import importlib
+import os
+
+from core.workers import WorkerPool
+from django.conf import settings
+from django.utils.timezone import now
+
+from .exceptions import DataImportError, JobClaimedError
+
+pool = WorkerPool('IMPORT_WORKERS')
+
+
+def get_importer(type, project, path):
+    fqn = settings.IMPORTERS.get(type)
+    parts = fqn.rpartition('.')
+    module = importlib.import_module(parts[0])
+    clazz = parts[-1]
+    importer = getattr(module, clazz)
+    return importer(project=project, path=path)
+
+
+def submit(job):
+    """Queues ``job`` on the process' worker pool once the current
+    transaction is committed.
+
+    If ``IMPORT_WORKERS`` is 0, the job runs right away in the calling
+    thread, and import errors are raised to the caller."""
+    if pool.is_inline:
+        run(job)
+    else:
+        pool.submit(work, job.id)
+
+
+def resume(job):
+    """Runs ``job`` again from its last checkpoint. Returns ``False`` if
+    the job was claimed by another request first.
+
+    The job is claimed atomically, so a job is not resumed twice, and the
+    run of a stale job stops at its next checkpoint if its worker is still
+    alive."""
+    if not job.claim():
+        return False
+    submit(job)
+    return True
+
+
+def work(job_id):
+    from ..models import ImportJob
+    try:
+        run(ImportJob.objects.get(id=job_id))
+    except (DataImportError, JobClaimedError):
+        # The error has been recorded on the job, or the job has a new run
+        pass
+
+
+def run(job):
+    job.status = 'running'
+    job.started = now()
+    job.started_rows = job.rows_imported
+    job.error = ''
+    job.error_line = None
+    job.save()
+
+    config = dict(job.config, project=job.project)
+    importer = get_importer(config['type'], job.project, config['file'])
+    try:
+        if job.validate_only:
+            job.validation_errors = importer.validate_data(config)
+            job.save(update_fields=['validation_errors', 'last_updated'])
+        else:
+            if job.total_rows is None:
+                job.total_rows = importer.count_rows(config)
+                job.save(update_fields=['total_rows', 'last_updated'])
+            importer.import_data(config, job=job)
+    except JobClaimedError:
+        raise
+    except DataImportError as e:
+        fail(job, str(e), e.line_num)
+        raise
+    except Exception as e:
+        fail(job, str(e))
+        raise
+
+    job.status = 'completed'
+    job.save(update_fields=['status', 'last_updated'])
+    if os.path.exists(config['file']):
+        os.remove(config['file'])
+
+
+def fail(job, error, line_num=None):
+    job.status = 'failed'
+    job.error = error
+    job.error_line = line_num
+    job.save(update_fields=['status', 'error', 'error_line',
+                            'last_updated'])
@@ -0,0 +1,122 @@
+from django.core.exceptions import ValidationError
+from django.utils.translation import ugettext as _
+
+from . import validators
+
+
+def split_select_multiple(val):
+    return [v.strip() for v in val.split(',')]
+
+
+class RowPlan():
+    """Compiled description of how rows of an import file map to models.
+
+    Everything that only depends on the file headers and the import
+    config -- column positions, attribute converters and the content type
+    skeleton -- is computed once, so that each row is turned into model
+    payloads by plain list indexing.
+    """
+
+    def __init__(self, importer, headers, config, attr_map):
+        self.project = importer.project
+        self.entity_types = config.get('entity_types', None)
+        self.validator = validators.RowValidator(headers, config)
+        self.content_type_keys = importer.get_content_type_keys()
+
+        header_index = validators.index_headers(headers)
+        if config.get('type', None) == 'xls':
+            s_id = 'tenurerelationship::spatial_unit_id'
+            p_id = 'tenurerelationship::party_id'
+        else:
+            s_id = 'spatial_unit_id'
+            p_id = 'party_id'
+        self.spatial_unit_id_index = header_index.get(s_id)
+        self.party_id_index = header_index.get(p_id)
+
+        self.attr_plan = self.compile_attributes(
+            importer, header_index, config.get('attributes', None) or [],
+            attr_map)
+
+    def compile_attributes(self, importer, header_index, attributes,
+                           attr_map):
+        """Returns a list of ``(model, [(selector, columns)])`` where each
+        column is a tuple ``(name, index, required, converter)``."""
+        attr_plan = []
+        for model, selectors in attr_map.items():
+            selector_plan = []
+            for selector, attrs in selectors.items():
+                columns = []
+                for attr in attrs:
+                    attribute = attrs[attr][0]
+                    attr_label = '{0}::{1}'.format(model.split('.')[1], attr)
+                    if attr_label not in attributes:
+                        continue
+                    index = header_index.get(
+                        attribute.name.lower(), header_index.get(attr_label))
+                    columns.append((
+                        attribute.name, index, attribute.required,
+                        self.get_converter(importer, attribute)
+                    ))
+                if columns:
+                    selector_plan.append((selector, columns))
+            if selector_plan:
+                attr_plan.append((model, selector_plan))
+        return attr_plan
+
+    def get_converter(self, importer, attribute):
+        attr_type = attribute.attr_type.name
+        if attr_type == 'select_multiple':
+            return split_select_multiple
+        if attr_type in ['integer', 'decimal']:
+            return lambda val: importer._cast_to_type(val, attr_type)
+        return None
+
+    def get_content_types(self, row):
+        """Validates the row and returns the model payloads keyed by content
+        type, along with the row's tenure type."""
+        (party_name, party_type, geometry, location_type,
+            tenure_type) = self.validator.validate(row)
+
+        content_types = dict.fromkeys(self.content_type_keys)
+        if 'PT' in self.entity_types and party_type:
+            content_types['party.party'] = {
+                'project': self.project,
+                'name': party_name,
+                'type': party_type,
+                'attributes': {}
+            }
+        if 'SU' in self.entity_types and location_type:
+            content_types['spatial.spatialunit'] = {
+                'project': self.project,
+                'type': location_type,
+                'geometry': geometry,
+                'attributes': {}
+            }
+        if location_type and party_type and tenure_type:
+            content_types['party.tenurerelationship'] = {
+                'project': self.project,
+                'attributes': {}
+            }
+
+        for model, selector_plan in self.attr_plan:
+            content_type = content_types.get(model, None)
+            if not content_type:
+                continue
+            entity_type = content_type.get('type', '')
+            attributes = content_type['attributes']
+            for selector, columns in selector_plan:
+                if selector not in ('DEFAULT', entity_type):
+                    continue
+                for name, index, required, converter in columns:
+                    if index is None:
+                        raise ValidationError(
+                            _("No '{}' column found.".format(name))
+                        )
+                    val = row[index]
+                    if not required and val == '':
+                        continue
+                    if converter is not None:
+                        val = converter(val)
+                    attributes[name] = val
+
+        return content_types, tenure_type
@@ -1,71 +1,178 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
+from itertools import islice
 
+from django.conf import settings
 from django.contrib.gis.geos import GEOSGeometry, GEOSException
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext as _
 
 from party.models import TenureRelationshipType
-from spatial.choices import TYPE_CHOICES
+from spatial.choices import TYPE_CHOICES_DICT
 from xforms.utils import InvalidODKGeometryError, odk_geom_to_wkt
 
 
-def get_field_value(headers, row, header, field_name):
-    try:
-        return row[headers.index(header)]
-    except ValueError:
+def index_headers(headers):
+    """Maps each header to the position of its first occurrence, matching
+    the semantics of ``headers.index``."""
+    header_index = {}
+    for i, header in enumerate(headers):
+        header_index.setdefault(header, i)
+    return header_index
+
+
+def get_field_value(row, index, field_name):
+    if index is None:
         raise ValidationError(
             _("No '{}' column found.".format(field_name))
         )
+    return row[index]
 
 
-def validate_row(headers, row, config):
-    party_name, party_type, geometry, tenure_type, location_type = (
-        None, None, None, None, None)
+class RowValidator():
+    """Validates the rows of an import file.
 
-    (party_name_field, party_type_field, location_type_field, type,
-        geometry_field, tenure_type_field) = get_fields_from_config(config)
+    Column positions for the configured fields are resolved once when the
+    validator is created; missing columns are still reported when the
+    first row is validated.
 
-    if len(headers) != len(row):
-        raise ValidationError(
-            _("Number of headers and columns do not match.")
-        )
+    Tenure types are checked against ``tenure_types`` if given, otherwise
+    against the cached tenure relationship types.
+    """
 
-    _get_field_value = partial(get_field_value, headers, row)
+    def __init__(self, headers, config, tenure_types=None):
+        (party_name_field, party_type_field, location_type_field, type,
+            geometry_field, tenure_type_field) = get_fields_from_config(config)
+        header_index = index_headers(headers)
 
-    if party_name_field and party_type_field:
-        party_name = _get_field_value(party_name_field, "party_name")
-        party_type = _get_field_value(party_type_field, "party_type")
+        self.num_columns = len(headers)
+        self.has_party = bool(party_name_field and party_type_field)
+        self.has_geometry = bool(geometry_field)
+        self.has_location_type = bool(location_type_field)
+        self.has_tenure = bool(party_name_field and geometry_field)
 
-    if geometry_field:
-        coords = _get_field_value(geometry_field, "geometry_field")
-        if coords == '':
-            geometry = None
-        else:
-            try:
-                geometry = GEOSGeometry(coords)
-            except (ValueError, GEOSException):
-                try:
-                    geometry = GEOSGeometry(odk_geom_to_wkt(coords))
-                except InvalidODKGeometryError:
-                    raise ValidationError(_("Invalid geometry."))
-
-    if location_type_field:
-        location_type = _get_field_value(location_type_field, "location_type")
-        type_choices = [choice[0] for choice in TYPE_CHOICES]
-        if location_type and location_type not in type_choices:
-            raise ValidationError(
-                _("Invalid location_type: '%s'.") % location_type
-            )
+        self.party_name_index = header_index.get(party_name_field)
+        self.party_type_index = header_index.get(party_type_field)
+        self.geometry_index = header_index.get(geometry_field)
+        self.location_type_index = header_index.get(location_type_field)
+        self.tenure_type_index = header_index.get(tenure_type_field)
+        self.tenure_types = tenure_types
+
+    def validate(self, row):
+        party_name, party_type, geometry, tenure_type, location_type = (
+            None, None, None, None, None)
 
-    if party_name_field and geometry_field:
-        tenure_type = _get_field_value(tenure_type_field, 'tenure_type')
-        if tenure_type and not TenureRelationshipType.objects.filter(
-                id=tenure_type).exists():
+        if self.num_columns != len(row):
             raise ValidationError(
-                _("Invalid tenure_type: '%s'.") % tenure_type
+                _("Number of headers and columns do not match.")
             )
 
-    return (party_name, party_type, geometry, location_type, tenure_type)
+        if self.has_party:
+            party_name = get_field_value(
+                row, self.party_name_index, "party_name")
+            party_type = get_field_value(
+                row, self.party_type_index, "party_type")
+
+        if self.has_geometry:
+            coords = get_field_value(
+                row, self.geometry_index, "geometry_field")
+            if coords == '':
+                geometry = None
+            else:
+                try:
+                    geometry = GEOSGeometry(coords)
+                except (ValueError, GEOSException):
+                    try:
+                        geometry = GEOSGeometry(odk_geom_to_wkt(coords))
+                    except InvalidODKGeometryError:
+                        raise ValidationError(_("Invalid geometry."))
+
+        if self.has_location_type:
+            location_type = get_field_value(
+                row, self.location_type_index, "location_type")
+            if location_type and location_type not in TYPE_CHOICES_DICT:
+                raise ValidationError(
+                    _("Invalid location_type: '%s'.") % location_type
+                )
+
+        if self.has_tenure:
+            tenure_type = get_field_value(
+                row, self.tenure_type_index, 'tenure_type')
+            if (tenure_type and
+                    tenure_type not in self.get_tenure_types()):
+                raise ValidationError(
+                    _("Invalid tenure_type: '%s'.") % tenure_type
+                )
+
+        return (party_name, party_type, geometry, location_type, tenure_type)
+
+    def get_tenure_types(self):
+        if self.tenure_types is None:
+            return TenureRelationshipType.objects.get_all_cached()
+        return self.tenure_types
+
+
+def validate_row(headers, row, config):
+    return RowValidator(headers, config).validate(row)
+
+
+def validate_shard(headers, config, tenure_types, rows):
+    """Validates a list of ``(line_num, row)`` tuples and returns a list of
+    ``(line_num, message)`` tuples for the rows that are invalid."""
+    validator = RowValidator(headers, config, tenure_types=tenure_types)
+    errors = []
+    for line_num, row in rows:
+        try:
+            validator.validate(row)
+        except ValidationError as e:
+            errors.append((line_num, e.messages[0]))
+    return errors
+
+
+def iter_shards(rows, shard_size):
+    rows = iter(rows)
+    while True:
+        shard = list(islice(rows, shard_size))
+        if not shard:
+            return
+        yield shard
+
+
+def validate_rows(headers, rows, config, workers=None, shard_size=None):
+    """Validates all ``rows``, an iterable of ``(line_num, row)`` tuples,
+    without writing anything, and returns the errors found as a list of
+    ``(line_num, message)`` tuples in file order.
+
+    Rows are split into shards of ``shard_size`` that are validated by a
+    pool of ``workers`` processes. Only a few shards are queued at any
+    time, so large files are not held in memory. The worker processes do
+    not use the database."""
+    if workers is None:
+        workers = settings.IMPORT_VALIDATION_WORKERS
+    if shard_size is None:
+        shard_size = settings.IMPORT_VALIDATION_SHARD_SIZE
+
+    config = dict((k, v) for k, v in config.items() if k != 'project')
+    tenure_types = set(TenureRelationshipType.objects.get_all_cached())
+    validate = partial(validate_shard, headers, config, tenure_types)
+    shards = iter_shards(rows, shard_size)
+
+    errors = []
+    if workers < 2:
+        for shard in shards:
+            errors.extend(validate(shard))
+        return errors
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for shard in shards:
+            pending.append(executor.submit(validate, shard))
+            if len(pending) >= 2 * workers:
+                errors.extend(pending.popleft().result())
+        while pending:
+            errors.extend(pending.popleft().result())
+    return errors
 
 
 def get_fields_from_config(config):
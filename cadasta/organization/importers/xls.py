@@ -1,10 +1,11 @@
-import io
 import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
 
-import pandas as pd
 from django.utils.translation import ugettext as _
+from openpyxl import load_workbook
 
-from . import base, exceptions
+from . import base, exceptions, validators
 
 
 class XLSImporter(base.Importer):
@@ -17,98 +18,230 @@ class XLSImporter(base.Importer):
     def __init__(self, project=None, path=None):
         super(XLSImporter, self).__init__(project=project)
         self.path = path
+        self._header_map = None
+
+    @contextmanager
+    def open_workbook(self):
+        workbook = load_workbook(self.path, read_only=True)
+        try:
+            yield workbook
+        finally:
+            close_workbook(workbook)
 
     def get_header_map(self):
+        if self._header_map is not None:
+            return self._header_map
+
         headers = {}
         EXCLUDE_HEADERS = base.EXCLUDE_HEADERS.copy()
         EXCLUDE_HEADERS.extend(self.EXCLUDE_IDS)
-        workbook = pd.read_excel(self.path, sheetname=None)
-        for sheet in workbook.keys():
-            worksheet = workbook[sheet]
-            heads = []
-            headers[sheet] = heads
-            for col in worksheet.columns.tolist():
-                if not (col.startswith(
-                        ('_', 'meta/')) or col in EXCLUDE_HEADERS):
-                    heads.append(col.lower())
+        with self.open_workbook() as workbook:
+            for worksheet in workbook.worksheets:
+                heads = []
+                headers[worksheet.title] = heads
+                for col in read_headers(worksheet):
+                    if col and not (col.startswith(
+                            ('_', 'meta/')) or col in EXCLUDE_HEADERS):
+                        heads.append(col.lower())
+        self._header_map = headers
         return headers
 
     def get_headers(self):
-        return itertools.chain.from_iterable(self.get_header_map().values())
+        return list(
+            itertools.chain.from_iterable(self.get_header_map().values()))
+
+    def count_rows(self, config):
+        with self.open_workbook() as workbook:
+            headers, rows = join_worksheets(workbook, config['entity_types'])
+            return sum(1 for row in rows)
 
-    def import_data(self, config, **kwargs):
+    def validate_data(self, config):
+        with self.open_workbook() as workbook:
+            headers, rows = join_worksheets(workbook, config['entity_types'])
+            return validators.validate_rows(
+                headers, enumerate(rows, start=2), config)
+
+    def import_data(self, config, job=None, **kwargs):
         entity_types = config['entity_types']
-        df = pd.read_excel(self.path, sheetname=None)
-        data = get_csv_from_dataframe(df, entity_types)
-        with io.StringIO(data) as csvfile:
-            self._import(config, csvfile)
-
-
-def get_csv_from_dataframe(df, entity_types):
-    locations, parties, relationships = None, None, None
-    try:
-        if 'SU' in entity_types and 'PT' in entity_types:
-            locations = df['locations']
-            parties = df['parties']
-            relationships = df['relationships']
-            if not (locations.empty or
-                    relationships.empty or parties.empty):
-                locations.rename(
-                    columns=lambda x: 'spatialunit::' + x.lower(),
-                    inplace=True
-                )
-                relationships.rename(
-                    columns={'tenure_type.id': 'tenure_type'},
-                    inplace=True
-                )
-                relationships.rename(
-                    columns=lambda x: 'tenurerelationship::' + x.lower(),
-                    inplace=True)
-                parties.rename(
-                    columns=lambda x: 'party::' + x.lower(), inplace=True
-                )
-                # join locations and relationships on spatial_id's
-                joined = pd.merge(
-                    locations, relationships, left_on='spatialunit::id',
-                    right_on='tenurerelationship::spatial_unit_id',
-                    how='outer'
-                )
-                # then join to parties on party_id
-                merged = pd.merge(
-                    joined, parties, left_on='tenurerelationship::party_id',
-                    right_on='party::id', how='outer'
-                )
-                # drop unused columns
-                drop_cols = [
-                    'spatialunit::id', 'party::id',
-                    'tenurerelationship::tenure_type.label'
-                ]
-                merged.drop(drop_cols, inplace=True, axis=1)
-
-                return merged.to_csv(index=False, index_label=False)
-            else:
-                raise exceptions.DataImportError(
-                    _('Empty worksheet.'))
-        elif 'SU' in entity_types and 'PT' not in entity_types:
-            locations = df['locations']
-            # rename location type
-            locations.rename(
-                columns=lambda x: 'spatialunit::' + x.lower(), inplace=True
-            )
-            drop_cols = ['spatialunit::id']
-            locations.drop(drop_cols, inplace=True, axis=1)
-            return locations.to_csv(index=False, index_label=False)
-        elif 'SU' not in entity_types and 'PT' in entity_types:
-            parties = df['parties']
-            parties.rename(
-                columns=lambda x: 'party::' + x.lower(), inplace=True
-            )
-            drop_cols = ['party::id']
-            parties.drop(drop_cols, inplace=True, axis=1)
-            return parties.to_csv(index=False, index_label=False)
+        with self.open_workbook() as workbook:
+            headers, rows = join_worksheets(workbook, entity_types)
+            self._import_rows(
+                config, headers,
+                ((line_num, row)
+                 for line_num, row in enumerate(rows, start=2)),
+                job=job)
+
+
+def close_workbook(workbook):
+    """Closes the file of a read-only workbook, which openpyxl keeps open
+    for the worksheets to be read."""
+    archive = getattr(workbook, '_archive', None)
+    if archive is not None:
+        archive.close()
+
+
+def to_str(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def read_headers(worksheet):
+    for row in worksheet.iter_rows():
+        return [to_str(cell.value) for cell in row]
+    return []
+
+
+class Sheet():
+    """Streams the rows of a worksheet as lists of strings.
+
+    Column names are lower-cased and prefixed with the name of the model
+    they belong to, e.g. ``spatialunit::type``.
+    """
+
+    def __init__(self, workbook, title, prefix, rename={}):
+        if title not in workbook.sheetnames:
+            raise exceptions.DataImportError(
+                _("Missing '%s' worksheet.") % title)
+
+        self.rows = iter(workbook[title].iter_rows())
+        names = next(self.rows, ())
+        self.headers = [
+            prefix + rename.get(name, name).lower()
+            for name in (to_str(cell.value) for cell in names)
+        ]
+        self.width = len(self.headers)
+        self.blank = [''] * self.width
+
+        # Read ahead so that empty worksheets can be detected
+        self.first = self.read_row()
+        self.empty = self.width == 0 or self.first is None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.first is not None:
+            row, self.first = self.first, None
         else:
+            row = self.read_row()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def read_row(self):
+        for cells in self.rows:
+            row = [to_str(cell.value) for cell in cells[:self.width]]
+            if not any(row):
+                continue
+            if len(row) < self.width:
+                row.extend([''] * (self.width - len(row)))
+            return row
+        return None
+
+    def index(self, header):
+        try:
+            return self.headers.index(header)
+        except ValueError:
             raise exceptions.DataImportError(
-                _('Unsupported import format.'))
-    except KeyError as e:
+                _("Missing '%s' column.") % header)
+
+
+def drop_columns(headers, rows, drop_cols):
+    keep = [i for i, h in enumerate(headers) if h not in drop_cols]
+    return (
+        [headers[i] for i in keep],
+        ([row[i] for i in keep] for row in rows)
+    )
+
+
+def join_worksheets(workbook, entity_types):
+    """Returns the headers and an iterator over the rows of the workbook,
+    with locations, relationships and parties joined into one row each.
+
+    Locations are streamed from the workbook; relationships and parties are
+    indexed by the IDs they are joined on. As with an outer join, every row
+    of each worksheet is in at least one joined row.
+    """
+    if 'SU' in entity_types and 'PT' in entity_types:
+        locations = Sheet(workbook, 'locations', 'spatialunit::')
+        parties = Sheet(workbook, 'parties', 'party::')
+        relationships = Sheet(
+            workbook, 'relationships', 'tenurerelationship::',
+            rename={'tenure_type.id': 'tenure_type'})
+        if locations.empty or relationships.empty or parties.empty:
+            raise exceptions.DataImportError(_('Empty worksheet.'))
+        headers = locations.headers + relationships.headers + parties.headers
+        rows = join_rows(locations, relationships, parties)
+        drop_cols = [
+            'spatialunit::id', 'party::id',
+            'tenurerelationship::tenure_type.label'
+        ]
+    elif 'SU' in entity_types and 'PT' not in entity_types:
+        locations = Sheet(workbook, 'locations', 'spatialunit::')
+        headers, rows = locations.headers, locations
+        drop_cols = ['spatialunit::id']
+    elif 'SU' not in entity_types and 'PT' in entity_types:
+        parties = Sheet(workbook, 'parties', 'party::')
+        headers, rows = parties.headers, parties
+        drop_cols = ['party::id']
+    else:
         raise exceptions.DataImportError(
-            _("Missing '%s' worksheet.") % e.args[0])
+            _('Unsupported import format.'))
+
+    return drop_columns(headers, rows, drop_cols)
+
+
+def join_rows(locations, relationships, parties):
+    """Performs an outer join of locations to relationships on the spatial
+    unit ID, and of the result to parties on the party ID."""
+    su_id = locations.index('spatialunit::id')
+    rel_su_id = relationships.index('tenurerelationship::spatial_unit_id')
+    rel_party_id = relationships.index('tenurerelationship::party_id')
+    party_id = parties.index('party::id')
+
+    rels_by_location = OrderedDict()
+    for rel in relationships:
+        rels_by_location.setdefault(rel[rel_su_id], []).append(rel)
+    # Parties without an ID cannot be joined, and parties sharing an ID
+    # are all joined to the relationships of that ID
+    party_rows = list(parties)
+    parties_by_id = {}
+    for index, party in enumerate(party_rows):
+        if party[party_id]:
+            parties_by_id.setdefault(party[party_id], []).append(index)
+
+    joined_locations = set()
+    joined_parties = set()
+
+    def join_parties(location, rel):
+        key = rel[rel_party_id]
+        indexes = parties_by_id.get(key) if key else None
+        if not indexes:
+            yield location + rel + parties.blank
+            return
+        for index in indexes:
+            joined_parties.add(index)
+            yield location + rel + party_rows[index]
+
+    for location in locations:
+        key = location[su_id]
+        rels = rels_by_location.get(key) if key else None
+        if rels:
+            joined_locations.add(key)
+            for rel in rels:
+                yield from join_parties(location, rel)
+        else:
+            yield location + relationships.blank + parties.blank
+
+    for key, rels in rels_by_location.items():
+        if key in joined_locations:
+            continue
+        for rel in rels:
+            yield from join_parties(locations.blank, rel)
+
+    for index, party in enumerate(party_rows):
+        if index not in joined_parties:
+            yield locations.blank + relationships.blank + party
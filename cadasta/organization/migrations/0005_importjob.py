@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.10.7 on 2017-06-12 10:21
+from __future__ import unicode_literals
+
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('organization', '0004_remove_Pb_project_roles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.CharField(max_length=24, primary_key=True, serialize=False)),
+                ('config', django.contrib.postgres.fields.jsonb.JSONField(default={})),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=9)),
+                ('total_rows', models.IntegerField(null=True)),
+                ('rows_imported', models.IntegerField(default=0)),
+                ('line_num', models.IntegerField(default=0)),
+                ('parties_created', django.contrib.postgres.fields.jsonb.JSONField(default={})),
+                ('locations_created', django.contrib.postgres.fields.jsonb.JSONField(default={})),
+                ('error', models.TextField(blank=True, default='')),
+                ('error_line', models.IntegerField(null=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(null=True)),
+                ('started_rows', models.IntegerField(default=0)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='organization.Project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created_date',),
+            },
+        ),
+    ]
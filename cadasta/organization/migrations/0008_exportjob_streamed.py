@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('organization', '0007_importjob_validate_only'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='streamed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
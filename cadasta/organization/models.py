@@ -1,3 +1,5 @@
+from datetime import timedelta
+
 from django.utils.functional import cached_property
 from django.core.urlresolvers import reverse
 from django.conf import settings
@@ -7,30 +9,26 @@ from django.contrib.postgres.fields import JSONField, ArrayField
 from django.dispatch import receiver
 from django.utils.translation import ugettext as _
 from django.utils.encoding import iri_to_uri
+from django.utils.timezone import now
 import django.contrib.gis.db.models as gismodels
 from simple_history.models import HistoricalRecords
 from shapely.geometry import Polygon
 from shapely.wkt import dumps
 
 from tutelary.decorators import permissioned_model
-from tutelary.models import Policy
 
 from core.models import RandomIDModel, SlugModel
+from core.policies import clear_user_roles, get_policy_instance
 from geography.models import WorldBorder
 from resources.mixins import ResourceModelMixin
 from .validators import validate_contact
-from .choices import ROLE_CHOICES, ACCESS_CHOICES
+from .choices import ROLE_CHOICES, ACCESS_CHOICES, JOB_STATUS_CHOICES
 from . import messages
 
 
 PERMISSIONS_DIR = settings.BASE_DIR + '/permissions/'
 
 
-def get_policy_instance(policy_name, variables):
-    policy = Policy.objects.get(name=policy_name)
-    return (policy, variables)
-
-
 @permissioned_model
 class Organization(SlugModel, RandomIDModel):
     name = models.CharField(max_length=200, unique=True)
@@ -150,6 +148,7 @@ def assign_org_policies(instance, delete=False):
         assigned_policies.remove(org_member)
 
     instance.user.assign_policies(*assigned_policies)
+    clear_user_roles(instance.user)
 
 
 @receiver(models.signals.post_save, sender=OrganizationRole)
@@ -362,6 +361,7 @@ def assign_prj_policies(role, delete=False):
         assigned_policies.append(project_manager)
 
     role.user.assign_policies(*assigned_policies)
+    clear_user_roles(role.user)
 
 
 @receiver(models.signals.post_save, sender=ProjectRole)
@@ -372,3 +372,148 @@ def assign_project_permissions(sender, instance, **kwargs):
 @receiver(models.signals.post_delete, sender=ProjectRole)
 def remove_project_permissions(sender, instance, **kwargs):
     assign_prj_policies(instance, delete=True)
+
+
+class ImportJob(RandomIDModel):
+    """A data import running in the background.
+
+    The import commits its rows in chunks. After each chunk, the job
+    records a checkpoint: the last committed line of the file and the
+    IDs of the parties and locations created so far. A job that failed,
+    or whose worker went away, is resumed from its checkpoint.
+
+    Each run of the job is identified by the time it ``started``. A run
+    only saves checkpoints while the job is still its own, so a worker
+    that was thought gone stops once its job was resumed elsewhere.
+
+    A ``validate_only`` job checks the whole file without importing it,
+    and records the ``(line_num, message)`` pairs of the invalid rows in
+    ``validation_errors``.
+    """
+    project = models.ForeignKey(Project, related_name='import_jobs')
+    user = models.ForeignKey('accounts.User')
+    config = JSONField(default={})
+    status = models.CharField(max_length=9,
+                              choices=JOB_STATUS_CHOICES,
+                              default='pending')
+    total_rows = models.IntegerField(null=True)
+    rows_imported = models.IntegerField(default=0)
+    line_num = models.IntegerField(default=0)
+    parties_created = JSONField(default={})
+    locations_created = JSONField(default={})
+    error = models.TextField(blank=True, default='')
+    error_line = models.IntegerField(null=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    started_rows = models.IntegerField(default=0)
+    last_updated = models.DateTimeField(auto_now=True)
+    validate_only = models.BooleanField(default=False)
+    validation_errors = JSONField(default=[])
+
+    class Meta:
+        ordering = ('-created_date',)
+
+    def __repr__(self):
+        repr_string = ('<ImportJob id={obj.id} project={obj.project.slug}'
+                       ' status={obj.status} line_num={obj.line_num}>')
+        return repr_string.format(obj=self)
+
+    @property
+    def rows_per_second(self):
+        """Import rate of the current run, measured up to the last
+        checkpoint."""
+        if self.started is None:
+            return None
+        elapsed = (self.last_updated - self.started).total_seconds()
+        rows = self.rows_imported - self.started_rows
+        if elapsed <= 0 or rows <= 0:
+            return None
+        return rows / elapsed
+
+    @property
+    def eta(self):
+        """Estimated number of seconds until the import completes."""
+        rate = self.rows_per_second
+        if (self.status != 'running' or rate is None or
+                self.total_rows is None):
+            return None
+        return max(self.total_rows - self.rows_imported, 0) / rate
+
+    @property
+    def is_stale(self):
+        if self.status != 'running':
+            return False
+        timeout = timedelta(seconds=settings.IMPORT_JOB_TIMEOUT)
+        return now() - self.last_updated > timeout
+
+    @property
+    def can_resume(self):
+        return self.status == 'failed' or self.is_stale
+
+    def claim(self):
+        """Marks the job as pending, to be run again, unless it changed
+        since it was read, e.g. because another request resumed it first.
+        Returns whether the job was claimed."""
+        claimed = ImportJob.objects.filter(
+            id=self.id, status=self.status, last_updated=self.last_updated,
+        ).update(status='pending', started=None, last_updated=now())
+        self.refresh_from_db()
+        return bool(claimed)
+
+    def save_checkpoint(self, line_num, rows, parties_created,
+                        locations_created):
+        """Saves a checkpoint of the current run. Returns ``False``,
+        without saving it, if the job was claimed by another run."""
+        self.line_num = line_num
+        self.rows_imported += rows
+        self.parties_created = parties_created
+        self.locations_created = locations_created
+        self.last_updated = now()
+        return bool(ImportJob.objects.filter(
+            id=self.id, started=self.started,
+            status__in=['pending', 'running'],
+        ).update(
+            line_num=self.line_num, rows_imported=self.rows_imported,
+            parties_created=self.parties_created,
+            locations_created=self.locations_created,
+            last_updated=self.last_updated))
+
+
+class ExportJob(RandomIDModel):
+    """A download of project data, built in the background.
+
+    ``version`` stamps the state of the project data the export was built
+    from. Built exports are kept in the export cache, so later downloads of
+    unchanged data are served without building them again. ``streamed``
+    exports are sent to the client while they are built, and only their
+    completed exports can be shared with other downloads.
+    """
+    project = models.ForeignKey(Project, related_name='export_jobs')
+    user = models.ForeignKey('accounts.User')
+    type = models.CharField(max_length=10)
+    version = models.CharField(max_length=40)
+    streamed = models.BooleanField(default=False)
+    status = models.CharField(max_length=9,
+                              choices=JOB_STATUS_CHOICES,
+                              default='pending')
+    error = models.TextField(blank=True, default='')
+    created_date = models.DateTimeField(auto_now_add=True)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('-created_date',)
+
+    @property
+    def is_stale(self):
+        """Whether the job is pending or running, but has not been updated
+        for ``EXPORT_JOB_TIMEOUT`` seconds, e.g. because its worker was
+        recycled or killed."""
+        if self.status not in ('pending', 'running'):
+            return False
+        timeout = timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+        return now() - self.last_updated > timeout
+
+    def __repr__(self):
+        repr_string = ('<ExportJob id={obj.id} project={obj.project.slug}'
+                       ' type={obj.type} status={obj.status}>')
+        return repr_string.format(obj=self)
@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+from collections import OrderedDict, namedtuple
+
+from core.tests.utils.benchmark import benchmark, get_size, measure, report
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.gis.geos import Point
+from django.test import TestCase
+from openpyxl import Workbook
+
+from ..download.base import Record
+from ..download.shape import ShapeExporter
+from ..download.xls import XLSExporter
+from ..importers.base import Importer
+from ..importers.plan import RowPlan
+from ..tests.factories import ProjectFactory
+
+AttrType = namedtuple('AttrType', 'name')
+Attr = namedtuple('Attr', 'name required attr_type')
+
+ATTR_TYPES = ('text', 'integer', 'select_multiple', 'decimal')
+ATTR_VALUES = {
+    'text': 'some text',
+    'integer': '12',
+    'select_multiple': 'one, two',
+    'decimal': '1.5',
+}
+
+
+def make_import(num_columns):
+    """Returns headers, a row, a config and an attribute map for a party
+    import with ``num_columns`` columns."""
+    headers = ['name', 'party_type']
+    row = ['Party name', 'IN']
+    attrs = {}
+    for i in range(num_columns - len(headers)):
+        attr_type = ATTR_TYPES[i % len(ATTR_TYPES)]
+        name = 'attr_{}'.format(i)
+        attrs[name] = (Attr(name, False, AttrType(attr_type)),
+                       'party.party', 'Party')
+        headers.append(name)
+        row.append(ATTR_VALUES[attr_type])
+    config = {
+        'type': 'csv',
+        'entity_types': ['PT'],
+        'party_name_field': 'name',
+        'party_type_field': 'party_type',
+        'attributes': ['party::' + name for name in attrs],
+    }
+    attr_map = {'party.party': {'DEFAULT': attrs}}
+    return headers, row, config, attr_map
+
+
+@benchmark
+class ImportRowPlanBenchmark(TestCase):
+
+    def test_row_cost_by_column_count(self):
+        importer = Importer(ProjectFactory.build())
+        num_rows = 1000
+        results = []
+
+        for num_columns in (10, 100, 500):
+            headers, row, config, attr_map = make_import(num_columns)
+            plan = RowPlan(importer, headers, config, attr_map)
+
+            content_types, _ = plan.get_content_types(row)
+            attributes = content_types['party.party']['attributes']
+            assert len(attributes) == num_columns - 2
+            assert attributes['attr_1'] == 12
+            assert attributes['attr_2'] == ['one', 'two']
+
+            compile_time = measure(
+                lambda: RowPlan(importer, headers, config, attr_map))
+            row_time = measure(lambda: plan.get_content_types(row), num_rows)
+            results.append((
+                num_columns,
+                '{:.1f}'.format(compile_time * 1e6),
+                '{:.1f}'.format(row_time / num_rows * 1e6),
+                '{:.0f}'.format(num_rows / row_time),
+            ))
+
+        report('Import row plan', ('columns', 'compile (us)', 'row (us)',
+                                   'rows/s'), results)
+
+
+def make_locations(num_rows, num_attrs=10):
+    """Returns schema attributes and ``num_rows`` location records for an
+    export."""
+    attrs = OrderedDict()
+    values = {}
+    for i in range(num_attrs):
+        attr_type = ATTR_TYPES[i % len(ATTR_TYPES)]
+        name = 'attr_{}'.format(i)
+        attrs[name] = Attr(name, False, AttrType(attr_type))
+        values[name] = (['one', 'two'] if attr_type == 'select_multiple'
+                        else ATTR_VALUES[attr_type])
+    geometry = Point(30, 10, srid=4326)
+    records = [
+        Record({'id': 'location{:016d}'.format(i), 'type': 'PA',
+                'geometry': geometry, 'geometry_wkb': bytes(geometry.wkb),
+                'attributes': values})
+        for i in range(num_rows)
+    ]
+    return {'spatial.spatialunit': {'DEFAULT': attrs}}, records
+
+
+@benchmark
+class ExportBenchmark(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.content_type = ContentType.objects.get(app_label='spatial',
+                                                    model='spatialunit')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def export_xls(self, schema_attrs, records):
+        exporter = XLSExporter(ProjectFactory.build())
+        exporter._schema_attrs = schema_attrs
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet(title='locations')
+        exporter.write_items(worksheet, records, self.content_type,
+                             ['id', 'geometry.ewkt', 'type'])
+        workbook.save(os.path.join(self.dir, 'locations.xlsx'))
+
+    def export_shp(self, schema_attrs, records):
+        exporter = ShapeExporter(ProjectFactory.build())
+        exporter._schema_attrs = schema_attrs
+        dst_dir = os.path.join(self.dir, 'shp')
+        shutil.rmtree(dst_dir, ignore_errors=True)
+        ds = exporter.create_datasource(dst_dir)
+        layers = exporter.write_locations(
+            ds, os.path.join(dst_dir, 'locations.csv'), records,
+            self.content_type, ('id', 'type'))
+        assert layers['point'].GetFeatureCount() == len(records)
+        ds.Destroy()
+
+    def test_rows_per_second(self):
+        results = []
+        for num_rows in get_size((100, 1000), (10000, 100000)):
+            schema_attrs, records = make_locations(num_rows)
+            for name, export in (('XLS', self.export_xls),
+                                 ('SHP', self.export_shp)):
+                elapsed = measure(lambda: export(schema_attrs, records))
+                results.append((
+                    name, num_rows,
+                    '{:.2f}'.format(elapsed),
+                    '{:.0f}'.format(num_rows / elapsed),
+                ))
+
+        report('Location export', ('format', 'rows', 'time (s)', 'rows/s'),
+               results)
@@ -1,6 +1,10 @@
 import csv
 import os
+import shutil
+import sqlite3
+import tempfile
 import time
+from datetime import timedelta
 from zipfile import ZipFile
 
 import pytest
@@ -10,9 +14,12 @@ from core.tests.utils.files import make_dirs  # noqa
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.geos import GEOSGeometry
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
 from jsonattrs.models import Attribute, AttributeType, Schema
 from openpyxl import Workbook, load_workbook
+from accounts.tests.factories import UserFactory
+from organization.models import ExportJob
 from organization.tests.factories import ProjectFactory
 from party.models import TenureRelationshipType
 from party.tests.factories import PartyFactory, TenureRelationshipFactory
@@ -23,9 +30,11 @@ from resources.utils.io import ensure_dirs
 from spatial.tests.factories import SpatialUnitFactory
 from spatial.models import SpatialUnit
 
+from ..download import gpkg, jobs
 from ..download.base import Exporter
 from ..download.resources import ResourceExporter
 from ..download.shape import ShapeExporter
+from ..download.store import ArtifactStore
 from ..download.xls import XLSExporter
 
 
@@ -77,7 +86,7 @@ class BaseExporterTest(UserTestCase, TestCase):
         attrs = exporter.get_schema_attrs(content_type)
         assert len(attrs['DEFAULT']) == 2
 
-    def test_get_values(self):
+    def test_row_serializer_related_attrs(self):
         project = ProjectFactory.create(current_questionnaire='123abc')
         exporter = Exporter(project)
         content_type = ContentType.objects.get(app_label='party',
@@ -111,8 +120,8 @@ class BaseExporterTest(UserTestCase, TestCase):
                                                               'choice_2']})
         model_attrs = ('id', 'party_id', 'spatial_unit_id',
                        'tenure_type.label')
-        schema_attrs = exporter.get_schema_attrs(content_type)
-        values = exporter.get_values(item, model_attrs, schema_attrs)
+        serializer = exporter.get_serializer(content_type, model_attrs)
+        values = dict(zip(serializer.columns, serializer.serialize(item)))
         assert values == {
             'id': item.id, 'party_id': item.party_id,
             'spatial_unit_id': item.spatial_unit_id,
@@ -120,20 +129,7 @@ class BaseExporterTest(UserTestCase, TestCase):
             'key': 'text', 'key_2': 'choice_1, choice_2',
         }
 
-    def test_get_values_null_geom(self):
-        project = ProjectFactory.create(current_questionnaire='123abc')
-        exporter = Exporter(project)
-        item = SpatialUnitFactory.create(
-            project=project,
-            geometry=None)
-        content_type = ContentType.objects.get(app_label='spatial',
-                                               model='spatialunit')
-        model_attrs = ('id', 'geometry.wkt')
-        schema_attrs = exporter.get_schema_attrs(content_type)
-        values = exporter.get_values(item, model_attrs, schema_attrs)
-        assert values == {'id': item.id, 'geometry.wkt': None}
-
-    def test_get_values_with_conditional_selector(self):
+    def test_row_serializer_with_conditional_selector(self):
         project = ProjectFactory.create(current_questionnaire='123abc')
         exporter = Exporter(project)
         content_type = ContentType.objects.get(app_label='party',
@@ -178,12 +174,12 @@ class BaseExporterTest(UserTestCase, TestCase):
                                        'key': 'text',
                                        'key_2': ['choice_1',
                                                  'choice_2']})
-        model_attrs = ('id', 'name', 'type')
-        schema_attrs = exporter.get_schema_attrs(content_type)
-        values = exporter.get_values(item, model_attrs, schema_attrs)
+        serializer = exporter.get_serializer(content_type,
+                                             ('id', 'name', 'type'))
+        values = dict(zip(serializer.columns, serializer.serialize(item)))
         assert values == {
             'id': item.id, 'name': item.name, 'type': item.type,
-            'key': 'text', 'key_2': 'choice_1, choice_2'
+            'key': 'text', 'key_2': 'choice_1, choice_2', 'gr_key': ''
         }
 
         # test group attrs
@@ -193,14 +189,113 @@ class BaseExporterTest(UserTestCase, TestCase):
                                    attributes={
                                        'key': 'text',
                                        'gr_key': 'Test Group Field'})
-        model_attrs = ('id', 'name', 'type')
-        schema_attrs = exporter.get_schema_attrs(content_type)
-        values = exporter.get_values(item, model_attrs, schema_attrs)
+        values = dict(zip(serializer.columns, serializer.serialize(item)))
         assert values == {
             'id': item.id, 'name': item.name, 'type': item.type,
-            'key': 'text', 'gr_key': 'Test Group Field'
+            'key': 'text', 'key_2': '', 'gr_key': 'Test Group Field'
         }
 
+    def test_row_serializer(self):
+        project = ProjectFactory.create(current_questionnaire='123abc')
+        exporter = Exporter(project)
+        content_type = ContentType.objects.get(app_label='party',
+                                               model='party')
+        schema = Schema.objects.create(
+            content_type=content_type,
+            selectors=(project.organization.id, project.id, '123abc',))
+        schema_in = Schema.objects.create(
+            content_type=content_type,
+            selectors=(project.organization.id, project.id, '123abc', 'IN'))
+        text_type = AttributeType.objects.get(name='text')
+        select_m_type = AttributeType.objects.get(name='select_multiple')
+        Attribute.objects.create(
+            schema=schema,
+            name='key', long_name='Test field',
+            attr_type=text_type, index=0,
+            required=False, omit=False
+        )
+        Attribute.objects.create(
+            schema=schema_in,
+            name='key_2', long_name='Test select multiple field',
+            attr_type=select_m_type, index=1,
+            choices=['choice_1', 'choice_2', 'choice_3'],
+            choice_labels=['Choice 1', 'Choice 2', 'Choice 3'],
+            required=False, omit=False
+        )
+
+        serializer = exporter.get_serializer(content_type,
+                                             ('id', 'name', 'type'))
+        assert serializer.columns == ['id', 'name', 'type', 'key', 'key_2']
+
+        item = PartyFactory.create(project=project, name='Party', type='IN',
+                                   attributes={'key': 'text',
+                                               'key_2': ['choice_1',
+                                                         'choice_2']})
+        assert serializer.serialize(item) == [
+            item.id, 'Party', 'IN', 'text', 'choice_1, choice_2']
+
+        item = PartyFactory.create(project=project, name='Group', type='GR',
+                                   attributes={'key': 'text'})
+        assert serializer.serialize(item) == [
+            item.id, 'Group', 'GR', 'text', '']
+
+        serializer = exporter.get_serializer(content_type,
+                                             ('id', 'name', 'type'),
+                                             empty=None)
+        assert serializer.serialize(item) == [
+            item.id, 'Group', 'GR', 'text', None]
+
+    def test_row_serializer_null_geom(self):
+        project = ProjectFactory.create()
+        exporter = Exporter(project)
+        content_type = ContentType.objects.get(app_label='spatial',
+                                               model='spatialunit')
+        serializer = exporter.get_serializer(content_type,
+                                             ('id', 'geometry.wkt'))
+        item = SpatialUnitFactory.create(project=project, geometry=None)
+        assert serializer.serialize(item) == [item.id, None]
+
+    def test_get_value_fields(self):
+        project = ProjectFactory.create()
+        exporter = Exporter(project)
+        content_type = ContentType.objects.get(app_label='party',
+                                               model='tenurerelationship')
+        fields = exporter.get_value_fields(
+            content_type, ('id', 'party_id', 'tenure_type.id',
+                           'tenure_type.label'))
+        assert fields == ['attributes', 'id', 'party_id', 'tenure_type__id',
+                          'tenure_type__label']
+
+        content_type = ContentType.objects.get(app_label='spatial',
+                                               model='spatialunit')
+        fields = exporter.get_value_fields(
+            content_type, ('id', 'geometry.ewkt', 'type'))
+        assert fields == ['attributes', 'id', 'geometry', 'type']
+
+    def test_iter_records(self):
+        project = ProjectFactory.create()
+        exporter = Exporter(project)
+        content_type = ContentType.objects.get(app_label='party',
+                                               model='tenurerelationship')
+        ttype = TenureRelationshipType.objects.get(id='LH')
+        item = TenureRelationshipFactory.create(
+            project=project, tenure_type=ttype, attributes={'key': 'text'})
+
+        model_attrs = ('id', 'party_id', 'tenure_type.label')
+        records = list(exporter.iter_records(
+            project.tenure_relationships.all(), content_type, model_attrs))
+        assert len(records) == 1
+        assert records[0].id == item.id
+        assert records[0].party_id == item.party_id
+        assert records[0].tenure_type.label == 'Leasehold'
+        assert records[0].attributes['key'] == 'text'
+
+        serializer = exporter.get_serializer(content_type, model_attrs)
+        assert serializer.serialize(records[0]) == [
+            item.id, item.party_id, 'Leasehold']
+        with pytest.raises(AttributeError):
+            records[0].name
+
 
 @pytest.mark.usefixtures('clear_temp')
 class ShapeTest(UserTestCase, TestCase):
@@ -899,3 +994,312 @@ class ResourcesTest(UserTestCase, TestCase):
             assert 'resources_1.xlsx' in testzip.namelist()
             assert 'resources.xlsx' in testzip.namelist()
             assert deleted.original_file not in testzip.namelist()
+
+
+@pytest.mark.usefixtures('clear_temp')
+class GeoPackageTest(UserTestCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        ensure_dirs()
+        self.project = ProjectFactory.create(current_questionnaire='123abc')
+        content_type = ContentType.objects.get(app_label='spatial',
+                                               model='spatialunit')
+        schema = Schema.objects.create(
+            content_type=content_type,
+            selectors=(self.project.organization.id, self.project.id,
+                       '123abc', ))
+        Attribute.objects.create(
+            schema=schema,
+            name='key', long_name='Test field',
+            attr_type=AttributeType.objects.get(name='text'), index=0,
+            required=False, omit=False
+        )
+        Attribute.objects.create(
+            schema=schema,
+            name='integer', long_name='Test integer field',
+            attr_type=AttributeType.objects.get(name='integer'), index=1,
+            required=False, omit=False
+        )
+        Attribute.objects.create(
+            schema=schema,
+            name='decimal', long_name='Test decimal field',
+            attr_type=AttributeType.objects.get(name='decimal'), index=2,
+            required=False, omit=False
+        )
+        self.su1 = SpatialUnitFactory.create(
+            project=self.project,
+            geometry='SRID=4326;POINT (30 10)',
+            attributes={'key': 'value 1', 'integer': '3000000000',
+                        'decimal': '1.5'})
+        self.su2 = SpatialUnitFactory.create(
+            project=self.project,
+            geometry='SRID=4326;POLYGON ((30 10, 40 40, 20 40, 10 20, 30 10))',
+            attributes={'key': 'value 2', 'integer': 'x'})
+        self.su3 = SpatialUnitFactory.create(project=self.project,
+                                             geometry=None)
+        ttype = TenureRelationshipType.objects.get(id='LH')
+        self.rel = TenureRelationshipFactory.create(
+            project=self.project, spatial_unit=self.su1, tenure_type=ttype)
+
+    def read_table(self, db, name):
+        types = {row[1]: row[2] for row in
+                 db.execute('PRAGMA table_info("{}")'.format(name))}
+        cursor = db.execute('SELECT * FROM "{}"'.format(name))
+        columns = [c[0] for c in cursor.description]
+        rows = {}
+        for row in cursor:
+            row = dict(zip(columns, row))
+            rows[row['id']] = row
+        return types, rows
+
+    def read_geometry(self, blob):
+        assert blob[:8] == b'GP\x00\x01\xe6\x10\x00\x00'
+        return GEOSGeometry(memoryview(blob[8:])).wkt
+
+    def test_to_integer(self):
+        assert gpkg.to_integer('12') == 12
+        assert gpkg.to_integer('1.0') == 1
+        assert gpkg.to_integer(3000000000) == 3000000000
+        assert gpkg.to_integer(2 ** 63) is None
+        assert gpkg.to_integer('x') is None
+        assert gpkg.to_integer(None) is None
+
+    def test_make_download(self):
+        exporter = gpkg.GeoPackageExporter(self.project)
+        path, mime = exporter.make_download('gpkg-test')
+        assert path == os.path.join(settings.MEDIA_ROOT, 'temp/gpkg-test.gpkg')
+        assert mime == 'application/geopackage+sqlite3'
+
+        db = sqlite3.connect(path)
+        self.addCleanup(db.close)
+        assert db.execute('PRAGMA application_id').fetchone() == (
+            0x47504B47,)
+        assert db.execute('PRAGMA user_version').fetchone() == (10200,)
+        assert sorted(db.execute(
+            'SELECT srs_id FROM gpkg_spatial_ref_sys')) == [
+            (-1,), (0,), (4326,)]
+        contents = {row[0]: row[1:] for row in db.execute(
+            'SELECT table_name, data_type, min_x, min_y, max_x, max_y, '
+            'srs_id FROM gpkg_contents')}
+        assert contents == {
+            'locations': ('features', 10.0, 10.0, 40.0, 40.0, 4326),
+            'parties': ('attributes', None, None, None, None, None),
+            'relationships': ('attributes', None, None, None, None, None),
+        }
+        assert list(db.execute('SELECT * FROM gpkg_geometry_columns')) == [
+            ('locations', 'geom', 'GEOMETRY', 4326, 0, 0)]
+
+        types, rows = self.read_table(db, 'locations')
+        assert types == {'fid': 'INTEGER', 'geom': 'GEOMETRY',
+                         'id': 'TEXT', 'type': 'TEXT', 'key': 'TEXT',
+                         'integer': 'INTEGER', 'decimal': 'DOUBLE'}
+        assert len(rows) == 3
+        row = rows[self.su1.id]
+        assert row['key'] == 'value 1'
+        assert row['integer'] == 3000000000
+        assert row['decimal'] == 1.5
+        assert self.read_geometry(row['geom']) == 'POINT (30 10)'
+        row = rows[self.su2.id]
+        assert row['integer'] is None
+        assert row['decimal'] is None
+        assert self.read_geometry(row['geom']).startswith('POLYGON')
+        assert rows[self.su3.id]['geom'] is None
+
+        types, rows = self.read_table(db, 'relationships')
+        assert 'tenure_type_label' in types
+        assert 'geom' not in types
+        row = rows[self.rel.id]
+        assert row['spatial_unit_id'] == self.su1.id
+        assert row['party_id'] == self.rel.party_id
+        assert row['tenure_type_label'] == 'Leasehold'
+
+        types, rows = self.read_table(db, 'parties')
+        assert list(rows) == [self.rel.party_id]
+
+    def test_make_download_replaces_file(self):
+        path = os.path.join(settings.MEDIA_ROOT, 'temp/gpkg-test.gpkg')
+        with open(path, 'wb') as f:
+            f.write(b'old')
+        exporter = gpkg.GeoPackageExporter(self.project)
+        exporter.make_download('gpkg-test')
+        db = sqlite3.connect(path)
+        self.addCleanup(db.close)
+        assert db.execute('SELECT count(*) FROM locations').fetchone() == (
+            3,)
+
+
+class ArtifactStoreTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = ArtifactStore(location=self.dir, max_size=25)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_file(self, size):
+        fd, path = tempfile.mkstemp(dir=self.dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'x' * size)
+        return path
+
+    def test_put_and_get(self):
+        path = self.store.put('prj-xls-v1', '.xlsx', self.make_file(10))
+        assert path == os.path.join(self.dir, 'prj-xls-v1.xlsx')
+        assert self.store.get('prj-xls-v1', '.xlsx') == path
+        assert self.store.get('prj-xls-v2', '.xlsx') is None
+
+    def test_put_replaces_older_versions(self):
+        self.store.put('prj-xls-v1', '.xlsx', self.make_file(5))
+        self.store.put('prj-shp-v1', '.zip', self.make_file(5))
+        self.store.put('prj-xls-v2', '.xlsx', self.make_file(5))
+        assert self.store.get('prj-xls-v1', '.xlsx') is None
+        assert self.store.get('prj-xls-v2', '.xlsx') is not None
+        assert self.store.get('prj-shp-v1', '.zip') is not None
+
+    def test_evict_least_recently_used(self):
+        self.store.put('a-xls-v1', '.xlsx', self.make_file(10))
+        self.store.put('b-xls-v1', '.xlsx', self.make_file(10))
+        os.utime(os.path.join(self.dir, 'a-xls-v1.xlsx'), (1000, 1000))
+        os.utime(os.path.join(self.dir, 'b-xls-v1.xlsx'), (2000, 2000))
+
+        self.store.put('c-xls-v1', '.xlsx', self.make_file(10))
+        assert self.store.get('a-xls-v1', '.xlsx') is None
+        assert self.store.get('b-xls-v1', '.xlsx') is not None
+        assert self.store.get('c-xls-v1', '.xlsx') is not None
+
+    def test_evict_keeps_new_artifact(self):
+        path = self.store.put('a-xls-v1', '.xlsx', self.make_file(30))
+        assert os.path.exists(path)
+
+
+@pytest.mark.usefixtures('clear_temp')
+class ExportJobsTest(UserTestCase, TestCase):
+    def setUp(self):
+        super().setUp()
+        ensure_dirs()
+        self.project = ProjectFactory.create()
+        self.user = UserFactory.create()
+        SpatialUnitFactory.create(project=self.project,
+                                  geometry='SRID=4326;POINT (30 10)')
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(jobs.store.location, ignore_errors=True)
+
+    def test_data_version_changes_with_data(self):
+        version = jobs.get_data_version(self.project)
+        assert jobs.get_data_version(self.project) == version
+
+        SpatialUnitFactory.create(project=self.project)
+        assert jobs.get_data_version(self.project) != version
+
+    def test_request_export(self):
+        job = jobs.request_export(self.project, self.user, 'xls')
+        assert job.status == 'completed'
+        assert job.version == jobs.get_data_version(self.project)
+        path = jobs.get_artifact(job)
+        assert path.endswith('.xlsx')
+        assert os.path.exists(path)
+
+        # The cached export is reused until the data changes
+        assert jobs.request_export(self.project, self.user, 'xls') == job
+
+        SpatialUnitFactory.create(project=self.project)
+        new_job = jobs.request_export(self.project, self.user, 'xls')
+        assert new_job != job
+        assert jobs.get_artifact(new_job) != path
+        assert not os.path.exists(path)
+
+    def test_request_export_with_stale_job(self):
+        job = ExportJob.objects.create(
+            project=self.project, user=self.user, type='xls',
+            version=jobs.get_data_version(self.project), status='running')
+        assert jobs.request_export(self.project, self.user, 'xls') == job
+
+        ExportJob.objects.filter(id=job.id).update(
+            last_updated=now() - timedelta(hours=1))
+        new_job = jobs.request_export(self.project, self.user, 'xls')
+        assert new_job != job
+        assert new_job.status == 'completed'
+
+    def test_touch(self):
+        job = jobs.request_export(self.project, self.user, 'xls')
+        ExportJob.objects.filter(id=job.id).update(
+            last_updated=now() - timedelta(hours=1))
+        jobs.touch(job)
+        job.refresh_from_db()
+        assert now() - job.last_updated < timedelta(minutes=1)
+
+    def test_stream_export(self):
+        job, chunks = jobs.stream_export(self.project, self.user, 'shp')
+        assert job.status == 'pending'
+        assert jobs.get_artifact(job) is None
+
+        data = b''.join(chunks)
+        job.refresh_from_db()
+        assert job.status == 'completed'
+        path = jobs.get_artifact(job)
+        with open(path, 'rb') as f:
+            assert f.read() == data
+        with ZipFile(path) as archive:
+            assert 'README.txt' in archive.namelist()
+            assert 'locations.csv' in archive.namelist()
+            assert 'point.shp' in archive.namelist()
+
+        # The cached export is reused until the data changes
+        assert jobs.stream_export(self.project, self.user, 'shp') == (
+            job, None)
+
+    def test_stream_export_is_not_shared(self):
+        job, chunks = jobs.stream_export(self.project, self.user, 'shp')
+        assert job.streamed
+
+        # A stream is sent to one client only, so the export is built again
+        # until it has been cached
+        new_job, new_chunks = jobs.stream_export(
+            self.project, self.user, 'shp')
+        assert new_job != job
+        assert new_chunks is not None
+        chunks.close()
+        new_chunks.close()
+
+    @override_settings(EXPORT_STREAM_MAX_RECORDS=0)
+    def test_stream_export_of_large_project(self):
+        job, chunks = jobs.stream_export(self.project, self.user, 'shp')
+        assert chunks is None
+        assert not job.streamed
+        assert job.status == 'completed'
+        assert jobs.get_artifact(job).endswith('.zip')
+
+    def test_count_records(self):
+        assert jobs.count_records(self.project) == 1
+        PartyFactory.create(project=self.project)
+        assert jobs.count_records(self.project) == 2
+
+    def test_stream_export_interrupted(self):
+        job, chunks = jobs.stream_export(self.project, self.user, 'shp')
+        next(chunks)
+        chunks.close()
+
+        job.refresh_from_db()
+        assert job.status == 'failed'
+        assert jobs.get_artifact(job) is None
+        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
+        assert not [name for name in os.listdir(temp_dir)
+                    if name.startswith(self.project.id)]
+
+    def test_can_stream(self):
+        assert jobs.can_stream('shp')
+        assert not jobs.can_stream('xls')
+
+    def test_request_export_after_eviction(self):
+        job = jobs.request_export(self.project, self.user, 'shp')
+        os.remove(jobs.get_artifact(job))
+
+        new_job = jobs.request_export(self.project, self.user, 'shp')
+        assert new_job != job
+        assert jobs.get_artifact(new_job).endswith('.zip')
+        temp_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
+        assert not [name for name in os.listdir(temp_dir)
+                    if name.startswith(self.project.id)]
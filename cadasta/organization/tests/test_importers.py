@@ -1,19 +1,28 @@
+import os
+import shutil
+
 import pytest
 
-import pandas as pd
+from unittest.mock import patch
+from accounts.tests.factories import UserFactory
 from core.tests.utils.cases import FileStorageTestCase, UserTestCase
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.gis.geos import LineString, Point, Polygon
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
 from jsonattrs.models import Attribute, AttributeType, Schema
+from openpyxl import Workbook, load_workbook
 from party.models import Party, TenureRelationship
 from questionnaires.models import Questionnaire
 from resources.tests.utils import clear_temp  # noqa
 from spatial.models import SpatialUnit
 
-from ..importers import csv, exceptions, validators, xls
+from ..importers import bulk, csv, exceptions, jobs, validators, xls
 from ..importers.base import Importer
+from ..models import ImportJob
 from ..tests.factories import ProjectFactory
 
 
@@ -59,6 +68,70 @@ class BaseImporterTest(UserTestCase, TestCase):
         assert val == 0.0
 
 
+class BulkCreatorTest(UserTestCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.project = ProjectFactory.create()
+
+    def test_add_assigns_id(self):
+        creator = bulk.BulkCreator((SpatialUnit, Party), batch_size=10)
+        party = creator.add(Party(project=self.project, name='Test'))
+        assert party.id is not None
+        assert len(party.id) == 24
+        assert Party.objects.count() == 0
+
+    def test_allocate_id(self):
+        creator = bulk.BulkCreator((Party,), batch_size=10)
+        ids = set(creator.allocate_id(Party) for _ in range(25))
+        assert len(ids) == 25
+
+    def test_flush(self):
+        creator = bulk.BulkCreator(
+            (SpatialUnit, Party, TenureRelationship), batch_size=10)
+        su = creator.add(SpatialUnit(project=self.project, type='PA'))
+        party = creator.add(Party(project=self.project, name='Test'))
+        creator.add(TenureRelationship(
+            project=self.project, party_id=party.id,
+            spatial_unit_id=su.id, tenure_type_id='CU'))
+        creator.flush()
+
+        assert SpatialUnit.objects.get(id=su.id).type == 'PA'
+        assert Party.objects.get(id=party.id).name == 'Test'
+        assert TenureRelationship.objects.filter(
+            party=party, spatial_unit=su).count() == 1
+        assert Party.history.filter(id=party.id,
+                                    history_type='+').count() == 1
+        assert SpatialUnit.history.filter(id=su.id).count() == 1
+        assert TenureRelationship.history.count() == 1
+        assert creator.created[Party] == 1
+        assert creator.num_pending == 0
+
+    def test_flush_on_batch_size(self):
+        creator = bulk.BulkCreator((Party,), batch_size=3)
+        for i in range(7):
+            creator.add(Party(project=self.project, name='Party {}'.format(i)))
+        assert Party.objects.count() == 6
+        assert creator.num_pending == 1
+        creator.flush()
+        assert Party.objects.count() == 7
+
+    def test_no_auto_flush(self):
+        creator = bulk.BulkCreator((Party,), batch_size=3, auto_flush=False)
+        for i in range(7):
+            creator.add(Party(project=self.project, name='Party {}'.format(i)))
+        assert Party.objects.count() == 0
+        assert creator.num_pending == 7
+        creator.flush()
+        assert Party.objects.count() == 7
+
+    def test_add_runs_pre_save(self):
+        creator = bulk.BulkCreator((SpatialUnit,), batch_size=10)
+        su = creator.add(SpatialUnit(project=self.project,
+                                     geometry='SRID=4326;POINT (190 10)'))
+        assert su.geometry.coords == (-170.0, 10.0)
+
+
 class ImportValidatorTest(TestCase):
 
     def test_validate_invalid_column(self):
@@ -220,6 +293,44 @@ class ImportValidatorTest(TestCase):
             )
         assert e.value.message == "Invalid tenure_type: 'WRONG'."
 
+    def test_validate_rows(self):
+        config = {
+            'party_name_field': 'party_name',
+            'party_type_field': 'party_type',
+            'geometry_field': 'location_geometry',
+            'type': 'csv',
+            'location_type_field': 'location_type',
+            'project': ProjectFactory.build()
+        }
+        headers = [
+            'party_name', 'party_type', 'location_geometry',
+            'location_type', 'tenure_type']
+        rows = [
+            (line_num, ['Party Name', 'IN', 'SRID=4326;POINT (30 10)',
+                        'PA', ''])
+            for line_num in range(2, 12)
+        ]
+        rows[1][1][2] = 'SRID=4326;POINT (30 10, Z)'
+        rows[2][1][2] = '40.6890612 -73.9925067 0.0 0.0;'
+        rows[4][1][3] = 'WRONG'
+        rows[7] = (9, ['Party Name', 'IN'])
+        rows[8][1][4] = 'WRONG'
+        expected = [
+            (3, "Invalid geometry."),
+            (6, "Invalid location_type: 'WRONG'."),
+            (9, "Number of headers and columns do not match."),
+            (10, "Invalid tenure_type: 'WRONG'."),
+        ]
+
+        assert validators.validate_rows(
+            headers, rows, config, workers=1, shard_size=3) == expected
+        assert validators.validate_rows(
+            headers, rows, config, workers=2, shard_size=3) == expected
+
+    def test_iter_shards(self):
+        shards = list(validators.iter_shards(range(7), 3))
+        assert shards == [[0, 1, 2], [3, 4, 5], [6]]
+
 
 @pytest.mark.usefixtures('clear_temp')
 class CSVImportTest(UserTestCase, FileStorageTestCase, TestCase):
@@ -378,6 +489,9 @@ class CSVImportTest(UserTestCase, FileStorageTestCase, TestCase):
         assert Party.objects.all().count() == 10
         assert SpatialUnit.objects.all().count() == 10
         assert TenureRelationship.objects.all().count() == 10
+        assert Party.history.all().count() == 10
+        assert SpatialUnit.history.all().count() == 10
+        assert TenureRelationship.history.all().count() == 10
         for su in SpatialUnit.objects.filter(project_id=self.project.pk).all():
             if su.geometry is not None:
                 assert type(su.geometry) is Point
@@ -416,6 +530,129 @@ class CSVImportTest(UserTestCase, FileStorageTestCase, TestCase):
         assert len(tenure_relationships[0].attributes) == 2
         assert tenure_relationships[0].attributes == tr_attrs
 
+    def _create_job(self, path):
+        return ImportJob.objects.create(
+            project=self.project, user=UserFactory.create(), config={
+                'file': path,
+                'type': 'csv',
+                'entity_types': ['PT', 'SU'],
+                'party_name_field': 'name_of_hh',
+                'party_type_field': 'party_type',
+                'location_type_field': 'location_type',
+                'geometry_field': 'location_geometry',
+                'attributes': self.attributes,
+            })
+
+    def test_count_rows(self):
+        importer = csv.CSVImporter(
+            project=self.project, path=self.path + self.valid_csv)
+        assert importer.count_rows({}) == 10
+
+    def test_validate_data(self):
+        importer = csv.CSVImporter(
+            project=self.project, path=self.path + self.valid_csv)
+        config = {
+            'file': self.path + self.valid_csv,
+            'type': 'csv',
+            'entity_types': ['PT', 'SU'],
+            'party_name_field': 'name_of_hh',
+            'party_type_field': 'party_type',
+            'location_type_field': 'location_type',
+            'geometry_field': 'location_geometry',
+            'attributes': self.attributes,
+            'project': self.project
+        }
+        assert importer.validate_data(config) == []
+
+        config['geometry_field'] = 'name_of_hh'
+        errors = importer.validate_data(config)
+        assert errors == [
+            (line_num, 'Invalid geometry.') for line_num in range(2, 12)]
+        assert Party.objects.all().count() == 0
+
+    def test_import_data_with_job(self):
+        job = self._create_job(self.path + self.valid_csv)
+        importer = csv.CSVImporter(
+            project=self.project, path=self.path + self.valid_csv)
+        importer.batch_size = 6
+        config = dict(job.config, project=self.project)
+        with patch.object(job, 'save_checkpoint',
+                          wraps=job.save_checkpoint) as save_checkpoint:
+            importer.import_data(config, job=job)
+        assert save_checkpoint.call_count == 5
+        assert Party.objects.all().count() == 10
+        assert SpatialUnit.objects.all().count() == 10
+        assert TenureRelationship.objects.all().count() == 10
+        assert Party.history.filter(history_user=job.user).count() == 10
+
+        job.refresh_from_db()
+        assert job.rows_imported == 10
+        assert job.line_num == 11
+
+    def test_resume_import_from_checkpoint(self):
+        job = self._create_job(self.path + self.valid_csv)
+        job.line_num = 5
+        job.rows_imported = 4
+        job.save()
+
+        importer = csv.CSVImporter(
+            project=self.project, path=self.path + self.valid_csv)
+        importer.import_data(dict(job.config, project=self.project),
+                             job=job)
+        assert Party.objects.all().count() == 6
+        assert SpatialUnit.objects.all().count() == 6
+        assert TenureRelationship.objects.all().count() == 6
+
+        job.refresh_from_db()
+        assert job.rows_imported == 10
+        assert job.line_num == 11
+
+    def test_run_job(self):
+        path = os.path.join(settings.MEDIA_ROOT, 'temp', 'job.csv')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copy(self.path + self.valid_csv, path)
+        job = self._create_job(path)
+        jobs.run(job)
+
+        job.refresh_from_db()
+        assert job.status == 'completed'
+        assert job.total_rows == 10
+        assert job.rows_imported == 10
+        assert job.rows_per_second is not None
+        assert Party.objects.all().count() == 10
+        assert not os.path.exists(path)
+
+    def test_run_validate_only_job(self):
+        path = os.path.join(settings.MEDIA_ROOT, 'temp', 'job.csv')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copy(self.path + self.valid_csv, path)
+        job = self._create_job(path)
+        job.validate_only = True
+        job.config['geometry_field'] = 'name_of_hh'
+        job.save()
+        jobs.run(job)
+
+        job.refresh_from_db()
+        assert job.status == 'completed'
+        assert job.validation_errors == [
+            [line_num, 'Invalid geometry.'] for line_num in range(2, 12)]
+        assert job.rows_imported == 0
+        assert Party.objects.all().count() == 0
+        assert not os.path.exists(path)
+
+    def test_run_job_with_error(self):
+        job = self._create_job(self.path + self.valid_csv)
+        job.config['party_type_field'] = 'unknown'
+        job.save()
+        with pytest.raises(exceptions.DataImportError):
+            jobs.run(job)
+
+        job.refresh_from_db()
+        assert job.status == 'failed'
+        assert job.error_line == 2
+        assert job.can_resume
+        assert Party.objects.all().count() == 0
+
     def test_import_parties_only(self):
         importer = csv.CSVImporter(
             project=self.project, path=self.path + self.valid_csv)
@@ -564,6 +801,76 @@ class CSVImportTest(UserTestCase, FileStorageTestCase, TestCase):
         self._run_import_test(self.test_wkb)
 
 
+@pytest.mark.usefixtures('clear_temp')
+@override_settings(IMPORT_WORKERS=2)
+class ImportJobWorkerTest(UserTestCase, FileStorageTestCase,
+                          TransactionTestCase):
+    """Runs import jobs on the worker threads, as in production."""
+    serialized_rollback = True
+
+    def setUp(self):
+        super().setUp()
+        self.project = ProjectFactory.create(name='Test Worker Import')
+        xlscontent = self.get_file(
+            '/organization/tests/files/uttaran_test.xlsx', 'rb')
+        form = self.storage.save('xls-forms/uttaran_test.xlsx',
+                                 xlscontent.read())
+        xlscontent.close()
+        Questionnaire.objects.create_from_form(
+            xls_form=form,
+            project=self.project
+        )
+        self.path_csv = os.path.join(settings.MEDIA_ROOT, 'temp', 'job.csv')
+        os.makedirs(os.path.dirname(self.path_csv), exist_ok=True)
+        shutil.copy(self.path + '/organization/tests/files/test.csv',
+                    self.path_csv)
+
+    def tearDown(self):
+        jobs.pool.shutdown()
+        super().tearDown()
+
+    def test_submit(self):
+        job = ImportJob.objects.create(
+            project=self.project, user=UserFactory.create(), config={
+                'file': self.path_csv,
+                'type': 'csv',
+                'entity_types': ['PT'],
+                'party_name_field': 'name_of_hh',
+                'party_type_field': 'party_type',
+                'attributes': [],
+            })
+        with transaction.atomic():
+            jobs.submit(job)
+            # The job is queued once the transaction is committed
+            assert jobs.pool._executor is None
+        jobs.pool.shutdown()
+
+        job.refresh_from_db()
+        assert job.status == 'completed'
+        assert job.rows_imported == 10
+        assert Party.objects.filter(project=self.project).count() == 10
+        assert not os.path.exists(self.path_csv)
+
+    def test_submit_with_error(self):
+        job = ImportJob.objects.create(
+            project=self.project, user=UserFactory.create(), config={
+                'file': self.path_csv,
+                'type': 'csv',
+                'entity_types': ['PT'],
+                'party_name_field': 'name_of_hh',
+                'party_type_field': 'unknown',
+                'attributes': [],
+            })
+        # Errors are recorded on the job instead of raised
+        jobs.submit(job)
+        jobs.pool.shutdown()
+
+        job.refresh_from_db()
+        assert job.status == 'failed'
+        assert job.error_line == 2
+        assert Party.objects.filter(project=self.project).count() == 0
+
+
 class XLSImportTest(UserTestCase, FileStorageTestCase, TestCase):
 
     def setUp(self):
@@ -614,6 +921,27 @@ class XLSImportTest(UserTestCase, FileStorageTestCase, TestCase):
             self.tenure_attributes
         )
 
+    def test_validate_data(self):
+        importer = xls.XLSImporter(
+            project=self.project, path=self.path + self.valid_xls)
+        config = {
+            'file': self.path + self.valid_xls,
+            'type': 'xls',
+            'entity_types': ['SU', 'PT'],
+            'party_name_field': 'name',
+            'party_type_field': 'type',
+            'location_type_field': 'type',
+            'geometry_field': 'geometry.ewkt',
+            'attributes': self.attributes,
+            'project': self.project
+        }
+        assert importer.validate_data(config) == []
+
+        config['geometry_field'] = 'type'
+        errors = importer.validate_data(config)
+        assert errors == [
+            (line_num, 'Invalid geometry.') for line_num in range(2, 12)]
+
     def test_import_data(self):
         importer = xls.XLSImporter(
             project=self.project, path=self.path + self.valid_xls)
@@ -765,38 +1093,97 @@ class XLSImportTest(UserTestCase, FileStorageTestCase, TestCase):
         assert party.tenure_relationships.all().count() == 3
 
     def test_missing_relationship_tab(self):
-        df = pd.read_excel(self.path + self.valid_xls, sheetname=None)
-        del df['relationships']
+        workbook = load_workbook(self.path + self.valid_xls)
+        workbook.remove_sheet(workbook['relationships'])
         entity_types = ['SU', 'PT']
         with pytest.raises(exceptions.DataImportError) as e:
-            xls.get_csv_from_dataframe(df, entity_types)
+            xls.join_worksheets(workbook, entity_types)
         assert e is not None
         assert str(e.value) == (
             "Error importing file: Missing 'relationships' worksheet."
         )
 
     def test_empty_party_data(self):
-        df = pd.read_excel(self.path + self.valid_xls, sheetname=None)
-        empty_parties = pd.DataFrame()
-        df['parties'] = empty_parties
+        workbook = load_workbook(self.path + self.valid_xls)
+        workbook.remove_sheet(workbook['parties'])
+        workbook.create_sheet(title='parties')
         entity_types = ['SU', 'PT']
         with pytest.raises(exceptions.DataImportError) as e:
-            xls.get_csv_from_dataframe(df, entity_types)
+            xls.join_worksheets(workbook, entity_types)
         assert e is not None
         assert str(e.value) == (
             'Error importing file: Empty worksheet.'
         )
 
     def test_invalid_entity_type(self):
-        df = pd.read_excel(self.path + self.valid_xls, sheetname=None)
+        workbook = load_workbook(self.path + self.valid_xls)
         entity_types = ['INVALID']
         with pytest.raises(exceptions.DataImportError) as e:
-            xls.get_csv_from_dataframe(df, entity_types)
+            xls.join_worksheets(workbook, entity_types)
         assert e is not None
         assert str(e.value) == (
             'Error importing file: Unsupported import format.'
         )
 
+    def test_join_worksheets(self):
+        workbook = load_workbook(self.path + self.one_to_many_xls,
+                                 read_only=True)
+        headers, rows = xls.join_worksheets(workbook, ['SU', 'PT'])
+        rows = list(rows)
+        assert 'spatialunit::id' not in headers
+        assert 'party::id' not in headers
+        assert 'tenurerelationship::tenure_type.label' not in headers
+        assert 'tenurerelationship::tenure_type' in headers
+        assert all(len(row) == len(headers) for row in rows)
+        # 6 relationships, 4 locations and 6 parties without relationships
+        assert len(rows) == 16
+
+    def test_join_worksheets_keeps_every_party(self):
+        workbook = Workbook()
+        workbook.remove_sheet(workbook.active)
+        sheets = {
+            'locations': [('id', 'type'), ('su1', 'PA')],
+            'relationships': [
+                ('spatial_unit_id', 'party_id', 'tenure_type.id'),
+                ('su1', 'p1', 'CU'),
+            ],
+            'parties': [
+                ('id', 'name', 'type'),
+                ('p1', 'Party One', 'IN'),
+                ('', 'No ID One', 'IN'),
+                ('p1', 'Party One Again', 'IN'),
+                ('', 'No ID Two', 'GR'),
+            ],
+        }
+        for title, rows in sheets.items():
+            worksheet = workbook.create_sheet(title=title)
+            for row in rows:
+                worksheet.append(row)
+
+        headers, rows = xls.join_worksheets(workbook, ['SU', 'PT'])
+        names = [row[headers.index('party::name')] for row in rows]
+        # Both parties with ID p1 are joined to the relationship, and the
+        # parties without an ID are kept unjoined
+        assert names == [
+            'Party One', 'Party One Again', 'No ID One', 'No ID Two']
+
+    def test_open_workbook_closes_file(self):
+        importer = xls.XLSImporter(
+            project=self.project, path=self.path + self.valid_xls)
+        with importer.open_workbook() as workbook:
+            archive = workbook._archive
+            assert archive.fp is not None
+        assert archive.fp is None
+
+    def test_get_header_map_reads_workbook_once(self):
+        importer = xls.XLSImporter(
+            project=self.project, path=self.path + self.valid_xls)
+        with patch.object(importer, 'open_workbook',
+                          wraps=importer.open_workbook) as open_workbook:
+            importer.get_attribute_map('xls', ['SU', 'PT'])
+            importer.get_headers()
+        assert open_workbook.call_count == 1
+
 
 class ImportConditionalAttributesTest(UserTestCase, FileStorageTestCase,
                                       TestCase):
@@ -1,5 +1,8 @@
+from datetime import timedelta
+
 from django.conf import settings
 from django.test import TestCase
+from django.utils.timezone import now
 
 from tutelary.models import Policy
 
@@ -8,7 +11,7 @@ from accounts.tests.factories import UserFactory
 from geography import load as load_countries
 from spatial.tests.factories import SpatialUnitFactory
 from .factories import OrganizationFactory, ProjectFactory
-from ..models import OrganizationRole, ProjectRole
+from ..models import ExportJob, ImportJob, OrganizationRole, ProjectRole
 
 PERMISSIONS_DIR = settings.BASE_DIR + '/permissions/'
 
@@ -273,3 +276,95 @@ class ProjectRoleTest(UserTestCase, TestCase):
         self._has('PU', state=True)
         ProjectRole.objects.get(project=self.project, user=self.user).delete()
         self._has('PU', state=False)
+
+
+class ImportJobTest(TestCase):
+    def test_repr(self):
+        project = ProjectFactory.build(slug='prj')
+        job = ImportJob(id='abc123', project=project, status='running',
+                        line_num=1001)
+        assert repr(job) == ('<ImportJob id=abc123 project=prj'
+                             ' status=running line_num=1001>')
+
+    def test_progress(self):
+        started = now()
+        job = ImportJob(status='running', total_rows=5000,
+                        rows_imported=3000, started_rows=1000,
+                        started=started,
+                        last_updated=started + timedelta(seconds=10))
+        assert job.rows_per_second == 200
+        assert job.eta == 10
+
+    def test_progress_before_first_checkpoint(self):
+        started = now()
+        job = ImportJob(status='running', total_rows=5000,
+                        started=started, last_updated=started)
+        assert job.rows_per_second is None
+        assert job.eta is None
+
+    def test_can_resume(self):
+        job = ImportJob(status='failed', last_updated=now())
+        assert job.can_resume
+
+        job.status = 'running'
+        assert not job.can_resume
+
+        job.last_updated = now() - timedelta(
+            seconds=settings.IMPORT_JOB_TIMEOUT + 1)
+        assert job.can_resume
+
+        job.status = 'completed'
+        assert not job.can_resume
+
+    def test_claim(self):
+        job = ImportJob.objects.create(
+            project=ProjectFactory.create(), user=UserFactory.create(),
+            status='failed')
+        other = ImportJob.objects.get(id=job.id)
+
+        assert job.claim()
+        assert job.status == 'pending'
+        # The job changed since the other request read it
+        assert not other.claim()
+
+    def test_save_checkpoint_of_claimed_job(self):
+        job = ImportJob.objects.create(
+            project=ProjectFactory.create(), user=UserFactory.create(),
+            status='running', started=now() - timedelta(hours=1))
+        ImportJob.objects.filter(id=job.id).update(
+            last_updated=now() - timedelta(hours=1))
+        stale_run = ImportJob.objects.get(id=job.id)
+        assert stale_run.is_stale
+
+        assert stale_run.save_checkpoint(11, 10, {}, {})
+        stale_run.refresh_from_db()
+        assert not stale_run.is_stale
+        assert stale_run.line_num == 11
+
+        ImportJob.objects.filter(id=job.id).update(
+            last_updated=now() - timedelta(hours=1))
+        job.refresh_from_db()
+        assert job.claim()
+        assert not stale_run.save_checkpoint(21, 10, {}, {})
+        job.refresh_from_db()
+        assert job.line_num == 11
+        assert job.rows_imported == 10
+
+
+class ExportJobTest(TestCase):
+    def test_repr(self):
+        project = ProjectFactory.build(slug='prj')
+        job = ExportJob(id='abc123', project=project, type='xls',
+                        status='pending')
+        assert repr(job) == ('<ExportJob id=abc123 project=prj'
+                             ' type=xls status=pending>')
+
+    def test_is_stale(self):
+        job = ExportJob(status='running', last_updated=now())
+        assert not job.is_stale
+        job.last_updated = now() - timedelta(hours=1)
+        assert job.is_stale
+        job.status = 'pending'
+        assert job.is_stale
+        job.status = 'completed'
+        assert not job.is_stale
@@ -1,7 +1,10 @@
 import json
 import os
+import shutil
+from datetime import timedelta
 
 import pytest
+from unittest.mock import patch
 
 from accounts.tests.factories import UserFactory
 from core.tests.utils.cases import FileStorageTestCase, UserTestCase
@@ -15,9 +18,11 @@ from django.core.urlresolvers import reverse
 from django.http import Http404, HttpRequest
 from django.template.loader import render_to_string
 from django.test import TestCase
+from django.utils.timezone import now
 from jsonattrs.models import Attribute, Schema
 from skivvy import remove_csrf
-from organization.models import OrganizationRole, Project, ProjectRole
+from organization.models import (ExportJob, ImportJob, OrganizationRole,
+                                 Project, ProjectRole)
 from party.models import Party, TenureRelationship
 from party.tests.factories import PartyFactory
 from questionnaires.models import Questionnaire
@@ -1432,6 +1437,15 @@ class ProjectDataDownloadTest(ViewTestCase, UserTestCase, TestCase):
                 'application/vnd.openxmlformats-officedocument.'
                 'spreadsheetml.sheet')
 
+    def test_post_shp_with_authorized_user(self):
+        assign_policies(self.user)
+        response = self.request(user=self.user, method='POST',
+                                post_data={'type': 'shp'})
+        assert response.status_code == 200
+        assert (response.headers['content-disposition'][1] ==
+                'attachment; filename={}.zip'.format(self.project.slug))
+        assert response.headers['content-type'][1] == 'application/zip'
+
     def test_post_with_unauthorized_user(self):
         response = self.request(user=self.user, method='POST')
         assert response.status_code == 302
@@ -1444,6 +1458,99 @@ class ProjectDataDownloadTest(ViewTestCase, UserTestCase, TestCase):
         assert '/account/login/' in response.location
 
 
+class ProjectDataDownloadJobTest(ViewTestCase, UserTestCase, TestCase):
+    view_class = default.ProjectDataDownloadJob
+    template = 'organization/project_download_status.html'
+
+    def setup_models(self):
+        ensure_dirs()
+        self.project = ProjectFactory.create()
+        self.user = UserFactory.create()
+        self.job = ExportJob.objects.create(
+            project=self.project, user=self.user, type='xls',
+            version='v1', status='running')
+
+    def setup_url_kwargs(self):
+        return {
+            'organization': self.project.organization.slug,
+            'project': self.project.slug,
+            'job': self.job.id
+        }
+
+    def setup_template_context(self):
+        return {'project': self.project,
+                'object': self.project,
+                'job': self.job,
+                'is_allowed_import': True}
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(os.path.join(settings.MEDIA_ROOT, 'exports'),
+                      ignore_errors=True)
+
+    def test_get_with_authorized_user(self):
+        assign_policies(self.user)
+        response = self.request(user=self.user)
+        assert response.status_code == 200
+        assert response.content == self.expected_content
+
+    def test_get_completed_job(self):
+        assign_policies(self.user)
+        self.job.status = 'completed'
+        self.job.save()
+        path = os.path.join(settings.MEDIA_ROOT, 'temp', 'export.xlsx')
+        with open(path, 'wb') as f:
+            f.write(b'xlsx')
+        store = default.export_jobs.store
+        store.put(store.get_key(self.project, 'xls', 'v1'), '.xlsx', path)
+
+        response = self.request(user=self.user)
+        assert response.status_code == 200
+        assert (response.headers['content-disposition'][1] ==
+                'attachment; filename={}.xlsx'.format(self.project.slug))
+
+    def test_get_evicted_job(self):
+        assign_policies(self.user)
+        self.job.status = 'completed'
+        self.job.save()
+
+        response = self.request(user=self.user)
+        assert response.status_code == 302
+        new_job = ExportJob.objects.exclude(id=self.job.id).get()
+        assert new_job.status == 'completed'
+        assert response.location == reverse(
+            'organization:project-download-job',
+            kwargs={'organization': self.project.organization.slug,
+                    'project': self.project.slug,
+                    'job': new_job.id})
+
+    def test_get_stale_job(self):
+        assign_policies(self.user)
+        ExportJob.objects.filter(id=self.job.id).update(
+            last_updated=now() - timedelta(hours=1))
+
+        response = self.request(user=self.user)
+        assert response.status_code == 302
+        new_job = ExportJob.objects.exclude(id=self.job.id).get()
+        assert new_job.status == 'completed'
+        assert response.location == reverse(
+            'organization:project-download-job',
+            kwargs={'organization': self.project.organization.slug,
+                    'project': self.project.slug,
+                    'job': new_job.id})
+
+    def test_get_with_unauthorized_user(self):
+        response = self.request(user=self.user)
+        assert response.status_code == 302
+        assert ("You don't have permission to download data from this project"
+                in response.messages)
+
+    def test_get_with_unauthenticated_user(self):
+        response = self.request()
+        assert response.status_code == 302
+        assert '/account/login/' in response.location
+
+
 @pytest.mark.usefixtures('make_dirs')
 @pytest.mark.usefixtures('clear_temp')
 class ProjectDataImportTest(UserTestCase, FileStorageTestCase, TestCase):
@@ -1646,6 +1753,18 @@ class ProjectDataImportTest(UserTestCase, FileStorageTestCase, TestCase):
             if su.geometry is not None:
                 assert type(su.geometry) is Point
 
+        # test import job
+        job = ImportJob.objects.get(project=proj)
+        assert job.status == 'completed'
+        assert select_defaults_response['location'] == reverse(
+            'organization:project-import-status',
+            kwargs={'organization': self.org.slug,
+                    'project': self.project.slug,
+                    'job': job.id})
+        assert job.user == self.user
+        assert job.rows_imported == 10
+        assert not os.path.exists(job.config['file'])
+
         # test resource creation
         resource = Resource.objects.filter(project_id=proj.pk).first()
         assert resource.original_file == 'test.csv'
@@ -1719,6 +1838,84 @@ class ProjectDataImportTest(UserTestCase, FileStorageTestCase, TestCase):
         resource = Resource.objects.filter(project_id=proj.pk).first()
         assert resource.original_file == 'test_download.xlsx'
 
+    def test_full_flow_validate_only(self):
+        self.client.force_login(self.user)
+        csvfile = self.get_file(self.valid_csv, 'rb')
+        file = SimpleUploadedFile('test.csv', csvfile.read(), 'text/csv')
+        csvfile.close()
+        url = reverse('organization:project-import',
+                      kwargs={
+                          'organization': self.org.slug,
+                          'project': self.project.slug})
+        post_data = self.SELECT_FILE_POST_DATA.copy()
+        post_data['select_file-file'] = file
+        response = self.client.post(url, post_data)
+        assert response.status_code == 200
+        response = self.client.post(url, self.MAP_ATTRIBUTES_POST_DATA)
+        assert response.status_code == 200
+
+        defaults_post_data = self.SELECT_DEFAULTS_POST_DATA.copy()
+        defaults_post_data['select_defaults-geometry_field'] = 'name_of_hh'
+        defaults_post_data['validate_only'] = '1'
+        response = self.client.post(url, defaults_post_data)
+        assert response.status_code == 200
+        content = response.content.decode('utf-8')
+        assert 'Found 10 errors in the import file.' in content
+        assert 'Line 2:' in content
+        assert response.context_data['validation_errors'][0] == (
+            2, 'Invalid geometry.')
+        assert Party.objects.filter(project=self.project).count() == 0
+        # The file was validated in an import job, which imported nothing
+        job = ImportJob.objects.get(project=self.project)
+        assert job.validate_only
+        assert job.status == 'completed'
+        assert len(job.validation_errors) == 10
+        assert not os.path.exists(job.config['file'])
+
+        defaults_post_data = self.SELECT_DEFAULTS_POST_DATA.copy()
+        defaults_post_data['validate_only'] = '1'
+        response = self.client.post(url, defaults_post_data)
+        assert response.status_code == 200
+        assert response.context_data['validation_errors'] == []
+        assert ('No errors found in the import file.' in
+                response.content.decode('utf-8'))
+
+        response = self.client.post(url, self.SELECT_DEFAULTS_POST_DATA)
+        assert response.status_code == 302
+        assert Party.objects.filter(project=self.project).count() == 10
+        assert ImportJob.objects.filter(
+            project=self.project, validate_only=False).count() == 1
+
+    def test_validate_only_in_background(self):
+        self.client.force_login(self.user)
+        csvfile = self.get_file(self.valid_csv, 'rb')
+        file = SimpleUploadedFile('test.csv', csvfile.read(), 'text/csv')
+        csvfile.close()
+        url = reverse('organization:project-import',
+                      kwargs={
+                          'organization': self.org.slug,
+                          'project': self.project.slug})
+        post_data = self.SELECT_FILE_POST_DATA.copy()
+        post_data['select_file-file'] = file
+        self.client.post(url, post_data)
+        self.client.post(url, self.MAP_ATTRIBUTES_POST_DATA)
+
+        defaults_post_data = self.SELECT_DEFAULTS_POST_DATA.copy()
+        defaults_post_data['validate_only'] = '1'
+        # The job is queued on a worker instead of running in the request
+        with patch('organization.importers.jobs.submit') as submit:
+            response = self.client.post(url, defaults_post_data)
+        assert response.status_code == 200
+        job = ImportJob.objects.get(project=self.project)
+        submit.assert_called_once_with(job)
+        assert job.status == 'pending'
+        content = response.content.decode('utf-8')
+        assert 'The import file is being validated.' in content
+        assert reverse('organization:project-import-job', kwargs={
+            'organization': self.org.slug,
+            'project': self.project.slug,
+            'job': job.id}) in content
+
     def test_full_flow_invalid_value(self):
         self.client.force_login(self.user)
         csvfile = self.get_file(self.invalid_csv, 'rb')
@@ -1760,6 +1957,9 @@ class ProjectDataImportTest(UserTestCase, FileStorageTestCase, TestCase):
         assert SpatialUnit.objects.filter(project_id=proj.pk).count() == 0
         assert TenureRelationship.objects.filter(
             project_id=proj.pk).count() == 0
+        job = ImportJob.objects.get(project=proj)
+        assert job.status == 'failed'
+        assert job.can_resume
 
     def test_full_flow_invalid_file_type(self):
         self.client.force_login(self.user)
@@ -1922,3 +2122,195 @@ class ProjectDataImportTest(UserTestCase, FileStorageTestCase, TestCase):
         for su in SpatialUnit.objects.filter(project_id=proj.pk).all():
             if su.geometry is not None:
                 assert type(su.geometry) is Point
+
+
+@pytest.mark.usefixtures('clear_temp')
+class ProjectDataImportJobTest(ViewTestCase, UserTestCase,
+                               FileStorageTestCase, TestCase):
+    view_class = default.ProjectDataImportJob
+
+    def setup_models(self):
+        self.project = ProjectFactory.create()
+        self.user = UserFactory.create()
+        self.job = ImportJob.objects.create(
+            project=self.project, user=self.user, status='running',
+            total_rows=100, rows_imported=40, line_num=41,
+            config={
+                'type': 'csv',
+                'entity_types': ['PT'],
+                'party_name_field': 'name_of_hh',
+                'party_type_field': 'party_type',
+                'attributes': [],
+            })
+
+    def setup_url_kwargs(self):
+        return {
+            'organization': self.project.organization.slug,
+            'project': self.project.slug,
+            'job': self.job.id
+        }
+
+    def test_get_with_authorized_user(self):
+        assign_policies(self.user)
+        response = self.request(user=self.user)
+        assert response.status_code == 200
+
+        status = json.loads(response.content)
+        assert status['id'] == self.job.id
+        assert status['status'] == 'running'
+        assert status['total_rows'] == 100
+        assert status['rows_imported'] == 40
+        assert status['line_num'] == 41
+        assert status['can_resume'] is False
+
+    def test_get_with_unauthorized_user(self):
+        response = self.request(user=self.user)
+        assert response.status_code == 302
+        assert ("You don't have permission to import data to this project"
+                in response.messages)
+
+    def test_get_with_unauthenticated_user(self):
+        response = self.request()
+        assert response.status_code == 302
+        assert '/account/login/' in response.location
+
+    def test_get_job_of_other_project(self):
+        assign_policies(self.user)
+        job = ImportJob.objects.create(project=ProjectFactory.create(),
+                                       user=self.user)
+        with pytest.raises(Http404):
+            self.request(user=self.user, url_kwargs={'job': job.id})
+
+    def test_post_resumes_failed_job(self):
+        assign_policies(self.user)
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'temp'),
+                    exist_ok=True)
+        path = os.path.join(settings.MEDIA_ROOT, 'temp', 'job.csv')
+        shutil.copy(self.path + '/organization/tests/files/test.csv', path)
+        self.job.config['file'] = path
+        self.job.status = 'failed'
+        self.job.total_rows = None
+        self.job.rows_imported = 0
+        self.job.line_num = 0
+        self.job.save()
+
+        response = self.request(user=self.user, method='POST')
+        assert response.status_code == 202
+        assert json.loads(response.content)['status'] == 'completed'
+        assert Party.objects.filter(project=self.project).count() == 10
+
+    def test_post_with_running_job(self):
+        assign_policies(self.user)
+        response = self.request(user=self.user, method='POST')
+        assert response.status_code == 409
+        self.job.refresh_from_db()
+        assert self.job.status == 'running'
+
+    def test_post_with_claimed_job(self):
+        assign_policies(self.user)
+        self.job.status = 'failed'
+        self.job.save()
+        # Another request resumes the job first
+        with patch('organization.models.ImportJob.claim',
+                   return_value=False):
+            response = self.request(user=self.user, method='POST')
+        assert response.status_code == 409
+        self.job.refresh_from_db()
+        assert self.job.status == 'failed'
+
+
+@pytest.mark.usefixtures('clear_temp')
+class ProjectDataImportStatusTest(ViewTestCase, UserTestCase,
+                                  FileStorageTestCase, TestCase):
+    view_class = default.ProjectDataImportStatus
+    template = 'organization/project_import_status.html'
+
+    def setup_models(self):
+        self.project = ProjectFactory.create()
+        self.user = UserFactory.create()
+        self.job = ImportJob.objects.create(
+            project=self.project, user=self.user, status='running',
+            total_rows=100, rows_imported=40, line_num=41,
+            config={
+                'type': 'csv',
+                'entity_types': ['PT'],
+                'party_name_field': 'name_of_hh',
+                'party_type_field': 'party_type',
+                'attributes': [],
+            })
+
+    def setup_url_kwargs(self):
+        return {
+            'organization': self.project.organization.slug,
+            'project': self.project.slug,
+            'job': self.job.id
+        }
+
+    def setup_template_context(self):
+        return {'project': self.project,
+                'object': self.project,
+                'job': self.job,
+                'is_allowed_import': True}
+
+    def test_get_with_authorized_user(self):
+        assign_policies(self.user)
+        response = self.request(user=self.user)
+        assert response.status_code == 200
+        assert response.content == self.expected_content
+        assert '40 of 100 rows imported.' in response.content
+        assert reverse('organization:project-import-job',
+                       kwargs=self.setup_url_kwargs()) in response.content
+
+    def test_get_failed_job(self):
+        assign_policies(self.user)
+        self.job.status = 'failed'
+        self.job.error = 'Error importing file at line 41: Invalid geometry.'
+        self.job.error_line = 41
+        self.job.save()
+        response = self.request(user=self.user)
+        assert response.status_code == 200
+        assert response.content == self.render_content(job=self.job)
+        assert 'Invalid geometry.' in response.content
+        assert 'Resume import' in response.content
+
+    def test_get_with_unauthorized_user(self):
+        response = self.request(user=self.user)
+        assert response.status_code == 302
+        assert ("You don't have permission to import data to this project"
+                in response.messages)
+
+    def test_get_job_of_other_project(self):
+        assign_policies(self.user)
+        job = ImportJob.objects.create(project=ProjectFactory.create(),
+                                       user=self.user)
+        with pytest.raises(Http404):
+            self.request(user=self.user, url_kwargs={'job': job.id})
+
+    def test_post_resumes_failed_job(self):
+        assign_policies(self.user)
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'temp'),
+                    exist_ok=True)
+        path = os.path.join(settings.MEDIA_ROOT, 'temp', 'job.csv')
+        shutil.copy(self.path + '/organization/tests/files/test.csv', path)
+        self.job.config['file'] = path
+        self.job.status = 'failed'
+        self.job.total_rows = None
+        self.job.rows_imported = 0
+        self.job.line_num = 0
+        self.job.save()
+
+        response = self.request(user=self.user, method='POST')
+        assert response.status_code == 302
+        assert response.location == reverse(
+            'organization:project-import-status',
+            kwargs=self.setup_url_kwargs())
+        self.job.refresh_from_db()
+        assert self.job.status == 'completed'
+        assert Party.objects.filter(project=self.project).count() == 10
+
+    def test_post_with_running_job(self):
+        assign_policies(self.user)
+        response = self.request(user=self.user, method='POST')
+        assert response.status_code == 302
+        self.job.refresh_from_db()
+        assert self.job.status == 'running'
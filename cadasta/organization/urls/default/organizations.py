@@ -65,10 +65,25 @@ urlpatterns = [
         r'^(?P<organization>[-\w]+)/projects/(?P<project>[-\w]+)/download/$',
         default.ProjectDataDownload.as_view(),
         name='project-download'),
+    url(
+        r'^(?P<organization>[-\w]+)/projects/(?P<project>[-\w]+)/download/'
+        r'(?P<job>[-\w]+)/$',
+        default.ProjectDataDownloadJob.as_view(),
+        name='project-download-job'),
     url(
         r'^(?P<organization>[-\w]+)/projects/(?P<project>[-\w]+)/import/$',
         default.ProjectDataImportWizard.as_view(),
         name='project-import'),
+    url(
+        r'^(?P<organization>[-\w]+)/projects/(?P<project>[-\w]+)/import/'
+        r'(?P<job>[-\w]+)/$',
+        default.ProjectDataImportJob.as_view(),
+        name='project-import-job'),
+    url(
+        r'^(?P<organization>[-\w]+)/projects/(?P<project>[-\w]+)/import/'
+        r'(?P<job>[-\w]+)/status/$',
+        default.ProjectDataImportStatus.as_view(),
+        name='project-import-status'),
 
     #
     # MEMBERS
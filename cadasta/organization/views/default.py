@@ -1,4 +1,3 @@
-import importlib
 import os
 from collections import OrderedDict
 
@@ -15,7 +14,7 @@ from django.core.files.storage import DefaultStorage, FileSystemStorage
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.db.models import Sum, When, Case, IntegerField
-from django.http import HttpResponse
+from django.http import FileResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from questionnaires.exceptions import InvalidQuestionnaire
 from questionnaires.models import Questionnaire
@@ -24,8 +23,11 @@ from resources.models import ContentObject, Resource
 from . import mixins
 from .. import messages as error_messages
 from .. import forms
+from ..download import jobs as export_jobs
+from ..importers import jobs
 from ..importers.exceptions import DataImportError
-from ..models import Organization, OrganizationRole, Project, ProjectRole
+from ..models import (ExportJob, ImportJob, Organization, OrganizationRole,
+                      Project, ProjectRole)
 
 
 class OrganizationList(PermissionRequiredMixin, generic.ListView):
@@ -710,18 +712,82 @@ class ProjectDataDownload(mixins.ProjectMixin,
         self.object = self.get_object()
         form = self.get_form()
         if form.is_valid():
-            path, mime_type = form.get_file()
-            filename, ext = os.path.splitext(path)
-            response = HttpResponse(open(path, 'rb'), content_type=mime_type)
-            response['Content-Disposition'] = ('attachment; filename=' +
-                                               self.object.slug + ext)
-            return response
+            type = form.cleaned_data['type']
+            if export_jobs.can_stream(type):
+                job, chunks = export_jobs.stream_export(
+                    self.object, request.user, type)
+                if chunks is not None:
+                    return download_response(self.object, job, chunks)
+            else:
+                job = export_jobs.request_export(
+                    self.object, request.user, type)
+
+            path = export_jobs.get_artifact(job)
+            if path:
+                return download_response(self.object, job, open(path, 'rb'))
+            return redirect('organization:project-download-job',
+                            organization=self.object.organization.slug,
+                            project=self.object.slug,
+                            job=job.id)
+
+
+class ProjectDataDownloadJob(mixins.ProjectMixin,
+                             LoginPermissionRequiredMixin,
+                             mixins.ProjectAdminCheckMixin,
+                             generic.DetailView):
+    """Shows the progress of an export job, and serves the export once it
+    has been built."""
+    template_name = 'organization/project_download_status.html'
+    permission_required = 'project.download'
+    permission_denied_message = error_messages.PROJ_DOWNLOAD
+
+    def get_object(self):
+        return self.get_project()
+
+    def get_job(self):
+        return get_object_or_404(ExportJob,
+                                 project=self.get_project(),
+                                 id=self.kwargs['job'])
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        job = self.get_job()
+        if job.status == 'completed':
+            path = export_jobs.get_artifact(job)
+            if path:
+                return download_response(self.object, job, open(path, 'rb'))
+        if job.status == 'completed' or job.is_stale:
+            # The export was evicted from the cache, or its worker went
+            # away, build it again
+            job = export_jobs.request_export(self.object, request.user,
+                                             job.type)
+            return redirect('organization:project-download-job',
+                            organization=self.object.organization.slug,
+                            project=self.object.slug,
+                            job=job.id)
+
+        context = self.get_context_data(object=self.object, job=job)
+        return self.render_to_response(context)
+
+
+def download_response(project, job, content):
+    """Returns a response sending ``content``, an open export file or an
+    iterator over the chunks of an export, as an attachment."""
+    response = FileResponse(content,
+                            content_type=export_jobs.get_mime_type(job))
+    response['Content-Disposition'] = ('attachment; filename=' +
+                                       project.slug +
+                                       export_jobs.get_extension(job))
+    return response
 
 
 DATA_IMPORT_FORMS = [('select_file', forms.SelectImportForm),
                      ('map_attributes', forms.MapAttributesForm),
                      ('select_defaults', forms.SelectDefaultsForm)]
 
+IMPORT_JOB_STORAGE = FileSystemStorage(
+    location=os.path.join(settings.MEDIA_ROOT, 'imports'))
+
 DATA_IMPORT_TEMPLATES = {
     'select_file': 'organization/project_select_import.html',
     'map_attributes': 'organization/project_attrs_import.html',
@@ -861,29 +927,15 @@ class ProjectDataImportWizard(mixins.ProjectMixin,
         is_resource = form_data[0]['is_resource']
         original_file = form_data[0]['original_file']
         file = form_data[0]['file']
-        type = self.storage.get_step_data(
-            'select_file').get('select_file-type')
-        entity_types = self.storage.get_step_data('select_file').getlist(
-            'select_file-entity_types'
-        )
-        path = self.file_storage.path(file.name)
-        map_attrs_data = self.storage.get_step_data('map_attributes')
         project = self.get_project()
         org = project.organization
-        config_dict = {
-            'project': project,
-            'file': path,
-            'type': type,
-            'entity_types': entity_types.copy(),
-            'party_name_field': form_data[2]['party_name_field'],
-            'party_type_field': form_data[2]['party_type_field'],
-            'location_type_field': form_data[2]['location_type_field'],
-            'geometry_field': form_data[2]['geometry_field'],
-            'attributes': map_attrs_data.getlist('attributes', None),
-        }
 
-        importer = self._get_importer(type, path)
-        importer.import_data(config_dict)
+        path = self._save_job_file(file)
+        config_dict = self._get_import_config(path, form_data[2])
+
+        job = ImportJob.objects.create(
+            project=project, user=self.request.user, config=config_dict)
+        jobs.submit(job)
 
         if is_resource:
             default_storage = DefaultStorage()
@@ -904,11 +956,45 @@ class ProjectDataImportWizard(mixins.ProjectMixin,
             resource.save()
             ContentObject.objects.create(resource=resource,
                                          content_object=resource.project)
-        return redirect('organization:project-dashboard',
+        return redirect('organization:project-import-status',
                         organization=org.slug,
-                        project=project.slug)
+                        project=project.slug,
+                        job=job.id)
+
+    def render_validation(self, form, **kwargs):
+        """Validates the whole import file in an import job, without
+        importing it, and shows the select_defaults step again with the
+        validation job. The step polls the job for the errors found if they
+        are not known yet."""
+        file = self.storage.get_step_files(
+            'select_file')['select_file-file']
+        config = self._get_import_config(
+            self._save_job_file(file), form.cleaned_data)
+        job = ImportJob.objects.create(
+            project=self.get_project(), user=self.request.user,
+            config=config, validate_only=True)
+        try:
+            jobs.submit(job)
+        except DataImportError:
+            # The error has been recorded on the job
+            pass
+
+        importer = self._get_importer(
+            config['type'], self.file_storage.path(file.name))
+        (attr_map,
+            extra_attrs, extra_headers) = importer.get_attribute_map(
+                config['type'], config['entity_types'].copy(), flatten=True)
+        return self.render(
+            form, available_headers=extra_headers,
+            entity_types=config['entity_types'], validation_job=job,
+            validation_errors=[
+                tuple(error) for error in job.validation_errors],
+            **kwargs)
 
     def render_done(self, form, **kwargs):
+        if self.request.POST.get('validate_only'):
+            return self.render_validation(form, **kwargs)
+
         final_forms = OrderedDict()
         # walk through the form list and try to validate the data again.
         for form_key in self.get_form_list():
@@ -945,9 +1031,114 @@ class ProjectDataImportWizard(mixins.ProjectMixin,
         return done_response
 
     def _get_importer(self, type, path):
-        fqn = settings.IMPORTERS.get(type)
-        parts = fqn.rpartition('.')
-        module = importlib.import_module(parts[0])
-        clazz = parts[-1]
-        importer = getattr(module, clazz)
-        return importer(project=self.get_project(), path=path)
+        return jobs.get_importer(type, self.get_project(), path)
+
+    def _save_job_file(self, file):
+        """The wizard removes its uploads at the end of the request, so
+        import jobs work on their own copy of the file."""
+        file.seek(0)
+        ext = file.name[file.name.rfind('.'):]
+        return IMPORT_JOB_STORAGE.path(
+            IMPORT_JOB_STORAGE.save(random_id() + ext, file))
+
+    def _get_import_config(self, path, defaults):
+        select_file_data = self.storage.get_step_data('select_file')
+        map_attrs_data = self.storage.get_step_data('map_attributes')
+        return {
+            'file': path,
+            'type': select_file_data.get('select_file-type'),
+            'entity_types': select_file_data.getlist(
+                'select_file-entity_types'),
+            'party_name_field': defaults['party_name_field'],
+            'party_type_field': defaults['party_type_field'],
+            'location_type_field': defaults['location_type_field'],
+            'geometry_field': defaults['geometry_field'],
+            'attributes': map_attrs_data.getlist('attributes', None),
+        }
+
+
+def resume_import(job):
+    """Resumes the import job, and returns whether it was resumed. Errors
+    of the resumed import are recorded on the job."""
+    try:
+        return jobs.resume(job)
+    except DataImportError:
+        return True
+
+
+class ProjectDataImportStatus(mixins.ProjectMixin,
+                              LoginPermissionRequiredMixin,
+                              mixins.ProjectAdminCheckMixin,
+                              generic.DetailView):
+    """Shows the progress of an import job, which the page polls from
+    ``ProjectDataImportJob``, and the error it failed with. POSTing resumes
+    the job."""
+    template_name = 'organization/project_import_status.html'
+    permission_required = 'project.import'
+    permission_denied_message = error_messages.PROJ_IMPORT
+
+    def get_object(self):
+        return self.get_project()
+
+    def get_job(self):
+        return get_object_or_404(ImportJob,
+                                 project=self.get_project(),
+                                 id=self.kwargs['job'])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['job'] = self.get_job()
+        return context
+
+    def post(self, request, *args, **kwargs):
+        job = self.get_job()
+        if job.can_resume:
+            resume_import(job)
+        return redirect('organization:project-import-status',
+                        organization=job.project.organization.slug,
+                        project=job.project.slug,
+                        job=job.id)
+
+
+class ProjectDataImportJob(mixins.ProjectMixin,
+                           LoginPermissionRequiredMixin,
+                           base_generic.View):
+    """Reports the progress of an import job as JSON. POSTing resumes a
+    failed job from its last checkpoint."""
+    permission_required = 'project.import'
+    permission_denied_message = error_messages.PROJ_IMPORT
+
+    def get_object(self):
+        return get_object_or_404(ImportJob,
+                                 project=self.get_project(),
+                                 id=self.kwargs['job'])
+
+    def get_perms_objects(self):
+        return [self.get_project()]
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(self.get_status(self.get_object()))
+
+    def post(self, request, *args, **kwargs):
+        job = self.get_object()
+        if not job.can_resume or not resume_import(job):
+            return JsonResponse(self.get_status(job), status=409)
+        return JsonResponse(self.get_status(job), status=202)
+
+    def get_status(self, job):
+        rate = job.rows_per_second
+        eta = job.eta
+        return {
+            'id': job.id,
+            'status': job.status,
+            'total_rows': job.total_rows,
+            'rows_imported': job.rows_imported,
+            'line_num': job.line_num,
+            'rows_per_second': round(rate, 1) if rate is not None else None,
+            'eta': round(eta) if eta is not None else None,
+            'error': job.error,
+            'error_line': job.error_line,
+            'can_resume': job.can_resume,
+            'validate_only': job.validate_only,
+            'validation_errors': job.validation_errors,
+        }
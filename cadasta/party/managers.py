@@ -52,3 +52,36 @@ class TenureRelationshipManager(BaseRelationshipManager):
     def get_queryset(self, *args, **kwargs):
         return super().get_queryset(
             *args, **kwargs).select_related('tenure_type')
+
+
+class TenureRelationshipTypeManager(models.Manager):
+    """
+    Manages TenureRelationshipTypes.
+
+    Keeps a per-process cache of all tenure relationship types, in the same
+    way Django's ContentTypeManager does, so that importers and XForm
+    submissions can look them up without hitting the database. The cache
+    is cleared whenever a type is saved or deleted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cache = {}
+
+    def get_all_cached(self):
+        """Returns a dict of all tenure relationship types keyed by ID."""
+        types = self._cache.get(self.db)
+        if types is None:
+            types = dict((t.id, t) for t in self.all())
+            self._cache[self.db] = types
+        return types
+
+    def get_cached(self, id):
+        try:
+            return self.get_all_cached()[id]
+        except KeyError:
+            raise self.model.DoesNotExist(
+                'TenureRelationshipType matching query does not exist.')
+
+    def clear_cache(self):
+        self._cache.clear()
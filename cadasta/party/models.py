@@ -5,6 +5,8 @@ from django.core.urlresolvers import reverse
 from django.conf import settings
 from django.contrib.gis.db import models
 from django.contrib.postgres.fields import JSONField
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.encoding import iri_to_uri
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy as __
@@ -336,6 +338,8 @@ class TenureRelationshipType(models.Model):
     id = models.CharField(max_length=2, primary_key=True)
     label = models.CharField(max_length=200)
 
+    objects = managers.TenureRelationshipTypeManager()
+
     history = HistoricalRecords()
 
     def __repr__(self):
@@ -343,6 +347,12 @@ class TenureRelationshipType(models.Model):
         return repr_string.format(obj=self)
 
 
+@receiver(post_save, sender=TenureRelationshipType)
+@receiver(post_delete, sender=TenureRelationshipType)
+def clear_tenure_relationship_type_cache(sender, **kwargs):
+    TenureRelationshipType.objects.clear_cache()
+
+
 TENURE_RELATIONSHIP_TYPES = (
     ('CR', __('Carbon Rights')),
     ('CO', __('Concessionary Rights')),
@@ -369,8 +379,11 @@ def load_tenure_relationship_types(force=False):
     if force:
         TenureRelationshipType.objects.all().delete()
     existing_ids = TenureRelationshipType.objects.values_list('id', flat=True)
-    return TenureRelationshipType.objects.bulk_create([
+    types = TenureRelationshipType.objects.bulk_create([
         TenureRelationshipType(id=tr_id, label=label)
         for tr_id, label in TENURE_RELATIONSHIP_TYPES
         if tr_id not in existing_ids
     ])
+    # bulk_create does not send post_save
+    TenureRelationshipType.objects.clear_cache()
+    return types
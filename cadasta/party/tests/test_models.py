@@ -328,6 +328,23 @@ class TenureRelationshipTypeTest(UserTestCase, TestCase):
         freehold = TenureRelationshipType.objects.get(id='FH')
         assert freehold.label == 'Freehold'
 
+    def test_get_cached(self):
+        freehold = TenureRelationshipType.objects.get_cached('FH')
+        assert freehold.label == 'Freehold'
+        with self.assertNumQueries(0):
+            assert TenureRelationshipType.objects.get_cached('FH') == freehold
+            assert len(TenureRelationshipType.objects.get_all_cached()) == 18
+        with pytest.raises(TenureRelationshipType.DoesNotExist):
+            TenureRelationshipType.objects.get_cached('XX')
+
+    def test_cache_cleared_on_change(self):
+        TenureRelationshipType.objects.get_all_cached()
+        TenureRelationshipType.objects.create(id='XX', label='New type')
+        assert TenureRelationshipType.objects.get_cached('XX').label == (
+            'New type')
+        TenureRelationshipType.objects.get(id='XX').delete()
+        assert 'XX' not in TenureRelationshipType.objects.get_all_cached()
+
 
 class PartyTenureRelationshipsTest(UserTestCase, TestCase):
     """Test TenureRelationships on Party."""
@@ -13,6 +13,7 @@ from pyxform.errors import PyXFormError
 from pyxform.xls2json import parse_file_to_json
 from .exceptions import InvalidQuestionnaire
 from .messages import MISSING_RELEVANT
+from .schemas import cache_submission_schema
 
 ATTRIBUTE_GROUPS = settings.ATTRIBUTE_GROUPS
 
@@ -223,6 +224,7 @@ class QuestionnaireManager(models.Manager):
                     kwargs={'questionnaire': instance}
                 )
                 project.save()
+                cache_submission_schema(instance)
 
                 # all these errors handled by PyXForm so turning off for now
                 # if errors:
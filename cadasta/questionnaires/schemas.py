@@ -0,0 +1,76 @@
+"""Submission schemas of questionnaires.
+
+The submission schema of a questionnaire maps the names of its question
+groups to the attribute types of the fields in each group, so that the
+answers of a submission are decoded without querying the attribute
+schemas. A questionnaire is not changed once created, so its schema is
+compiled once, when it is created or first needed, and cached by the
+questionnaire id and version without expiring.
+"""
+from django.apps import apps
+from django.core.cache import cache
+
+SCHEMA_KEY_PREFIX = 'questionnaires:submission-schema:'
+
+# Converters of the answers of the attribute types not submitted as strings
+CONVERTERS = {
+    'select_multiple': lambda answer: answer.split(' '),
+}
+
+
+def get_attr_type(question_type):
+    """Returns the attribute type of the fields of the question type, as the
+    attribute schemas of the questionnaire name it."""
+    if question_type == 'SM':
+        return 'select_multiple'
+    Question = apps.get_model('questionnaires', 'Question')
+    return dict(Question.TYPE_CHOICES)[question_type].replace(' ', '_')
+
+
+def build_submission_schema(questionnaire):
+    """Returns ``{group name: {field name: attribute type}}`` for the
+    question groups of the questionnaire, with one query."""
+    Question = apps.get_model('questionnaires', 'Question')
+    questions = Question.objects.filter(
+        questionnaire=questionnaire,
+        question_group__isnull=False,
+    ).select_related('question_group').only(
+        'name', 'type', 'question_group__name')
+
+    schema = {}
+    for question in questions:
+        fields = schema.setdefault(question.question_group.name, {})
+        fields[question.name] = get_attr_type(question.type)
+    return schema
+
+
+def get_schema_key(questionnaire):
+    return '{}{}:{}'.format(
+        SCHEMA_KEY_PREFIX, questionnaire.id, questionnaire.version)
+
+
+def cache_submission_schema(questionnaire):
+    """Compiles the submission schema of the questionnaire into the cache,
+    and returns it."""
+    schema = build_submission_schema(questionnaire)
+    cache.set(get_schema_key(questionnaire), schema, None)
+    return schema
+
+
+def get_submission_schema(questionnaire):
+    """Returns the submission schema of the questionnaire, from the cache
+    unless it was not compiled yet."""
+    schema = cache.get(get_schema_key(questionnaire))
+    if schema is None:
+        schema = cache_submission_schema(questionnaire)
+    return schema
+
+
+def decode_answer(schema, group_name, field_name, answer):
+    """Returns the attribute value of the answer to the field of the
+    group."""
+    attr_type = schema.get(group_name, {}).get(field_name)
+    converter = CONVERTERS.get(attr_type)
+    if converter is None:
+        return answer
+    return converter(answer)
@@ -11,6 +11,7 @@ from .messages import MISSING_RELEVANT
 from .exceptions import InvalidQuestionnaire
 from .validators import validate_questionnaire
 from .managers import fix_labels
+from .schemas import cache_submission_schema
 from . import models
 
 
@@ -277,6 +278,7 @@ class QuestionnaireSerializer(serializers.ModelSerializer):
                 create_groups(question_groups, context)
 
                 project.save()
+                cache_submission_schema(instance)
 
                 return instance
 
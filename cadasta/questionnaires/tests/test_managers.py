@@ -14,6 +14,7 @@ from . import factories
 from .. import models
 from ..managers import create_children, create_options
 from ..messages import MISSING_RELEVANT
+from ..schemas import build_submission_schema, get_submission_schema
 
 
 class CreateChildrenTest(TestCase):
@@ -139,6 +140,11 @@ class QuestionnaireManagerTest(FileStorageTestCase, TestCase):
         assert model.title == 'Question types'
         assert model.original_file == 'original.xls'
 
+        # The submission schema is compiled when the form is created
+        schema = build_submission_schema(model)
+        with self.assertNumQueries(0):
+            assert get_submission_schema(model) == schema
+
     def test_update_from_form(self):
         file = self.get_file(
             '/questionnaires/tests/files/xls-form.xlsx', 'rb')
@@ -0,0 +1,81 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from . import factories
+from .. import schemas
+
+
+class SubmissionSchemaTest(TestCase):
+
+    def setUp(self):
+        self.questionnaire = factories.QuestionnaireFactory.create()
+        party_group = factories.QuestionGroupFactory.create(
+            name='party_attributes_default',
+            questionnaire=self.questionnaire)
+        factories.QuestionFactory.create(
+            name='gender', type='S1',
+            question_group=party_group,
+            questionnaire=self.questionnaire)
+        factories.QuestionFactory.create(
+            name='crops', type='SM',
+            question_group=party_group,
+            questionnaire=self.questionnaire)
+        location_group = factories.QuestionGroupFactory.create(
+            name='location_attributes',
+            questionnaire=self.questionnaire)
+        factories.QuestionFactory.create(
+            name='acquired', type='DT',
+            question_group=location_group,
+            questionnaire=self.questionnaire)
+        factories.QuestionFactory.create(
+            name='party_name', type='TX', question_group=None,
+            questionnaire=self.questionnaire)
+        # Questions of other questionnaires are not in the schema
+        factories.QuestionFactory.create(
+            name='crops', type='TX',
+            question_group__name='party_attributes_default')
+
+    def test_get_attr_type(self):
+        assert schemas.get_attr_type('SM') == 'select_multiple'
+        assert schemas.get_attr_type('S1') == 'select_one'
+        assert schemas.get_attr_type('DT') == 'dateTime'
+
+    def test_build_submission_schema(self):
+        with self.assertNumQueries(1):
+            schema = schemas.build_submission_schema(self.questionnaire)
+        assert schema == {
+            'party_attributes_default': {
+                'gender': 'select_one',
+                'crops': 'select_multiple',
+            },
+            'location_attributes': {
+                'acquired': 'dateTime',
+            },
+        }
+
+    def test_get_submission_schema(self):
+        cache.delete(schemas.get_schema_key(self.questionnaire))
+        schema = schemas.get_submission_schema(self.questionnaire)
+        assert schema == schemas.build_submission_schema(self.questionnaire)
+
+        with self.assertNumQueries(0):
+            assert schemas.get_submission_schema(
+                self.questionnaire) == schema
+
+    def test_schema_key(self):
+        assert schemas.get_schema_key(self.questionnaire) == (
+            'questionnaires:submission-schema:{}:{}'.format(
+                self.questionnaire.id, self.questionnaire.version))
+
+    def test_decode_answer(self):
+        schema = schemas.build_submission_schema(self.questionnaire)
+        assert schemas.decode_answer(
+            schema, 'party_attributes_default', 'crops',
+            'maize beans') == ['maize', 'beans']
+        assert schemas.decode_answer(
+            schema, 'party_attributes_default', 'gender', 'f') == 'f'
+        assert schemas.decode_answer(
+            schema, 'location_attributes', 'crops', 'maize beans'
+        ) == 'maize beans'
+        assert schemas.decode_answer(
+            schema, 'other_group', 'crops', 'maize') == 'maize'
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Resource, ContentObject
+from .models import Resource
 from .fields import ResourceField
 
 
@@ -53,11 +53,10 @@ class AddResourceFromLibraryForm(forms.Form):
     def save(self):
         object_resources = self.content_object.resources.values_list('id',
                                                                      flat=True)
-        for key, value in self.cleaned_data.items():
-            if value and key not in object_resources:
-                ContentObject.objects.create(
-                    resource_id=key,
-                    content_object=self.content_object
-                )
+        Resource.objects.attach(
+            [key for key, value in self.cleaned_data.items()
+             if value and key not in object_resources],
+            self.content_object
+        )
 
         self.content_object.reload_resources()
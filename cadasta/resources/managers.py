@@ -1,3 +1,4 @@
+from core.ids import allocate_ids
 from django.db import models, transaction
 from django.apps import apps
 
@@ -16,3 +17,16 @@ class ResourceManager(models.Manager):
                 )
 
             return resource
+
+    def attach(self, resource_ids, content_object):
+        """Links the resources with ``resource_ids`` to ``content_object``.
+        The IDs of the new content objects are allocated in one batch."""
+        ContentObject = apps.get_model('resources', 'ContentObject')
+        ids = allocate_ids(ContentObject, len(resource_ids))
+        with transaction.atomic():
+            for id, resource_id in zip(ids, resource_ids):
+                ContentObject(
+                    id=id,
+                    resource_id=resource_id,
+                    content_object=content_object
+                ).save(force_insert=True)
@@ -7,7 +7,8 @@ from core.tests.utils.files import make_dirs  # noqa
 from organization.tests.factories import ProjectFactory
 from accounts.tests.factories import UserFactory
 
-from ..models import Resource
+from ..models import ContentObject, Resource
+from .factories import ResourceFactory
 
 
 @pytest.mark.usefixtures('make_dirs')
@@ -33,3 +34,16 @@ class ResourceModelTest(UserTestCase, FileStorageTestCase, TestCase):
         assert content_object.object_id == project.id
         assert content_object.content_type == ContentType.objects.get(
             app_label='organization', model='project')
+
+    def test_attach(self):
+        project = ProjectFactory.create()
+        resources = ResourceFactory.create_batch(3, project=project)
+        resource_ids = [resource.id for resource in resources]
+
+        Resource.objects.attach(resource_ids, project)
+        assert ContentObject.objects.filter(
+            resource_id__in=resource_ids, object_id=project.id).count() == 3
+        assert ContentObject.history.filter(
+            resource_id__in=resource_ids).count() == 3
+        assert sorted(r.id for r in project.resources) == sorted(
+            resource_ids)
@@ -0,0 +1,214 @@
+"""Engines answering the search queries of projects.
+
+``SEARCH_BACKENDS`` lists the backends queried by the project search, in
+order, until one is available. Backends return their results in the
+format of the ES search API, so the pages are rendered the same way
+whichever backend answered.
+
+``ElasticsearchBackend`` queries the project index. ``PostgresBackend``
+matches the text search documents of the entities in the database, using
+the same query grammar: it needs no index to be built and is always up to
+date, but it has no fuzzy matching, phrases match their words in any
+order, and the tenure relationships are only matched on their own fields.
+"""
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext as _
+
+from party.models import Party, TenureRelationship
+from resources.models import Resource
+from spatial.models import SpatialUnit
+from .client import get_client
+from .documents import transform
+from .exceptions import ESUnavailableError
+from .parser import parse_query, split_terms
+
+# Text search documents of the entities of each model, and the condition
+# of the entities that are searched. The documents must be the
+# expressions of the GIN indexes created by the search migrations, for
+# the indexes to be used. The 'simple' configuration neither stems words
+# nor drops stop words, as the documents are in any language.
+DOCUMENTS = OrderedDict((
+    (SpatialUnit, (
+        "to_tsvector('simple', coalesce(type, '') || ' ' || "
+        "coalesce(attributes::text, ''))",
+        None,
+    )),
+    (Party, (
+        "to_tsvector('simple', coalesce(name, '') || ' ' || "
+        "coalesce(type, '') || ' ' || coalesce(attributes::text, ''))",
+        None,
+    )),
+    (TenureRelationship, (
+        "to_tsvector('simple', coalesce(tenure_type_id, '') || ' ' || "
+        "coalesce(attributes::text, ''))",
+        None,
+    )),
+    (Resource, (
+        "to_tsvector('simple', coalesce(name, '') || ' ' || "
+        "coalesce(description, '') || ' ' || "
+        "coalesce(original_file, '') || ' ' || coalesce(mime_type, ''))",
+        'NOT archived',
+    )),
+))
+MODELS_BY_LABEL = {model._meta.label_lower: model for model in DOCUMENTS}
+
+# Relations used to build the search documents of each model
+DOCUMENT_RELATED_FIELDS = {
+    TenureRelationship: ('party',),
+}
+
+
+def get_backends():
+    """Returns the backends of ``SEARCH_BACKENDS``, in order."""
+    return [import_string(path)() for path in settings.SEARCH_BACKENDS]
+
+
+class SearchBackend():
+
+    def search(self, project_id, query, start, size):
+        """Returns a page of the results of the query in the project, in the
+        format of the ES search API, and the timestamp of the index the
+        results were read from, or ``None`` if the results are not read from
+        an index.
+
+        Raises ``SearchUnavailableError`` if the backend cannot answer."""
+        raise NotImplementedError
+
+
+class ElasticsearchBackend(SearchBackend):
+
+    def search(self, project_id, query, start, size):
+        """Queries the ES API based on the UI query string, along with the
+        project type for the index timestamp, in a single multi search
+        request."""
+        body = {
+            'query': parse_query(query),
+            'from': start,
+            'size': size,
+            'sort': {'_score': {'order': 'desc'}},
+        }
+        results, project = get_client().msearch(
+            'project-{}'.format(project_id), [
+                ({'type': ['spatial', 'party', 'resource']}, body),
+                ({'type': ['project']},
+                 {'query': {'match_all': {}}, 'size': 1}),
+            ])
+        if 'error' in results:
+            raise ESUnavailableError('msearch', results['error'])
+        return results, self.get_timestamp(project)
+
+    def get_timestamp(self, response):
+        """Returns the index timestamp from the response of the project type
+        search."""
+        try:
+            return response['hits']['hits'][0]['_source'].get('@timestamp')
+        except (KeyError, IndexError):
+            return _("unknown")
+
+
+class PostgresBackend(SearchBackend):
+
+    def search(self, project_id, query, start, size):
+        """Ranks the entities of the project matching the query with one SQL
+        query, then loads the entities of the page with one query per
+        model."""
+        match, match_params, rank, rank_params = self.get_tsqueries(query)
+
+        selects = []
+        params = []
+        for model, (document, condition) in DOCUMENTS.items():
+            conditions = ['project_id = %s']
+            params.append(model._meta.label_lower)
+            params.extend(rank_params)
+            params.append(project_id)
+            if match:
+                conditions.append('{} @@ {}'.format(document, match))
+                params.extend(match_params)
+            if condition:
+                conditions.append(condition)
+            selects.append(
+                'SELECT %s AS model, id, {rank} AS rank FROM {table} '
+                'WHERE {conditions}'.format(
+                    rank=('ts_rank({}, {})'.format(document, rank)
+                          if rank else '0'),
+                    table=model._meta.db_table,
+                    conditions=' AND '.join(conditions)))
+
+        union = ' UNION ALL '.join(selects)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT model, id, count(*) OVER () FROM ({}) AS results '
+                'ORDER BY rank DESC, id LIMIT %s OFFSET %s'.format(union),
+                params + [size, start])
+            rows = cursor.fetchall()
+            if rows:
+                total = rows[0][2]
+            elif start > 0:
+                cursor.execute(
+                    'SELECT count(*) FROM ({}) AS results'.format(union),
+                    params)
+                total = cursor.fetchone()[0]
+            else:
+                total = 0
+
+        return {'hits': {
+            'total': total,
+            'hits': self.get_hits([row[:2] for row in rows]),
+        }}, None
+
+    def get_tsqueries(self, query):
+        """Returns the SQL and params of the tsquery of the entities that
+        match the query, and of the tsquery ranking them. A SQL string is
+        empty if all the entities match, or are ranked the same."""
+        must_terms, must_not_terms, should_terms = split_terms(query)
+        match = []
+        match_params = []
+        if must_terms:
+            match.append(self.combine(must_terms, '&&', match_params))
+        elif should_terms:
+            # As in ES, should terms are optional if there are must terms
+            match.append(self.combine(should_terms, '||', match_params))
+        if must_not_terms:
+            match.append('(!!{})'.format(
+                self.combine(must_not_terms, '||', match_params)))
+
+        rank = ''
+        rank_params = []
+        if must_terms or should_terms:
+            rank = self.combine(must_terms + should_terms, '||', rank_params)
+        return ' && '.join(match), match_params, rank, rank_params
+
+    def combine(self, terms, operator, params):
+        """Returns the SQL of the tsquery combining the terms with the
+        operator, and adds its params to ``params``. The words of a phrase
+        must all match."""
+        for term in terms:
+            if len(term) > 1 and term[0] == '"' and term[-1] == '"':
+                term = term[1:-1]
+            params.append(term)
+        return '({})'.format(' {} '.format(operator).join(
+            ["plainto_tsquery('simple', %s)"] * len(terms)))
+
+    def get_hits(self, rows):
+        """Returns the search results of the ``(model label, id)`` rows, in
+        order."""
+        ids = defaultdict(list)
+        for label, id in rows:
+            ids[MODELS_BY_LABEL[label]].append(id)
+        entities = {
+            model: model.objects.select_related(
+                *DOCUMENT_RELATED_FIELDS.get(model, ())).in_bulk(model_ids)
+            for model, model_ids in ids.items()
+        }
+
+        hits = []
+        for label, id in rows:
+            entity = entities[MODELS_BY_LABEL[label]].get(id)
+            if entity is not None:
+                hits.append(
+                    transform(entity, base_url=settings.ES_FILE_BASE_URL))
+        return hits
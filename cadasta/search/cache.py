@@ -0,0 +1,92 @@
+"""Cache of rendered search result pages.
+
+Pages are cached by project, normalized query, start, length and index
+timestamp of the project, so the pages of a project are no longer used
+once it is reindexed. The last known index timestamp of each project is
+itself cached for ``SEARCH_TIMESTAMP_CACHE_TIMEOUT`` seconds, so that
+pages can be served without querying Elasticsearch; a reindex is noticed
+once it expires.
+
+Hits and misses are counted in the cache, so the counters are shared by
+all processes using it.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .parser import normalize_query
+
+KEY_PREFIX = 'search:'
+COUNTERS = ('hits', 'misses')
+
+
+class PageCache():
+
+    def __init__(self, alias='default', timeout=None, timestamp_timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+        self.timestamp_timeout = timestamp_timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def timestamp_key(self, project_id):
+        return KEY_PREFIX + 'timestamp:' + project_id
+
+    def page_key(self, project_id, query, start, length, timestamp):
+        digest = hashlib.md5(json.dumps([
+            normalize_query(query), start, length, timestamp,
+        ]).encode()).hexdigest()
+        return KEY_PREFIX + 'page:{}:{}'.format(project_id, digest)
+
+    def get(self, project_id, query, start, length):
+        """Returns the cached page for the latest known index timestamp of
+        the project, or ``None``."""
+        page = None
+        timestamp = self.cache.get(self.timestamp_key(project_id))
+        if timestamp is not None:
+            page = self.cache.get(
+                self.page_key(project_id, query, start, length, timestamp))
+        self.count('misses' if page is None else 'hits')
+        return page
+
+    def set(self, project_id, query, start, length, timestamp, page):
+        """Caches the page of results read from the index at ``timestamp``,
+        which becomes the latest known index timestamp of the project."""
+        if self.timestamp_timeout is None:
+            timestamp_timeout = settings.SEARCH_TIMESTAMP_CACHE_TIMEOUT
+        else:
+            timestamp_timeout = self.timestamp_timeout
+        if self.timeout is None:
+            timeout = settings.SEARCH_CACHE_TIMEOUT
+        else:
+            timeout = self.timeout
+
+        self.cache.set(self.timestamp_key(project_id), timestamp,
+                       timestamp_timeout)
+        self.cache.set(
+            self.page_key(project_id, query, start, length, timestamp),
+            page, timeout)
+
+    def count(self, counter):
+        key = KEY_PREFIX + counter
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # The counter was evicted, or the cache does not store anything
+            pass
+
+    def stats(self):
+        """Returns the numbers of cache hits and misses."""
+        values = self.cache.get_many([KEY_PREFIX + c for c in COUNTERS])
+        return {c: values.get(KEY_PREFIX + c, 0) for c in COUNTERS}
+
+    def reset_stats(self):
+        self.cache.delete_many([KEY_PREFIX + c for c in COUNTERS])
+
+
+page_cache = PageCache()
@@ -0,0 +1,198 @@
+"""Shared client for the Elasticsearch API.
+
+Requests go through one pooled keep-alive ``requests`` session, so search
+requests reuse their connections to ES. A circuit breaker opens after
+consecutive failures: while ES is down, requests fail straight away rather
+than each waiting for the timeout. The latency of every call is logged and
+counted per operation in the client's ``stats``.
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .exceptions import ESUnavailableError
+
+logger = logging.getLogger('search.es')
+
+
+def get_api_url():
+    return '{}://{}:{}'.format(
+        settings.ES_SCHEME, settings.ES_HOST, settings.ES_PORT)
+
+
+class CircuitBreaker():
+    """Opens after ``threshold`` consecutive failures. Calls are refused
+    while the breaker is open; after ``reset_timeout`` seconds one call is
+    let through, which closes the breaker if it succeeds."""
+
+    def __init__(self, threshold, reset_timeout, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at >= self.reset_timeout:
+                # Refuse other calls until this one is done or times out
+                self.opened_at = self.clock()
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = self.clock()
+
+
+class LatencyStats():
+    """Number of calls, errors, and total and maximum latency in seconds
+    of the ES calls of each operation."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.calls = defaultdict(
+                lambda: {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+
+    def record(self, operation, elapsed, ok=True):
+        with self.lock:
+            calls = self.calls[operation]
+            calls['count'] += 1
+            calls['total'] += elapsed
+            calls['max'] = max(calls['max'], elapsed)
+            if not ok:
+                calls['errors'] += 1
+
+    def snapshot(self):
+        """Returns a copy of the stats, with the mean latency of each
+        operation."""
+        with self.lock:
+            return {
+                operation: dict(calls, mean=calls['total'] / calls['count'])
+                for operation, calls in self.calls.items()
+            }
+
+
+class ESClient():
+    """Sends requests to the ES API at ``api_url`` over up to ``pool_size``
+    pooled connections. Settings are used for the arguments not given."""
+
+    def __init__(self, api_url=None, pool_size=None, timeout=None,
+                 breaker=None):
+        if pool_size is None:
+            pool_size = settings.ES_POOL_SIZE
+        if breaker is None:
+            breaker = CircuitBreaker(settings.ES_CIRCUIT_THRESHOLD,
+                                     settings.ES_CIRCUIT_RESET_TIMEOUT)
+
+        self.api_url = api_url or get_api_url()
+        self.timeout = timeout or settings.ES_TIMEOUT
+        self.breaker = breaker
+        self.stats = LatencyStats()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def request(self, method, operation, path, body=None, timeout=None,
+                ndjson=False):
+        """Sends a request to ``path`` of the ES API and returns its JSON
+        response. ``body`` is encoded as JSON, or as newline delimited JSON
+        lines if ``ndjson`` is set.
+
+        Raises ``ESUnavailableError`` if the circuit breaker is open, the
+        request fails or ES returns an error status. Only connection errors
+        and server errors count as failures for the breaker."""
+        if not self.breaker.allow():
+            raise ESUnavailableError(operation, "circuit breaker open")
+
+        if ndjson:
+            data = ''.join(json.dumps(line, sort_keys=True) + '\n'
+                           for line in body)
+            content_type = 'application/x-ndjson'
+        elif body is not None:
+            data = json.dumps(body, sort_keys=True)
+            content_type = 'application/json'
+        else:
+            data = None
+            content_type = 'application/json'
+
+        start = time.monotonic()
+        error = None
+        try:
+            r = self.session.request(
+                method, self.api_url + path, data=data,
+                headers={'content-type': content_type},
+                timeout=timeout or self.timeout)
+        except requests.exceptions.RequestException as e:
+            error = e
+            self.breaker.failure()
+        else:
+            if r.status_code >= 500:
+                self.breaker.failure()
+            else:
+                self.breaker.success()
+            if r.status_code >= 400:
+                error = "status {}".format(r.status_code)
+
+        elapsed = time.monotonic() - start
+        self.stats.record(operation, elapsed, ok=error is None)
+        logger.debug("ES %s %s took %.1f ms%s", operation, path,
+                     elapsed * 1000,
+                     '' if error is None else ': ' + str(error))
+
+        if error is not None:
+            raise ESUnavailableError(operation, error)
+        return r.json()
+
+    def search(self, index, doc_types, body, params='', timeout=None):
+        return self.request(
+            'POST', 'search',
+            '/{}/{}/_search/{}'.format(index, ','.join(doc_types), params),
+            body, timeout=timeout)
+
+    def msearch(self, index, searches, timeout=None):
+        """Runs several searches of ``index`` in one request. ``searches``
+        is a list of ``(header, body)`` tuples; the responses are returned
+        in the same order, and hold an ``error`` key if their search
+        failed."""
+        lines = [line for search in searches for line in search]
+        return self.request(
+            'POST', 'msearch', '/{}/_msearch'.format(index), lines,
+            timeout=timeout, ndjson=True)['responses']
+
+
+_client = None
+
+
+def get_client():
+    """Returns the client shared by the requests of the process."""
+    global _client
+    if _client is None:
+        _client = ESClient()
+    return _client
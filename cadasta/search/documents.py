@@ -0,0 +1,117 @@
+"""Search documents of the entities of the project indexes.
+
+Locations, parties and resources are indexed with their own ES type.
+Tenure relationships are indexed as ``party`` documents holding both the
+party and the relationship, so that a search for a party also finds its
+relationships.
+"""
+import json
+
+from django.utils.timezone import now
+
+from spatial.models import SpatialUnit
+from party.models import Party, TenureRelationship
+from resources.models import Resource
+
+
+def get_timestamp():
+    """Returns the current time in the format of ES ``@timestamp``."""
+    return now().strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def transform(entity, bulk=False, timestamp=None, base_url=''):
+    """Returns the search document of the entity, as returned by the ES
+    search API, or as the action and source lines of the ES bulk API if
+    ``bulk`` is set. ``timestamp`` is the ``@timestamp`` of the document,
+    and ``base_url`` prefixes the URL of resource files.
+
+    Bulk actions set the entity's pk as the document ``_id``, so that
+    indexing the entity again replaces its document."""
+    if timestamp is None:
+        timestamp = get_timestamp()
+
+    if type(entity) is SpatialUnit:
+        source = {
+            'id': entity.id,
+            'type': entity.type,
+            'geometry': {
+                'type': 'geometry',
+                'value': ''.join(
+                    ['{:02X}'.format(x) for x in entity.geometry.ewkb]
+                ),
+            },
+            'attributes': {
+                'type': 'jsonb',
+                'value': json.dumps(dict(entity.attributes), sort_keys=True),
+            },
+            '@timestamp': timestamp,
+        }
+        if bulk:
+            return [{'index': {'_type': 'spatial', '_id': entity.id}}, source]
+        else:
+            return {'_type': 'spatial', '_source': source}
+
+    if type(entity) is Party:
+        source = {
+            'id': entity.id,
+            'name': entity.name,
+            'type': entity.type,
+            'attributes': {
+                'type': 'jsonb',
+                'value': json.dumps(dict(entity.attributes), sort_keys=True),
+            },
+            'tenure_id': None,
+            'tenure_attributes': None,
+            'tenure_partyid': None,
+            'spatial_unit_id': None,
+            'tenure_type_id': None,
+            '@timestamp': timestamp,
+        }
+        if bulk:
+            return [{'index': {'_type': 'party', '_id': entity.id}}, source]
+        else:
+            return {'_type': 'party', '_source': source}
+
+    if type(entity) is TenureRelationship:
+        source = {
+            'id': entity.party.id,
+            'name': entity.party.name,
+            'type': entity.party.type,
+            'attributes': {
+                'type': 'jsonb',
+                'value': json.dumps(dict(entity.party.attributes),
+                                    sort_keys=True),
+            },
+            'tenure_id': entity.id,
+            'tenure_attributes': {
+                'type': 'jsonb',
+                'value': json.dumps(dict(entity.attributes), sort_keys=True),
+            },
+            'tenure_partyid': entity.party.id,
+            'spatial_unit_id': entity.spatial_unit_id,
+            'tenure_type_id': entity.tenure_type_id,
+            '@timestamp': timestamp,
+        }
+        if bulk:
+            return [{'index': {'_type': 'party', '_id': entity.id}}, source]
+        else:
+            return {'_type': 'party', '_source': source}
+
+    if type(entity) is Resource:
+        source = {
+            'id': entity.id,
+            'name': entity.name,
+            'description': entity.description,
+            'file': base_url + entity.file.url,
+            'original_file': entity.original_file,
+            'mime_type': entity.mime_type,
+            'archived': entity.archived,
+            'last_updated': entity.last_updated.isoformat(),
+            'contributor_id': entity.contributor_id,
+            '@timestamp': timestamp,
+        }
+        if bulk:
+            return [{'index': {'_type': 'resource', '_id': entity.id}},
+                    source]
+        else:
+            return {'_type': 'resource', '_source': source}
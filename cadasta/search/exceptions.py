@@ -3,3 +3,25 @@ class NotWgs84EwkbValueError(Exception):
     def __init__(self, value):
         super().__init__("Provided value is not a PostGIS hex EWKB value "
                          "in WGS84 datum: " + value)
+
+
+class ResourceFetchError(Exception):
+
+    def __init__(self, url, error):
+        super().__init__(
+            "Resource file {} could not be fetched: {}".format(url, error))
+
+
+class ResourceMissingError(ResourceFetchError):
+    pass
+
+
+class SearchUnavailableError(Exception):
+    pass
+
+
+class ESUnavailableError(SearchUnavailableError):
+
+    def __init__(self, operation, error):
+        super().__init__(
+            "Elasticsearch {} request failed: {}".format(operation, error))
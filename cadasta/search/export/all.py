@@ -1,30 +1,111 @@
 import os
+import queue
+import threading
 
-from zipfile import ZipFile
+from core.zipstream import write_zip
 
+from .dump import ENTITY_TYPES, get_source
 from .shape import ShapeExporter
 from .xls import XLSExporter
-from .resource import ResourceExporter
+from .resource import MIME_TYPE, ResourceExporter
+
+# Number of batches of entities waiting for each writer
+QUEUE_SIZE = 4
+
+
+class BatchWriter(threading.Thread):
+    """Calls ``write_batch`` with each batch put in its queue, in a thread
+    of its own. Errors are kept until the writer is stopped, and later
+    batches are discarded so the reader is never blocked."""
+
+    def __init__(self, write_batch):
+        super().__init__(daemon=True)
+        self.write_batch = write_batch
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.error = None
+
+    def run(self):
+        while True:
+            batch = self.queue.get()
+            if batch is None:
+                return
+            if self.error is None:
+                try:
+                    self.write_batch(batch)
+                except Exception as e:
+                    self.error = e
+
+    def put(self, batch):
+        if self.error is not None:
+            raise self.error
+        self.queue.put(batch)
+
+    def stop(self):
+        self.queue.put(None)
+        self.join()
 
 
 class AllExporter():
+    """Exports the shapefiles, the spreadsheet and the resources of a dump
+    to a single zip file, reading the dump once.
+
+    Each batch of locations and parties read from the dump is passed to a
+    thread writing the shapefiles and one writing the spreadsheet, while
+    the resources are fetched and added to the zip file. The exporters
+    share the project's schema attributes.
+    """
 
     def __init__(self, project):
         self.project = project
 
     def make_download(self, es_dump_path):
-        shp_exporter = ShapeExporter(self.project, is_standalone=False)
-        xls_exporter = XLSExporter(self.project)
-        res_exporter = ResourceExporter(self.project)
-        shp_dir_path = shp_exporter.make_download(es_dump_path)
-        xls_path, _ = xls_exporter.make_download(es_dump_path)
-        path, mime_type = res_exporter.make_download(es_dump_path)
-
-        with ZipFile(path, 'a') as myzip:
-            myzip.write(xls_path, arcname='data.xlsx')
-            for f in os.listdir(shp_dir_path):
-                myzip.write(os.path.join(shp_dir_path, f),
-                            arcname='shape_files/' + f)
-            myzip.close()
-
-        return path, mime_type
+        source = get_source(es_dump_path)
+        self.shp_exporter = ShapeExporter(self.project, is_standalone=False)
+        self.xls_exporter = XLSExporter(
+            self.project, schema_attrs=self.shp_exporter.schema_attrs)
+        self.res_exporter = ResourceExporter(self.project)
+
+        zip_path = source.base_path + '-res.zip'
+        write_zip(zip_path, self.iter_entries(source))
+        return zip_path, MIME_TYPE
+
+    def iter_entries(self, source):
+        base_path = source.base_path
+        self.shp_exporter.prepare(base_path)
+        self.xls_exporter.create_workbook()
+        writers = [BatchWriter(self.shp_exporter.write_csv_rows_and_shp),
+                   BatchWriter(self.xls_exporter.write_xls_rows)]
+        for writer in writers:
+            writer.start()
+
+        try:
+            yield from self.res_exporter.iter_entries(
+                self.read_dump(source, writers), base_path)
+        finally:
+            for writer in writers:
+                writer.stop()
+        for writer in writers:
+            if writer.error is not None:
+                raise writer.error
+
+        xls_path = base_path + '.xlsx'
+        self.xls_exporter.workbook.save(filename=xls_path)
+        yield 'data.xlsx', xls_path
+        os.remove(xls_path)
+
+        self.shp_exporter.finish()
+        for f, path in self.shp_exporter.consume_files():
+            yield 'shape_files/' + f, path
+        os.rmdir(self.shp_exporter.dir_path)
+
+    def read_dump(self, source, writers):
+        """Passes the locations and parties of the export source to the
+        writers and yields the sources of its resources."""
+        for batch in source.batches(types=ENTITY_TYPES + ('resource',)):
+            entities = [e for e in batch if e[0] != 'resource']
+            if entities:
+                for writer in writers:
+                    writer.put(entities)
+            for kind, entity in batch:
+                if kind == 'resource':
+                    yield entity
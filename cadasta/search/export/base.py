@@ -1,20 +1,18 @@
-import json
 from collections import OrderedDict
 
 from django.contrib.contenttypes.models import ContentType
 
 from core.mixins import SchemaSelectorMixin
-from party.models import TENURE_RELATIONSHIP_TYPES
-from .utils import convert_postgis_ewkb_to_ewkt
-
-tenure_type_choices = {c[0]: c[1] for c in TENURE_RELATIONSHIP_TYPES}
+from .dump import ENTITY_TYPES, decode_entity, get_source, get_type
 
 
 class Exporter(SchemaSelectorMixin):
 
-    def __init__(self, project):
+    def __init__(self, project, schema_attrs=None):
         self.project = project
-        schema_attrs = self.get_attributes(self.project)
+        if schema_attrs is None:
+            schema_attrs = self.get_attributes(self.project)
+        self.schema_attrs = schema_attrs
 
         get_content_type = ContentType.objects.get
         self.metadata = {
@@ -78,40 +76,16 @@ class Exporter(SchemaSelectorMixin):
 
     def process_entity(self, es_type_line, es_source_line, write_callback):
         # Extract ES type and source and skip if not loc/party/rel
-        es_type = json.loads(es_type_line)['index']['_type']
-        if es_type not in ('spatial', 'party'):
+        es_type = get_type(es_type_line)
+        if es_type not in ENTITY_TYPES:
             return
-        source = json.loads(es_source_line)
-
-        # Get corresponding metadatum
-        if es_type == 'spatial':
-            metadatum = self.metadata['location']
-        else:
-            if source['tenure_id']:
-                metadatum = self.metadata['tenure_rel']
-            else:
-                metadatum = self.metadata['party']
-
-        # Reformat data to match model_attrs
-        source['attributes'] = json.loads(source['attributes']['value'])
-        if metadatum['model_name'] == 'SpatialUnit':
-            if source['geometry'] is None:
-                ewkt = ''
-                wkt = ''
-            else:
-                ewkt = convert_postgis_ewkb_to_ewkt(
-                    source['geometry']['value'])
-                wkt = ewkt[10:]  # Remove SRID
-            source['geometry.ewkt'] = ewkt
-            source['geometry.wkt'] = wkt
-        elif metadatum['model_name'] == 'TenureRelationship':
-            source['id'] = source['tenure_id']
-            source['party_id'] = source['tenure_partyid']
-            source['tenure_type.id'] = source['tenure_type_id']
-            source['tenure_type.label'] = str(
-                tenure_type_choices[source['tenure_type_id']])
-            source['attributes'] = json.loads(
-                source['tenure_attributes']['value'])
+        kind, source = decode_entity(es_type, es_source_line)
+        write_callback(source, self.metadata[kind])
 
-        # Call callback
-        write_callback(source, metadatum)
+    def process_dump(self, source, write_batch):
+        """Decodes the entities of ``source``, an export source or the path
+        of a dump file, in batches and calls ``write_batch`` with the list
+        of ``(kind, source)`` tuples of each batch, where ``kind`` is the
+        key of the entity's metadatum."""
+        for batch in get_source(source).batches():
+            write_batch(batch)
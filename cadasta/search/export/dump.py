@@ -0,0 +1,156 @@
+"""Reads Elasticsearch dumps for the search exports.
+
+A dump holds two lines for each entity: an ``index`` action naming its ES
+type and the entity's source document. Locations and parties (including
+tenure relationships) are exported as data, and resources as files. Their
+lines are read in batches and decoded into the sources the exporters
+write: the JSON attributes are parsed and the EWKB geometry is converted
+to WKT.
+
+Decoding is the expensive part, so the batches of large dumps can be
+decoded by a pool of processes while the exporter writes the previous
+ones. The worker processes do not use the database.
+"""
+import os
+import re
+from collections import deque
+from itertools import islice
+
+from core.workers import get_process_pool
+from django.conf import settings
+
+from party.models import TENURE_RELATIONSHIP_TYPES
+from .utils import convert_postgis_ewkb_to_ewkt
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+ENTITY_TYPES = ('spatial', 'party')
+TYPE_PATTERN = re.compile(r'"_type"\s*:\s*"([^"]*)"')
+
+tenure_type_choices = {c[0]: c[1] for c in TENURE_RELATIONSHIP_TYPES}
+
+
+def get_type(type_line):
+    match = TYPE_PATTERN.search(type_line)
+    if match:
+        return match.group(1)
+    return loads(type_line)['index']['_type']
+
+
+def decode_entity(es_type, source_line):
+    return decode_source(es_type, loads(source_line))
+
+
+def decode_source(es_type, source):
+    """Returns ``(kind, source)``: the key of the entity's metadatum in
+    the exporter and its source reformatted to match the model
+    attributes."""
+    if es_type == 'resource':
+        kind = 'resource'
+    elif es_type == 'spatial':
+        kind = 'location'
+        if source['geometry'] is None:
+            ewkt = ''
+            wkt = ''
+        else:
+            ewkt = convert_postgis_ewkb_to_ewkt(source['geometry']['value'])
+            wkt = ewkt[10:]  # Remove SRID
+        source['geometry.ewkt'] = ewkt
+        source['geometry.wkt'] = wkt
+        source['attributes'] = loads(source['attributes']['value'])
+    elif source['tenure_id']:
+        kind = 'tenure_rel'
+        source['id'] = source['tenure_id']
+        source['party_id'] = source['tenure_partyid']
+        source['tenure_type.id'] = source['tenure_type_id']
+        source['tenure_type.label'] = str(
+            tenure_type_choices[source['tenure_type_id']])
+        source['attributes'] = loads(source['tenure_attributes']['value'])
+    else:
+        kind = 'party'
+        source['attributes'] = loads(source['attributes']['value'])
+
+    return kind, source
+
+
+def decode_batch(lines):
+    return [decode_entity(es_type, source_line)
+            for es_type, source_line in lines]
+
+
+def read_batches(es_dump_path, batch_size, types=ENTITY_TYPES):
+    """Yields lists of up to ``batch_size`` ``(es_type, source_line)``
+    tuples for the entities of ``types``. Only the type lines are
+    parsed."""
+    with open(es_dump_path, encoding='utf-8') as f:
+        while True:
+            lines = list(islice(f, 2 * batch_size))
+            if not lines:
+                return
+            batch = []
+            for type_line, source_line in zip(lines[::2], lines[1::2]):
+                es_type = get_type(type_line)
+                if es_type in types:
+                    batch.append((es_type, source_line))
+            yield batch
+
+
+def iter_batches(es_dump_path, workers=None, batch_size=None,
+                 parallel_size=None, types=ENTITY_TYPES):
+    """Yields lists of decoded ``(kind, source)`` tuples for the entities
+    of ``types`` in the dump, in the order of the dump.
+
+    Dumps of at least ``parallel_size`` bytes are decoded by ``workers``
+    processes, with only a few batches queued at any time."""
+    if workers is None:
+        workers = settings.EXPORT_DUMP_WORKERS
+    if batch_size is None:
+        batch_size = settings.EXPORT_DUMP_BATCH_SIZE
+    if parallel_size is None:
+        parallel_size = settings.EXPORT_DUMP_PARALLEL_SIZE
+
+    batches = read_batches(es_dump_path, batch_size, types)
+    if workers < 2 or os.path.getsize(es_dump_path) < parallel_size:
+        for lines in batches:
+            yield decode_batch(lines)
+        return
+
+    pool = get_process_pool(workers)
+    try:
+        pending = deque()
+        for lines in batches:
+            pending.append(pool.apply_async(decode_batch, (lines,)))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class DumpFile():
+    """Export source reading the entities of an ES dump file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.base_path = os.path.splitext(path)[0]
+
+    def batches(self, types=ENTITY_TYPES, workers=None):
+        return iter_batches(self.path, workers=workers, types=types)
+
+
+def get_source(source):
+    """Returns the export source for ``source``, which is either an
+    export source or the path of an ES dump file.
+
+    Export sources have a ``base_path`` that the exporters use to name
+    their files, and a ``batches(types, workers)`` method yielding lists
+    of decoded ``(kind, source)`` tuples for the entities of ``types``.
+    """
+    if isinstance(source, str):
+        return DumpFile(source)
+    return source
@@ -0,0 +1,173 @@
+"""Fetches resource files for exports over pooled HTTP connections.
+
+Files are downloaded by a bounded pool of threads sharing one
+``requests`` session, so connections to the storage backend are reused
+rather than opened for each file. Each body is streamed into a spooled
+temporary file while its MD5 checksum is computed, and is checked against
+the ``Content-Length`` and, for S3 objects, the ``ETag`` of the response.
+Client errors other than 429 (e.g. 403 and 404, which S3 returns for
+missing objects) mean the file is missing, and are not retried.
+"""
+import hashlib
+import re
+import tempfile
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from ..exceptions import ResourceFetchError, ResourceMissingError
+
+CHUNK_SIZE = 64 * 1024
+
+# Files up to this size are held in memory instead of on disk
+SPOOL_SIZE = 1024 * 1024
+
+# Seconds to wait for a connection or for data from the server
+TIMEOUT = 30
+
+# S3 uses the MD5 of an object as its ETag, unless it was uploaded in
+# parts; those ETags end in -<number of parts>
+MD5_ETAG = re.compile(r'^"?([0-9a-f]{32})"?$')
+
+Download = namedtuple('Download', ('file', 'size', 'md5'))
+
+
+class ChecksumError(Exception):
+    pass
+
+
+class RateLimiter():
+    """Token bucket limiting the bytes per second read by all threads.
+
+    Up to one second of data can be read in a burst. A thread that reads
+    more than is available sleeps until the bucket has been refilled.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.available = rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.available = min(
+                self.rate, self.available + (now - self.last) * self.rate)
+            self.last = now
+            self.available -= amount
+            wait = -self.available / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ResourceFetcher():
+
+    def __init__(self, workers=None, attempts=None, bandwidth=None,
+                 backoff=0.5):
+        self.workers = workers or settings.EXPORT_RESOURCE_WORKERS
+        self.attempts = attempts or settings.EXPORT_RESOURCE_ATTEMPTS
+        self.limiter = RateLimiter(
+            bandwidth or settings.EXPORT_RESOURCE_BANDWIDTH)
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url):
+        """Downloads ``url`` and returns a ``Download`` with the body in a
+        temporary file. Connection errors, server errors and bodies that
+        are cut short or fail their checksum are retried, with a growing
+        delay, up to ``attempts`` times. Raises ``ResourceMissingError`` if
+        the server does not have the file."""
+        for attempt in range(self.attempts):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                return self._fetch(url)
+            except requests.HTTPError as e:
+                status_code = e.response.status_code
+                if status_code < 500 and status_code != 429:
+                    raise ResourceMissingError(url, e)
+                error = e
+            except (requests.RequestException, ChecksumError) as e:
+                error = e
+        raise ResourceFetchError(url, error)
+
+    def _fetch(self, url):
+        response = self.session.get(url, stream=True, timeout=TIMEOUT)
+        f = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        md5 = hashlib.md5()
+        size = 0
+        try:
+            response.raise_for_status()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                self.limiter.consume(len(chunk))
+                f.write(chunk)
+                md5.update(chunk)
+                size += len(chunk)
+            check_download(response, size, md5.hexdigest())
+        except Exception:
+            f.close()
+            raise
+        finally:
+            response.close()
+
+        f.seek(0)
+        return Download(f, size, md5.hexdigest())
+
+    def fetch_existing(self, url):
+        """Returns the download of ``url``, or ``None`` if the server does
+        not have the file."""
+        try:
+            return self.fetch(url)
+        except ResourceMissingError:
+            return None
+
+    def fetch_all(self, items, get_url):
+        """Fetches the file of each of ``items`` concurrently and yields
+        ``(item, download)`` tuples in the order of ``items``. ``download``
+        is ``None`` if the file is missing.
+
+        At most twice as many files as there are workers are downloaded
+        or waiting to be consumed at any time. The caller closes the file
+        of each download once it has been read."""
+        with ThreadPoolExecutor(self.workers) as executor:
+            pending = deque()
+            try:
+                for item in items:
+                    pending.append((item, executor.submit(
+                        self.fetch_existing, get_url(item))))
+                    if len(pending) >= 2 * self.workers:
+                        item, future = pending.popleft()
+                        yield item, future.result()
+                while pending:
+                    item, future = pending.popleft()
+                    yield item, future.result()
+            finally:
+                for _, future in pending:
+                    if (not future.cancel() and not future.exception() and
+                            future.result() is not None):
+                        future.result().file.close()
+
+
+def check_download(response, size, md5):
+    if 'Content-Encoding' not in response.headers:
+        length = response.headers.get('Content-Length')
+        if length is not None and int(length) != size:
+            raise ChecksumError(
+                'Expected {} bytes, received {}'.format(length, size))
+
+    match = MD5_ETAG.match(response.headers.get('ETag', ''))
+    if match and match.group(1) != md5:
+        raise ChecksumError(
+            'Expected MD5 {}, received {}'.format(match.group(1), md5))
@@ -1,14 +1,21 @@
-import json
 import os
-import subprocess
 
 from openpyxl import Workbook
-from zipfile import ZipFile
 
+from core.zipstream import write_zip
 from resources.models import ContentObject
+from .dump import get_source
+from .fetch import ResourceFetcher
 
 MIME_TYPE = 'application/zip'
 
+# Number of resources whose links are read with one query
+LINK_CHUNK_SIZE = 1000
+
+# Column of the metadata worksheet listing each type of linked object
+LINK_COLUMNS = {'spatialunit': 0, 'party': 1, 'tenurerelationship': 2}
+NO_LINKS = ((), (), ())
+
 
 class ResourceExporter():
 
@@ -16,84 +23,104 @@ class ResourceExporter():
         self.project = project
 
     def make_download(self, es_dump_path):
-        base_path = os.path.splitext(es_dump_path)[0]
+        source = get_source(es_dump_path)
+        zip_path = source.base_path + '-res.zip'
+        write_zip(zip_path, self.iter_entries(
+            self.read_sources(source), source.base_path))
+        return zip_path, MIME_TYPE
+
+    def read_sources(self, source):
+        for batch in source.batches(types=('resource',), workers=1):
+            for _, source in batch:
+                yield source
+
+    def read_resources(self, sources):
+        """Yields ``(source, links)`` for each of ``sources``. The links of
+        ``LINK_CHUNK_SIZE`` resources are read at a time."""
+        chunk = []
+        for source in sources:
+            chunk.append(source)
+            if len(chunk) == LINK_CHUNK_SIZE:
+                yield from self.resolve_links(chunk)
+                chunk = []
+        yield from self.resolve_links(chunk)
+
+    def resolve_links(self, sources):
+        if not sources:
+            return
+        links = self.get_links([source['id'] for source in sources])
+        for source in sources:
+            yield source, links.get(source['id'], NO_LINKS)
+
+    def get_links(self, resource_ids):
+        """Returns the IDs of the locations, parties and relationships
+        linked to each of ``resource_ids``, read with a single query."""
+        links = {}
+        rows = ContentObject.objects.filter(
+            resource_id__in=resource_ids).values_list(
+                'resource_id', 'content_type__model', 'object_id')
+        for resource_id, model, object_id in rows:
+            column = LINK_COLUMNS.get(model)
+            if column is not None:
+                links.setdefault(resource_id, ([], [], []))[column].append(
+                    object_id)
+        return links
+
+    def iter_entries(self, sources, base_path):
+        """Yields the zip entries of the files of the resources in
+        ``sources``, fetched concurrently from S3, followed by the
+        resources metadata worksheet. The worksheet records the MD5
+        checksum of each file, and which files are missing from S3 and
+        were left out."""
         has_resources = False
 
         # Create worksheet for resources metadata
         workbook = Workbook(write_only=True)
         worksheet = workbook.create_sheet(title='resources')
         worksheet.append(['id', 'name', 'description', 'filename',
-                          'locations', 'parties', 'relationships'])
-
-        # Create temp dir where S3 files will be downloaded
-        dir_path = base_path + '-res-dir'
-        os.makedirs(dir_path)
+                          'locations', 'parties', 'relationships', 'md5',
+                          'missing'])
 
-        # Create zip file and start processing
-        zip_path = base_path + '-res.zip'
+        # Add the files to the zip file in the order of the dump,
+        # ensuring filenames are unique
         filenames = {}
-        with ZipFile(zip_path, 'a') as myzip:
-
-            f = open(es_dump_path, encoding='utf-8')
-            while True:
-                # Read 2 lines in the dump file
-                type_line = f.readline()
-                source_line = f.readline()
-                if not type_line:
-                    break
-
-                # Extract ES type and source and skip if not resource
-                es_type = json.loads(type_line)['index']['_type']
-                if es_type != 'resource':
-                    continue
-                has_resources = True
-                source = json.loads(source_line)
-
-                # Fetch file from S3 using curl and add to zip file
-                # and ensuring filenames are unique
-                temp_resource_path = dir_path + '/' + source['original_file']
-                subprocess.run([
-                    'curl', '-o', temp_resource_path, '-XGET', source['file']
-                ])
-                filename = source['original_file']
-                if filename not in filenames:
-                    filenames[filename] = 1
-                else:
-                    filenames[filename] += 1
-                    basename, ext = os.path.splitext(filename)
-                    filename = '{} ({}){}'.format(
-                        basename, filenames[filename], ext)
-                    source['original_file'] = filename
-                myzip.write(temp_resource_path,
-                            arcname='resources/' + filename)
-
-                self.append_resource_metadata(source, worksheet)
-
-            if has_resources:
-                xls_path = base_path + '-res.xlsx'
-                workbook.save(filename=xls_path)
-                myzip.write(xls_path, arcname='resources.xlsx')
-
-            myzip.close()
-
-        return zip_path, MIME_TYPE
-
-    def append_resource_metadata(self, source, worksheet):
-        location_ids = []
-        party_ids = []
-        tenure_rel_ids = []
-
-        links = ContentObject.objects.filter(
-            resource__id=source['id']).values_list(
-                'content_type__model', 'object_id')
-        for link in links:
-            if link[0] == 'spatialunit':
-                location_ids.append(link[1])
-            elif link[0] == 'party':
-                party_ids.append(link[1])
-            elif link[0] == 'tenurerelationship':
-                tenure_rel_ids.append(link[1])
-
+        fetcher = ResourceFetcher()
+        downloads = fetcher.fetch_all(self.read_resources(sources),
+                                      lambda resource: resource[0]['file'])
+        for (source, links), download in downloads:
+            has_resources = True
+            if download is None:
+                self.append_resource_metadata(source, links, worksheet)
+                continue
+
+            filename = source['original_file']
+            if filename not in filenames:
+                filenames[filename] = 1
+            else:
+                filenames[filename] += 1
+                basename, ext = os.path.splitext(filename)
+                filename = '{} ({}){}'.format(
+                    basename, filenames[filename], ext)
+                source['original_file'] = filename
+            try:
+                yield 'resources/' + filename, download.file
+            finally:
+                download.file.close()
+
+            self.append_resource_metadata(source, links, worksheet, download)
+
+        if has_resources:
+            xls_path = base_path + '-res.xlsx'
+            workbook.save(filename=xls_path)
+            yield 'resources.xlsx', xls_path
+            os.remove(xls_path)
+
+    def append_resource_metadata(self, source, links, worksheet,
+                                 download=None):
+        """Appends the row of a resource to the metadata worksheet.
+        ``download`` is ``None`` if the file of the resource is
+        missing."""
+        location_ids, party_ids, tenure_rel_ids = links
         worksheet.append([
             source['id'],
             source['name'],
@@ -102,4 +129,6 @@ class ResourceExporter():
             ','.join(location_ids),
             ','.join(party_ids),
             ','.join(tenure_rel_ids),
+            download.md5 if download else None,
+            download is None,
         ])
@@ -1,11 +1,12 @@
 import csv
 import os
 
-from zipfile import ZipFile
+from core.zipstream import write_zip
 from osgeo import ogr, osr
 from django.template.loader import render_to_string
 
 from .base import Exporter
+from .dump import get_source
 
 MIME_TYPE = 'application/zip'
 shp_types = {
@@ -20,13 +21,26 @@ shp_types = {
 
 class ShapeExporter(Exporter):
 
-    def __init__(self, project, is_standalone=True):
+    def __init__(self, project, is_standalone=True, schema_attrs=None):
         self.is_standalone = is_standalone
-        super().__init__(project)
+        super().__init__(project, schema_attrs)
 
     def make_download(self, es_dump_path):
-        base_path = os.path.splitext(es_dump_path)[0]
+        source = get_source(es_dump_path)
+        base_path = source.base_path
+        self.prepare(base_path)
+        self.process_dump(source, self.write_csv_rows_and_shp)
+        self.finish()
 
+        if self.is_standalone:
+            zip_path = base_path + '-shp.zip'
+            write_zip(zip_path, self.consume_files())
+            os.rmdir(self.dir_path)
+            return zip_path, MIME_TYPE
+        else:
+            return self.dir_path
+
+    def prepare(self, base_path):
         # CSV files do not need the EWKT geometry
         self.metadata['location']['model_attrs'] = ['id', 'type']
         self.metadata['location']['attr_columns'].pop('geometry.ewkt')
@@ -34,16 +48,7 @@ class ShapeExporter(Exporter):
         self.dir_path = base_path + '-shp-dir'
         self.shp_datasource = self.create_shp_datasource()
 
-        f = open(es_dump_path, encoding='utf-8')
-        while True:
-            # Read 2 lines in the dump file
-            type_line = f.readline()
-            source_line = f.readline()
-            if not type_line:
-                break
-            self.process_entity(
-                type_line, source_line, self.write_csv_row_and_shp)
-
+    def finish(self):
         # Clean up
         for metadatum in self.metadata.values():
             f = metadatum.get('csv_file')
@@ -61,14 +66,13 @@ class ShapeExporter(Exporter):
             f.write(readme_body)
             f.close()
 
-        if self.is_standalone:
-            zip_path = base_path + '-shp.zip'
-            with ZipFile(zip_path, 'a') as myzip:
-                for f in os.listdir(self.dir_path):
-                    myzip.write(os.path.join(self.dir_path, f), arcname=f)
-            return zip_path, MIME_TYPE
-        else:
-            return self.dir_path
+    def consume_files(self):
+        """Yields the files in the export directory as zip entries, removing
+        each one once it has been added."""
+        for f in sorted(os.listdir(self.dir_path)):
+            path = os.path.join(self.dir_path, f)
+            yield f, path
+            os.remove(path)
 
     def create_shp_datasource(self):
         self.shp_layers = {}
@@ -77,6 +81,10 @@ class ShapeExporter(Exporter):
         driver = ogr.GetDriverByName('ESRI Shapefile')
         return driver.CreateDataSource(self.dir_path)
 
+    def write_csv_rows_and_shp(self, batch):
+        for kind, entity in batch:
+            self.write_csv_row_and_shp(entity, self.metadata[kind])
+
     def write_csv_row_and_shp(self, entity, metadatum):
         if self.is_standalone:
             # Create CSV file if not yet created
@@ -0,0 +1,80 @@
+"""Export source paging through search results with the ES scroll API.
+
+Results are read straight from Elasticsearch with the shared ES client
+and decoded in batches for the exporters, so exports are not capped at
+``ES_MAX_RESULTS`` and no dump file is written.
+"""
+from ..client import get_client
+from ..exceptions import ESUnavailableError
+from ..parser import parse_query
+from .dump import ENTITY_TYPES, decode_source
+
+# How long ES keeps the search context between two pages
+SCROLL_TIMEOUT = '1m'
+
+# Number of results read with each request
+PAGE_SIZE = 1000
+
+# Seconds to wait for a connection or for a page of results
+TIMEOUT = 30
+
+
+class SearchSource():
+    """Exports the entities of a project matching the UI search ``query``.
+    ``base_path`` is the path, without extension, of the export files."""
+
+    def __init__(self, project_id, query, base_path, page_size=PAGE_SIZE):
+        self.project_id = project_id
+        self.query = query
+        self.base_path = base_path
+        self.page_size = page_size
+
+    def iter_hits(self):
+        """Yields the ``(es_type, source)`` of each result, requesting
+        each page once the previous one has been consumed."""
+        client = get_client()
+        page = client.search(
+            'project-{}'.format(self.project_id),
+            ('spatial', 'party', 'resource'),
+            {
+                'query': parse_query(self.query),
+                'size': self.page_size,
+                'sort': ['_doc'],
+            },
+            params='?scroll=' + SCROLL_TIMEOUT, timeout=TIMEOUT)
+        scroll_id = page.get('_scroll_id')
+        try:
+            while page['hits']['hits']:
+                for hit in page['hits']['hits']:
+                    yield hit['_type'], hit['_source']
+                page = client.request('POST', 'scroll', '/_search/scroll', {
+                    'scroll': SCROLL_TIMEOUT,
+                    'scroll_id': scroll_id,
+                }, timeout=TIMEOUT)
+                scroll_id = page.get('_scroll_id', scroll_id)
+        finally:
+            self.clear_scroll(client, scroll_id)
+
+    def clear_scroll(self, client, scroll_id):
+        # The search context expires anyway, so errors can be ignored
+        if scroll_id is None:
+            return
+        try:
+            client.request('DELETE', 'clear_scroll', '/_search/scroll',
+                           {'scroll_id': [scroll_id]}, timeout=TIMEOUT)
+        except ESUnavailableError:
+            pass
+
+    def batches(self, types=ENTITY_TYPES, workers=None):
+        """Yields lists of decoded ``(kind, source)`` tuples for the
+        results of ``types``, one list per page of results. The results
+        are decoded as they are read, so ``workers`` is ignored."""
+        batch = []
+        for es_type, source in self.iter_hits():
+            if es_type in types:
+                batch.append(decode_source(es_type, source))
+            if len(batch) == self.page_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -1,8 +1,7 @@
-import os
-
 from openpyxl import Workbook
 
 from .base import Exporter
+from .dump import get_source
 
 MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
@@ -10,23 +9,24 @@ MIME_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 class XLSExporter(Exporter):
 
     def make_download(self, es_dump_path):
-        self.workbook = Workbook(write_only=True)
+        source = get_source(es_dump_path)
+        self.create_workbook()
 
         # Process ES dump file
-        f = open(es_dump_path, encoding='utf-8')
-        while True:
-            # Read 2 lines in the dump file
-            type_line = f.readline()
-            source_line = f.readline()
-            if not type_line:
-                break
-            self.process_entity(type_line, source_line, self.write_xls_row)
+        self.process_dump(source, self.write_xls_rows)
 
         # Finalize
-        xls_path = os.path.splitext(es_dump_path)[0] + '.xlsx'
+        xls_path = source.base_path + '.xlsx'
         self.workbook.save(filename=xls_path)
         return xls_path, MIME_TYPE
 
+    def create_workbook(self):
+        self.workbook = Workbook(write_only=True)
+
+    def write_xls_rows(self, batch):
+        for kind, entity in batch:
+            self.write_xls_row(entity, self.metadata[kind])
+
     def write_xls_row(self, entity, metadatum):
         # Create worksheet if not yet created
         if not metadatum.get('worksheet'):
@@ -0,0 +1,207 @@
+"""Incremental indexer of the project search indexes.
+
+Saved and deleted locations, parties, tenure relationships and resources
+are recorded as ``IndexChange`` rows, by signal receivers or, for the
+instances written with ``bulk_create``, by the code writing them. Once the
+transaction is committed, a background job flushes the recorded changes
+to the ES bulk API in batches, and stamps the project document of each
+changed index with the time of the flush, which invalidates the cached
+pages of search results.
+
+Changes stay recorded while Elasticsearch is unavailable, or when the
+worker running the job goes away, and are flushed by the next job or by
+the ``flushsearchindex`` management command, which uWSGI runs every
+minute. Recording a change costs a DELETE and an INSERT of
+``IndexChange`` rows in the transaction saving the entity.
+"""
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from core.workers import WorkerPool
+from party.models import Party, TenureRelationship
+from resources.models import Resource
+from spatial.models import SpatialUnit
+from .client import get_client
+from .documents import get_timestamp, transform
+from .exceptions import ESUnavailableError
+from .models import IndexChange
+
+logger = logging.getLogger('search.indexer')
+
+pool = WorkerPool('SEARCH_INDEX_WORKERS')
+
+# ES type of the documents of each model, and the relations used to build
+# them
+INDEXED_MODELS = OrderedDict((
+    (SpatialUnit, ('spatial', ())),
+    (Party, ('party', ())),
+    (TenureRelationship, ('party', ('party',))),
+    (Resource, ('resource', ())),
+))
+MODELS_BY_LABEL = {model._meta.label_lower: model for model in INDEXED_MODELS}
+
+_flush_lock = threading.Lock()
+_flush_scheduled = False
+
+
+def get_index(project_id):
+    return 'project-{}'.format(project_id)
+
+
+def record_changes(instances, deleted=False):
+    """Records that ``instances`` were saved, or deleted, replacing the
+    changes of the same instances not flushed yet, and schedules a flush
+    once the transaction is committed."""
+    if not settings.SEARCH_INDEX_CHANGES:
+        return
+
+    changes = [
+        IndexChange(project_id=instance.project_id,
+                    model=instance._meta.label_lower,
+                    object_id=instance.pk,
+                    deleted=deleted)
+        for instance in instances if type(instance) in INDEXED_MODELS
+    ]
+    if not changes:
+        return
+
+    by_model = defaultdict(list)
+    for change in changes:
+        by_model[change.model].append(change.object_id)
+    for model, object_ids in by_model.items():
+        IndexChange.objects.filter(
+            model=model, object_id__in=object_ids).delete()
+    IndexChange.objects.bulk_create(changes)
+
+    transaction.on_commit(schedule_flush)
+
+
+def schedule_flush():
+    """Submits a flush job, unless one is already waiting to run."""
+    global _flush_scheduled
+    with _flush_lock:
+        if _flush_scheduled and not pool.is_inline:
+            return
+        _flush_scheduled = True
+    pool.submit(run_flush)
+
+
+def run_flush():
+    global _flush_scheduled
+    with _flush_lock:
+        _flush_scheduled = False
+    try:
+        flush_changes()
+    except ESUnavailableError as e:
+        # The changes are flushed by the next job
+        logger.warning('Search index changes not flushed: %s', e)
+
+
+def flush_changes(batch_size=None):
+    """Sends the recorded changes to Elasticsearch, oldest first, and
+    deletes them. Returns the number of changes flushed.
+
+    Raises ``ESUnavailableError`` if a batch cannot be sent, in which case
+    its changes are kept."""
+    if batch_size is None:
+        batch_size = settings.SEARCH_INDEX_BATCH_SIZE
+
+    flushed = 0
+    while True:
+        changes = list(IndexChange.objects.all()[:batch_size])
+        if not changes:
+            return flushed
+
+        # Only the latest change of each entity matters
+        latest = OrderedDict()
+        for change in changes:
+            latest[(change.model, change.object_id)] = change
+        lines = get_bulk_lines(list(latest.values()))
+
+        response = get_client().request('POST', 'bulk', '/_bulk', lines,
+                                        ndjson=True)
+        if response.get('errors'):
+            log_errors(response['items'])
+
+        IndexChange.objects.filter(
+            id__in=[change.id for change in changes]).delete()
+        flushed += len(changes)
+
+
+def get_bulk_lines(changes):
+    """Returns the lines of the ES bulk request applying the changes, and
+    stamping the project documents of their indexes."""
+    ids = defaultdict(set)
+    for change in changes:
+        if not change.deleted:
+            ids[MODELS_BY_LABEL[change.model]].add(change.object_id)
+
+    # The documents of tenure relationships hold their party
+    if ids.get(Party):
+        ids[TenureRelationship].update(
+            TenureRelationship.objects.filter(
+                party_id__in=ids[Party]).values_list('id', flat=True))
+
+    entities = {
+        model: model.objects.select_related(
+            *INDEXED_MODELS[model][1]).in_bulk(list(object_ids))
+        for model, object_ids in ids.items()
+    }
+
+    timestamp = get_timestamp()
+    lines = []
+    projects = OrderedDict()
+    for change in changes:
+        projects[change.project_id] = None
+        entity = None
+        if not change.deleted:
+            entity = entities[MODELS_BY_LABEL[change.model]].pop(
+                change.object_id, None)
+        if entity is None:
+            # Also when the entity was deleted after the change was saved
+            lines.append(get_delete_line(change))
+        else:
+            lines.extend(get_index_lines(entity, timestamp))
+
+    # Tenure relationships of changed parties
+    for entity in entities.get(TenureRelationship, {}).values():
+        projects[entity.project_id] = None
+        lines.extend(get_index_lines(entity, timestamp))
+
+    for project_id in projects:
+        lines.append({'update': {
+            '_index': get_index(project_id),
+            '_type': 'project',
+            '_id': project_id,
+        }})
+        lines.append({'doc': {'@timestamp': timestamp}, 'doc_as_upsert': True})
+    return lines
+
+
+def get_index_lines(entity, timestamp):
+    action, source = transform(entity, bulk=True, timestamp=timestamp,
+                               base_url=settings.ES_FILE_BASE_URL)
+    action['index']['_index'] = get_index(entity.project_id)
+    return [action, source]
+
+
+def get_delete_line(change):
+    model = MODELS_BY_LABEL[change.model]
+    return {'delete': {
+        '_index': get_index(change.project_id),
+        '_type': INDEXED_MODELS[model][0],
+        '_id': change.object_id,
+    }}
+
+
+def log_errors(items):
+    for item in items:
+        for action, result in item.items():
+            if 'error' in result:
+                logger.error('Search index %s of %s/%s failed: %s', action,
+                             result.get('_type'), result.get('_id'),
+                             result['error'])
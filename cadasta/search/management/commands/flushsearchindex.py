@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from ...indexer import flush_changes
+
+
+class Command(BaseCommand):
+    help = "Send the recorded changes of entities to the search indexes."
+
+    def handle(self, *args, **options):
+        flushed = flush_changes()
+        msg = "Flushed {} search index changes".format(flushed)
+        return self.stdout.write(self.style.SUCCESS(msg))
@@ -0,0 +1,38 @@
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# GIN indexes of the text search documents of search.backends.DOCUMENTS,
+# which must be kept in sync
+INDEXES = (
+    ('search_spatialunit_document', 'spatial_spatialunit',
+     "to_tsvector('simple', coalesce(type, '') || ' ' || "
+     "coalesce(attributes::text, ''))"),
+    ('search_party_document', 'party_party',
+     "to_tsvector('simple', coalesce(name, '') || ' ' || "
+     "coalesce(type, '') || ' ' || coalesce(attributes::text, ''))"),
+    ('search_tenurerelationship_document', 'party_tenurerelationship',
+     "to_tsvector('simple', coalesce(tenure_type_id, '') || ' ' || "
+     "coalesce(attributes::text, ''))"),
+    ('search_resource_document', 'resources_resource',
+     "to_tsvector('simple', coalesce(name, '') || ' ' || "
+     "coalesce(description, '') || ' ' || "
+     "coalesce(original_file, '') || ' ' || coalesce(mime_type, ''))"),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+        ('party', '0002_remove_all_types_from_tenure_relationship_type'),
+        ('resources', '0006_randomize_imported_filenames'),
+        ('spatial', '0002_auto_20160712_1513'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX {} ON {} USING gin (({}))'.format(*index),
+            'DROP INDEX {}'.format(index[0]),
+        ) for index in INDEXES
+    ]
@@ -33,3 +33,23 @@ class MockEsUrlsTest(TestCase):
         assert resolved.func.__name__ == views.Dump.__name__
         assert resolved.kwargs['projectid'] == '123abc'
         assert resolved.kwargs['type'] == '456def'
+
+    def test_scroll(self):
+        assert reverse('mock_es_scroll') == '/_search/scroll'
+
+        resolved = resolve('/_search/scroll')
+        assert resolved.func.__name__ == views.Scroll.__name__
+
+    def test_msearch(self):
+        actual = reverse('mock_es_msearch', kwargs={'projectid': '123abc'})
+        assert actual == '/project-123abc/_msearch'
+
+        resolved = resolve('/project-123abc/_msearch')
+        assert resolved.func.__name__ == views.MultiSearch.__name__
+        assert resolved.kwargs['projectid'] == '123abc'
+
+    def test_bulk(self):
+        assert reverse('mock_es_bulk') == '/_bulk'
+
+        resolved = resolve('/_bulk')
+        assert resolved.func.__name__ == views.Bulk.__name__
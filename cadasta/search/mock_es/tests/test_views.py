@@ -1,6 +1,7 @@
 import json
 
 from django.contrib.contenttypes.models import ContentType
+from django.core.urlresolvers import reverse
 from django.test import TestCase
 from skivvy import ViewTestCase, APITestCase
 
@@ -148,7 +149,7 @@ class TransformTest(UserTestCase, TestCase):
         self.setup_data()
         result = views.transform(self.location, bulk=True)
         assert result == [
-            {'index': {'_type': 'spatial'}},
+            {'index': {'_type': 'spatial', '_id': self.location.id}},
             self.location_raw_result,
         ]
 
@@ -164,7 +165,7 @@ class TransformTest(UserTestCase, TestCase):
         self.setup_data()
         result = views.transform(self.party, bulk=True)
         assert result == [
-            {'index': {'_type': 'party'}},
+            {'index': {'_type': 'party', '_id': self.party.id}},
             self.party_raw_result,
         ]
 
@@ -180,7 +181,7 @@ class TransformTest(UserTestCase, TestCase):
         self.setup_data()
         result = views.transform(self.tenure_rel, bulk=True)
         assert result == [
-            {'index': {'_type': 'party'}},
+            {'index': {'_type': 'party', '_id': self.tenure_rel.id}},
             self.tenure_rel_raw_result,
         ]
 
@@ -196,7 +197,7 @@ class TransformTest(UserTestCase, TestCase):
         self.setup_data()
         result = views.transform(self.resource, bulk=True)
         assert result == [
-            {'index': {'_type': 'resource'}},
+            {'index': {'_type': 'resource', '_id': self.resource.id}},
             self.resource_raw_result,
         ]
 
@@ -431,3 +432,122 @@ class DumpTest(ViewTestCase, UserTestCase, TestCase):
         assert content[5]['tenure_id'] == self.tenure_rel.id
         assert content[6]['index']['_type'] == 'resource'
         assert content[7]['id'] == self.resource.id
+
+
+class ScrollTest(UserTestCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.project = ProjectFactory.create(slug='test-project')
+        self.locations = SpatialUnitFactory.create_batch(
+            5, project=self.project, geometry='SRID=4326;POINT(0 0)')
+        self.search_url = reverse('mock_es:search', kwargs={
+            'projectid': self.project.id,
+            'type': 'spatial,party,resource',
+        })
+
+    def post(self, url, data):
+        response = self.client.post(url, json.dumps(data),
+                                    content_type='application/json')
+        return response.status_code, response.json()
+
+    def test_scroll(self):
+        status_code, content = self.post(self.search_url + '?scroll=1m', {
+            'query': {'bool': {}},
+            'size': 2,
+        })
+        assert status_code == 200
+        scroll_id = content['_scroll_id']
+        ids = [hit['_source']['id'] for hit in content['hits']['hits']]
+
+        while content['hits']['hits']:
+            status_code, content = self.post('/_search/scroll', {
+                'scroll': '1m', 'scroll_id': scroll_id})
+            assert status_code == 200
+            assert content['_scroll_id'] == scroll_id
+            ids.extend(hit['_source']['id'] for hit in content['hits']['hits'])
+
+        assert sorted(ids) == sorted(loc.id for loc in self.locations)
+
+        response = self.client.delete(
+            '/_search/scroll', json.dumps({'scroll_id': [scroll_id]}),
+            content_type='application/json')
+        assert response.status_code == 200
+        assert scroll_id not in views.scrolls
+
+    def test_scroll_unknown_id(self):
+        status_code, _ = self.post('/_search/scroll', {
+            'scroll': '1m', 'scroll_id': 'unknown'})
+        assert status_code == 404
+
+
+class MultiSearchTest(UserTestCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.project = ProjectFactory.create(slug='test-project')
+        self.locations = SpatialUnitFactory.create_batch(
+            3, project=self.project, geometry='SRID=4326;POINT(0 0)')
+        self.url = '/project-{}/_msearch'.format(self.project.id)
+
+    def msearch(self, lines):
+        response = self.client.post(
+            self.url, ''.join(json.dumps(line) + '\n' for line in lines),
+            content_type='application/x-ndjson')
+        assert response.status_code == 200
+        return response.json()['responses']
+
+    def test_msearch(self):
+        responses = self.msearch([
+            {'type': 'spatial,party,resource'},
+            {'query': {'bool': {}}, 'size': 2},
+            {'type': ['project']},
+            {'query': {'match_all': {}}, 'size': 1},
+        ])
+        assert len(responses) == 2
+        assert responses[0]['hits']['total'] == 3
+        assert len(responses[0]['hits']['hits']) == 2
+        assert responses[1]['hits']['hits'][0]['_source'] == {
+            '@timestamp': '2017-01-01T01:23:45.678Z'}
+
+    def test_msearch_with_error(self):
+        responses = self.msearch([
+            {'type': ['spatial', 'party', 'resource']},
+            {'query': {'bool': {'should': [
+                {'multi_match': {'query': 'error'}}]}}},
+        ])
+        assert responses[0]['status'] == 503
+        assert 'error' in responses[0]
+
+
+class BulkTest(TestCase):
+
+    def setUp(self):
+        views.bulk_actions.clear()
+        self.addCleanup(views.bulk_actions.clear)
+
+    def test_bulk(self):
+        lines = [
+            {'index': {'_index': 'project-abc', '_type': 'spatial',
+                       '_id': 'loc1'}},
+            {'id': 'loc1'},
+            {'delete': {'_index': 'project-abc', '_type': 'party',
+                        '_id': 'party1'}},
+            {'update': {'_index': 'project-abc', '_type': 'project',
+                        '_id': 'abc'}},
+            {'doc': {'@timestamp': '2017-01-01T01:23:45.678Z'}},
+        ]
+        response = self.client.post(
+            '/_bulk', ''.join(json.dumps(line) + '\n' for line in lines),
+            content_type='application/x-ndjson')
+        assert response.status_code == 200
+        content = response.json()
+        assert content['errors'] is False
+        assert [list(item) for item in content['items']] == [
+            ['index'], ['delete'], ['update']]
+        assert content['items'][1]['delete']['_id'] == 'party1'
+        assert views.bulk_actions == [
+            ('index', lines[0]['index'], lines[1]),
+            ('delete', lines[2]['delete'], None),
+            ('update', lines[3]['update'], lines[4]),
+        ]
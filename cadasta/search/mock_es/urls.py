@@ -14,7 +14,19 @@ urls = [
 ]
 
 urlpatterns = [
+    url(
+        r'^project-(?P<projectid>[-\w]+)/_msearch/?$',
+        views.MultiSearch.as_view(),
+        name='mock_es_msearch'),
     url(
         r'^project-(?P<projectid>[-\w]+)/(?P<type>[-\w,]+)/',
         include(urls, namespace='mock_es')),
+    url(
+        r'^_search/scroll/?$',
+        views.Scroll.as_view(),
+        name='mock_es_scroll'),
+    url(
+        r'^_bulk/?$',
+        views.Bulk.as_view(),
+        name='mock_es_bulk'),
 ]
@@ -1,4 +1,5 @@
 import json
+from uuid import uuid4
 
 from django.http import HttpResponse
 from rest_framework import status
@@ -11,94 +12,24 @@ from organization.models import Project
 from spatial.models import SpatialUnit
 from party.models import Party, TenureRelationship
 from resources.models import Resource
+from .. import documents
+
+
+# Timestamp of all the documents of the mock ES indexes
+TIMESTAMP = '2017-01-01T01:23:45.678Z'
 
 
 def transform(entity, bulk=False):
+    return documents.transform(entity, bulk=bulk, timestamp=TIMESTAMP,
+                               base_url='http://localhost:8000')
 
-    if type(entity) is SpatialUnit:
-        source = {
-            'id': entity.id,
-            'type': entity.type,
-            'geometry': {
-                'type': 'geometry',
-                'value': ''.join(
-                    ['{:02X}'.format(x) for x in entity.geometry.ewkb]
-                ),
-            },
-            'attributes': {
-                'type': 'jsonb',
-                'value': json.dumps(dict(entity.attributes), sort_keys=True),
-            },
-            '@timestamp': '2017-01-01T01:23:45.678Z',
-        }
-        if bulk:
-            return [{'index': {'_type': 'spatial'}}, source]
-        else:
-            return {'_type': 'spatial', '_source': source}
-
-    if type(entity) is Party:
-        source = {
-            'id': entity.id,
-            'name': entity.name,
-            'type': entity.type,
-            'attributes': {
-                'type': 'jsonb',
-                'value': json.dumps(dict(entity.attributes), sort_keys=True),
-            },
-            'tenure_id': None,
-            'tenure_attributes': None,
-            'tenure_partyid': None,
-            'spatial_unit_id': None,
-            'tenure_type_id': None,
-            '@timestamp': '2017-01-01T01:23:45.678Z',
-        }
-        if bulk:
-            return [{'index': {'_type': 'party'}}, source]
-        else:
-            return {'_type': 'party', '_source': source}
-
-    if type(entity) is TenureRelationship:
-        source = {
-            'id': entity.party.id,
-            'name': entity.party.name,
-            'type': entity.party.type,
-            'attributes': {
-                'type': 'jsonb',
-                'value': json.dumps(dict(entity.party.attributes),
-                                    sort_keys=True),
-            },
-            'tenure_id': entity.id,
-            'tenure_attributes': {
-                'type': 'jsonb',
-                'value': json.dumps(dict(entity.attributes), sort_keys=True),
-            },
-            'tenure_partyid': entity.party.id,
-            'spatial_unit_id': entity.spatial_unit.id,
-            'tenure_type_id': entity.tenure_type.id,
-            '@timestamp': '2017-01-01T01:23:45.678Z',
-        }
-        if bulk:
-            return [{'index': {'_type': 'party'}}, source]
-        else:
-            return {'_type': 'party', '_source': source}
-
-    if type(entity) is Resource:
-        source = {
-            'id': entity.id,
-            'name': entity.name,
-            'description': entity.description,
-            'file': 'http://localhost:8000' + entity.file.url,
-            'original_file': entity.original_file,
-            'mime_type': entity.mime_type,
-            'archived': entity.archived,
-            'last_updated': entity.last_updated.isoformat(),
-            'contributor_id': entity.contributor.id,
-            '@timestamp': '2017-01-01T01:23:45.678Z',
-        }
-        if bulk:
-            return [{'index': {'_type': 'resource'}}, source]
-        else:
-            return {'_type': 'resource', '_source': source}
+
+# Open scroll contexts, mapping each scroll ID to the project and the
+# query DSL of the next page
+scrolls = {}
+
+# Actions received by the bulk API, as (action, metadata, source) tuples
+bulk_actions = []
 
 
 class BaseSearch(APIView):
@@ -173,7 +104,7 @@ class Search(BaseSearch):
             return Response({
                 'hits': {
                     'hits': [{
-                        '_source': {'@timestamp': '2017-01-01T01:23:45.678Z'},
+                        '_source': {'@timestamp': TIMESTAMP},
                     }],
                 },
             })
@@ -183,8 +114,103 @@ class Search(BaseSearch):
 
     def post(self, request, *args, **kwargs):
         assert self.kwargs['type'] == 'spatial,party,resource'
+        if 'scroll' in request.query_params:
+            return self.start_scroll(request.data)
         return self.search(request.data)
 
+    def start_scroll(self, query_dsl):
+        query_dsl = dict(query_dsl, **{'from': 0})
+        response = self.search(query_dsl)
+        if response.status_code == 200:
+            scroll_id = uuid4().hex
+            scrolls[scroll_id] = (self.kwargs['projectid'], query_dsl)
+            response.data['_scroll_id'] = scroll_id
+        return response
+
+
+class Scroll(BaseSearch):
+
+    def __init__(self):
+        self.bulk = False
+
+    def post(self, request, *args, **kwargs):
+        scroll_id = request.data['scroll_id']
+        if scroll_id not in scrolls:
+            return Response({}, status=status.HTTP_404_NOT_FOUND)
+
+        project_id, query_dsl = scrolls[scroll_id]
+        query_dsl = dict(query_dsl, **{
+            'from': query_dsl['from'] + query_dsl.get('size', 10)})
+        scrolls[scroll_id] = (project_id, query_dsl)
+        self.kwargs['projectid'] = project_id
+        response = self.search(query_dsl)
+        response.data['_scroll_id'] = scroll_id
+        return response
+
+    def delete(self, request, *args, **kwargs):
+        scroll_ids = request.data['scroll_id']
+        for scroll_id in scroll_ids:
+            scrolls.pop(scroll_id, None)
+        return Response({'succeeded': True, 'num_freed': len(scroll_ids)})
+
+
+class MultiSearch(BaseSearch):
+
+    parser_classes = ()
+
+    def __init__(self):
+        self.bulk = False
+
+    def post(self, request, *args, **kwargs):
+        lines = [json.loads(line)
+                 for line in request.body.decode().splitlines() if line]
+        responses = []
+        for header, query_dsl in zip(lines[::2], lines[1::2]):
+            doc_types = header.get('type', '')
+            if isinstance(doc_types, list):
+                doc_types = ','.join(doc_types)
+            if doc_types == 'project':
+                responses.append({
+                    'hits': {
+                        'hits': [{
+                            '_source': {
+                                '@timestamp': TIMESTAMP,
+                            },
+                        }],
+                    },
+                })
+                continue
+
+            assert doc_types == 'spatial,party,resource'
+            response = self.search(query_dsl)
+            if response.status_code == 200:
+                responses.append(response.data)
+            else:
+                responses.append({
+                    'error': {'type': 'search_phase_execution_exception'},
+                    'status': response.status_code,
+                })
+        return Response({'responses': responses})
+
+
+class Bulk(APIView):
+
+    authentication_classes = []
+    permission_classes = (AllowAny,)
+    parser_classes = ()
+
+    def post(self, request, *args, **kwargs):
+        lines = iter([json.loads(line)
+                      for line in request.body.decode().splitlines() if line])
+        items = []
+        for header in lines:
+            (action, metadata), = header.items()
+            # All actions but delete are followed by a source line
+            source = None if action == 'delete' else next(lines)
+            bulk_actions.append((action, metadata, source))
+            items.append({action: dict(metadata, status=200)})
+        return Response({'took': 1, 'errors': False, 'items': items})
+
 
 class Dump(BaseSearch):
 
@@ -0,0 +1,53 @@
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.util import ID_FIELD_LENGTH
+from party.models import Party, TenureRelationship
+from resources.models import Resource
+from spatial.models import SpatialUnit
+
+
+class IndexChange(models.Model):
+    """A change of an entity that is not yet in the search index of its
+    project.
+
+    Changes are recorded in the transaction changing the entity, so none
+    is lost if Elasticsearch is down, and the changes of an entity are
+    coalesced into the latest one until they are flushed to Elasticsearch
+    by ``search.indexer``.
+    """
+    project_id = models.CharField(max_length=ID_FIELD_LENGTH)
+    model = models.CharField(max_length=40)
+    object_id = models.CharField(max_length=ID_FIELD_LENGTH)
+    deleted = models.BooleanField(default=False)
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('id',)
+        index_together = (('model', 'object_id'),)
+
+    def __repr__(self):
+        repr_string = ('<IndexChange id={obj.id} model={obj.model}'
+                       ' object_id={obj.object_id} deleted={obj.deleted}>')
+        return repr_string.format(obj=self)
+
+
+@receiver(post_save, sender=SpatialUnit)
+@receiver(post_save, sender=Party)
+@receiver(post_save, sender=TenureRelationship)
+@receiver(post_save, sender=Resource)
+def record_save(sender, instance, raw=False, **kwargs):
+    # Fixtures are loaded with raw saves, and indexed with the project
+    if not raw:
+        from .indexer import record_changes
+        record_changes([instance])
+
+
+@receiver(post_delete, sender=SpatialUnit)
+@receiver(post_delete, sender=Party)
+@receiver(post_delete, sender=TenureRelationship)
+@receiver(post_delete, sender=Resource)
+def record_delete(sender, instance, **kwargs):
+    from .indexer import record_changes
+    record_changes([instance], deleted=True)
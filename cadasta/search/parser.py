@@ -1,3 +1,7 @@
+import json
+import re
+from functools import lru_cache
+
 import pyparsing
 
 
@@ -5,7 +9,10 @@ import pyparsing
 fields = ['type', 'name', 'attributes.value', 'tenure_attributes.value',
           'tenure_type_id', 'description', 'original_file', 'mime_type']
 
-# pyparsing objects
+# Number of parsed query strings kept in memory
+QUERY_CACHE_SIZE = 1024
+
+# pyparsing objects, matching the same grammar as tokenize()
 fuzzy = pyparsing.Regex(r'\S+')
 exact = pyparsing.QuotedString('"', unquoteResults=False)
 term = exact | fuzzy
@@ -15,16 +22,76 @@ token = must_term | must_not_term | term
 query = pyparsing.OneOrMore(token)
 
 
+# Tokenizer patterns: the whitespace skipped between tokens is pyparsing's
+WHITESPACE = ' \t\n\r'
+EXACT = re.compile(r'"[^"\n\r]*"')
+FUZZY = re.compile(r'\S+')
+
+
+def match_term(raw_query_str, pos):
+    match = EXACT.match(raw_query_str, pos) or FUZZY.match(raw_query_str, pos)
+    if match:
+        return match.group(), match.end()
+    return None, pos
+
+
+def tokenize(raw_query_str):
+    """Splits the query string into the same tokens as the pyparsing
+    ``query`` grammar: terms, phrases in double quotes, and ``['+', term]``
+    or ``['-', term]`` lists. Parsing stops at the first character that
+    does not start a token, so an empty list is returned for a blank
+    string instead of raising an error."""
+    # pyparsing expands tabs before parsing, which matters inside phrases
+    raw_query_str = raw_query_str.expandtabs()
+    tokens = []
+    pos = 0
+    end = len(raw_query_str)
+    while True:
+        while pos < end and raw_query_str[pos] in WHITESPACE:
+            pos += 1
+        if pos == end:
+            return tokens
+
+        if raw_query_str[pos] in '+-':
+            term_pos = pos + 1
+            while term_pos < end and raw_query_str[term_pos] in WHITESPACE:
+                term_pos += 1
+            term, term_end = match_term(raw_query_str, term_pos)
+            if term is not None:
+                tokens.append([raw_query_str[pos], term])
+                pos = term_end
+                continue
+
+        term, pos = match_term(raw_query_str, pos)
+        if term is None:
+            return tokens
+        tokens.append(term)
+
+
+def normalize_query(raw_query_str):
+    """Returns the query string rebuilt from its tokens, which parses to
+    the same DSL as the original string. Tokens are separated by newlines,
+    which phrases cannot span, so that a term starting with a double quote
+    never forms a phrase with the next tokens."""
+    return '\n'.join(
+        ''.join(token) if isinstance(token, list) else token
+        for token in tokenize(raw_query_str))
+
+
 def parse_query(raw_query_str):
     """This function takes the raw UI search query string, parses it, then
-    generates and returns the 'bool' JSON object for the 'query' DSL field."""
+    generates and returns the 'bool' JSON object for the 'query' DSL field.
+    The DSL of the most recent query strings is cached."""
+    return json.loads(parse_normalized_query(normalize_query(raw_query_str)))
+
 
-    # Parse query string into tokens and sort them into buckets
-    tokens = query.parseString(raw_query_str).asList()
+def split_terms(raw_query_str):
+    """Parses the query string into tokens and sorts their terms into
+    the lists of terms that must, must not and should match."""
     must_terms = []
     must_not_terms = []
     should_terms = []
-    for token in tokens:
+    for token in tokenize(raw_query_str):
         if isinstance(token, list):
             if token[0] == '-':
                 must_not_terms.append(token[1])
@@ -33,11 +100,20 @@ def parse_query(raw_query_str):
                 must_terms.append(token[1])
         else:
             should_terms.append(token)
+    return must_terms, must_not_terms, should_terms
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def parse_normalized_query(raw_query_str):
+    """Returns the DSL of the normalized query string encoded as JSON, so
+    that each caller decodes its own copy of the cached DSL."""
+    must_terms, must_not_terms, should_terms = split_terms(raw_query_str)
 
     # Go through each bucket and generate the 'bool' clause lists
-    must_dsl = transform_to_dsl(must_terms)
-    must_not_dsl = transform_to_dsl(must_not_terms, has_fuzziness=False)
-    should_dsl = transform_to_dsl(should_terms)
+    must_dsl = merge_clauses(transform_to_dsl(must_terms))
+    must_not_dsl = merge_excluded_terms(
+        transform_to_dsl(must_not_terms, has_fuzziness=False))
+    should_dsl = merge_clauses(transform_to_dsl(should_terms))
 
     # Add clause to remove archived resources
     must_not_dsl.append({'match': {'archived': True}})
@@ -48,7 +124,7 @@ def parse_query(raw_query_str):
         dsl['bool']['must'] = must_dsl
     if should_dsl:
         dsl['bool']['should'] = should_dsl
-    return dsl
+    return json.dumps(dsl)
 
 
 def transform_to_dsl(terms, has_fuzziness=True):
@@ -83,6 +159,44 @@ def transform_to_dsl(terms, has_fuzziness=True):
     return dsl
 
 
+def merge_clauses(dsl):
+    """Merges repeated clauses into the first one, with the sum of their
+    boosts. Scores are proportional to the boost, so the ranking is
+    unchanged."""
+    merged = []
+    by_key = {}
+    for clause in dsl:
+        options = dict(clause['multi_match'])
+        boost = options.pop('boost', 1)
+        key = json.dumps(options, sort_keys=True)
+        if key in by_key:
+            first = by_key[key]['multi_match']
+            first['boost'] = first.get('boost', 1) + boost
+        else:
+            clause = {'multi_match': dict(clause['multi_match'])}
+            by_key[key] = clause
+            merged.append(clause)
+    return merged
+
+
+def merge_excluded_terms(dsl):
+    """Merges the term clauses of the 'must_not' list into the first one.
+    Its query matches any of the terms, so it excludes the same results
+    as the separate clauses; phrase clauses are kept as they are."""
+    merged = []
+    terms_clause = None
+    for clause in dsl:
+        if clause['multi_match'].get('type') == 'phrase':
+            merged.append(clause)
+        elif terms_clause is None:
+            terms_clause = {'multi_match': dict(clause['multi_match'])}
+            merged.append(terms_clause)
+        else:
+            terms_clause['multi_match']['query'] += (
+                ' ' + clause['multi_match']['query'])
+    return merged
+
+
 def get_fuzziness(term):
     assert len(term) > 0
     if len(term) == 1:
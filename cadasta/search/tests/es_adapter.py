@@ -0,0 +1,57 @@
+from unittest.mock import patch
+from urllib.parse import urlsplit
+
+import requests
+from django.test import Client
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from ..client import ESClient
+
+
+class MockESAdapter(BaseAdapter):
+    """Transport adapter sending the requests of a ``requests`` session to
+    the ``search.mock_es`` views through the Django test client, so code
+    talking to Elasticsearch can be tested offline::
+
+        client.session.mount(client.api_url, MockESAdapter())
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.client = Client()
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        path = url.path + ('?' + url.query if url.query else '')
+        self.requests.append((request.method, path))
+        response = self.client.generic(
+            request.method, path, data=request.body or '',
+            content_type=request.headers.get('content-type',
+                                             'application/json'))
+
+        r = requests.Response()
+        r.status_code = response.status_code
+        r.headers = CaseInsensitiveDict(response.items())
+        r._content = response.content
+        r.encoding = 'utf-8'
+        r.url = request.url
+        r.request = request
+        return r
+
+    def close(self):
+        pass
+
+
+def mock_es_client(test_case):
+    """Replaces the shared ES client with one sending its requests to the
+    mock ES views until the end of the test. Returns the client and its
+    adapter."""
+    client = ESClient()
+    adapter = MockESAdapter()
+    client.session.mount(client.api_url, adapter)
+    patcher = patch('search.client._client', client)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+    return client, adapter
@@ -0,0 +1,82 @@
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FileServer():
+    """Serves files from memory on a local port, standing in for S3 in
+    tests that fetch resource files over HTTP::
+
+        with FileServer({'text.csv': b'a,b'}) as server:
+            requests.get(server.url('text.csv'))
+
+    ``failures`` maps a path to the number of requests for it that fail
+    with a 503 before the file is served, and ``etags`` maps a path to
+    the ETag sent with it (the MD5 of the file if set to ``True``).
+    """
+
+    def __init__(self, files, failures=None, etags=None):
+        self.files = files
+        self.failures = dict(failures or {})
+        self.etags = etags or {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                          self.make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def url(self, path):
+        return 'http://127.0.0.1:{}/{}'.format(
+            self.server.server_port, path)
+
+    def respond(self, path):
+        with self.lock:
+            self.requests.append(path)
+            if self.failures.get(path):
+                self.failures[path] -= 1
+                return 503, {}, b''
+
+        if path not in self.files:
+            return 404, {}, b''
+
+        body = self.files[path]
+        headers = {'Content-Length': str(len(body))}
+        etag = self.etags.get(path)
+        if etag is True:
+            etag = hashlib.md5(body).hexdigest()
+        if etag:
+            headers['ETag'] = '"{}"'.format(etag)
+        return 200, headers, body
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, headers, body = server.respond(self.path[1:])
+                self.send_response(status)
+                headers.setdefault('Content-Length', str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,185 @@
+import pytest
+from django.test import TestCase
+from django.test.utils import override_settings
+from unittest.mock import patch
+
+from organization.tests.factories import ProjectFactory
+from party.models import TenureRelationship
+from party.tests.factories import PartyFactory, TenureRelationshipFactory
+from resources.tests.factories import ResourceFactory
+from spatial.models import SpatialUnit
+from spatial.tests.factories import SpatialUnitFactory
+from ..backends import (ElasticsearchBackend, PostgresBackend,
+                        get_backends)
+from ..exceptions import ESUnavailableError
+from ..parser import parse_query
+
+
+class GetBackendsTest(TestCase):
+
+    @override_settings(SEARCH_BACKENDS=(
+        'search.backends.PostgresBackend',
+        'search.backends.ElasticsearchBackend',
+    ))
+    def test_get_backends(self):
+        backends = get_backends()
+        assert [type(b) for b in backends] == [
+            PostgresBackend, ElasticsearchBackend]
+
+
+class ElasticsearchBackendTest(TestCase):
+
+    def setUp(self):
+        self.backend = ElasticsearchBackend()
+        self.es_searches = [
+            ({'type': ['spatial', 'party', 'resource']}, {
+                'query': parse_query('searching'),
+                'from': 10,
+                'size': 20,
+                'sort': {'_score': {'order': 'desc'}},
+            }),
+            ({'type': ['project']}, {'query': {'match_all': {}}, 'size': 1}),
+        ]
+        self.project_response = {
+            'hits': {'hits': [{'_source': {'@timestamp': 'INDEX_TIME'}}]}}
+
+    @patch('search.backends.get_client')
+    def test_search(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = [
+            {'hits': {'total': 0, 'hits': []}}, self.project_response]
+
+        raw_results, timestamp = self.backend.search(
+            'abc', 'searching', 10, 20)
+        assert raw_results == msearch.return_value[0]
+        assert timestamp == 'INDEX_TIME'
+        msearch.assert_called_once_with('project-abc', self.es_searches)
+
+    @patch('search.backends.get_client')
+    def test_search_not_ok(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = [
+            {'error': {'type': 'search_phase_execution_exception'},
+             'status': 503},
+            {'hits': {'hits': []}},
+        ]
+        with pytest.raises(ESUnavailableError):
+            self.backend.search('abc', 'searching', 10, 20)
+
+    @patch('search.backends.get_client')
+    def test_search_connection_not_ok(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.side_effect = ESUnavailableError('msearch', 'refused')
+        with pytest.raises(ESUnavailableError):
+            self.backend.search('abc', 'searching', 10, 20)
+
+    def test_get_timestamp(self):
+        assert self.backend.get_timestamp(
+            self.project_response) == 'INDEX_TIME'
+
+    def test_get_timestamp_not_ok(self):
+        assert self.backend.get_timestamp({
+            'error': {'type': 'index_not_found_exception'},
+            'status': 404,
+        }) == "unknown"
+        assert self.backend.get_timestamp(
+            {'hits': {'hits': []}}) == "unknown"
+
+
+class PostgresBackendTest(TestCase):
+
+    def setUp(self):
+        self.backend = PostgresBackend()
+        self.project = ProjectFactory.create()
+        self.location = SpatialUnitFactory.create(
+            project=self.project, type='PA')
+        self.party = PartyFactory.create(
+            project=self.project, name='Big Tree Farm', type='GR')
+        self.tenure_rel = TenureRelationshipFactory.create(
+            project=self.project, party=self.party,
+            spatial_unit=self.location)
+        # Without the schemas validating them on save
+        SpatialUnit.objects.filter(id=self.location.id).update(
+            attributes={'quality': 'surveyed'})
+        TenureRelationship.objects.filter(id=self.tenure_rel.id).update(
+            attributes={'notes': 'disputed'})
+        self.resource = ResourceFactory.create(
+            project=self.project, name='Survey map',
+            description='Map of the river farm')
+        ResourceFactory.create(
+            project=self.project, name='Old river map', archived=True)
+
+        other_project = ProjectFactory.create()
+        PartyFactory.create(project=other_project, name='River Farm')
+
+    def search(self, query, start=0, size=10):
+        results, timestamp = self.backend.search(
+            self.project.id, query, start, size)
+        assert timestamp is None
+        return results
+
+    def ids(self, results):
+        return [hit['_source'].get('tenure_id') or hit['_source']['id']
+                for hit in results['hits']['hits']]
+
+    def test_search_fields(self):
+        assert self.location.id in self.ids(self.search('PA'))
+        assert self.ids(self.search('surveyed')) == [self.location.id]
+        assert self.ids(self.search('tree')) == [self.party.id]
+        assert self.ids(self.search('disputed')) == [self.tenure_rel.id]
+        assert self.ids(self.search('river')) == [self.resource.id]
+
+    def test_search_results(self):
+        results = self.search('disputed tree')
+        assert results['hits']['total'] == 2
+        for hit in results['hits']['hits']:
+            assert hit['_type'] == 'party'
+            assert hit['_source']['name'] == 'Big Tree Farm'
+            assert '@timestamp' in hit['_source']
+
+    def test_search_terms(self):
+        assert sorted(self.ids(self.search('farm'))) == sorted(
+            [self.party.id, self.resource.id])
+        assert self.ids(self.search('+farm +tree')) == [self.party.id]
+        assert self.ids(self.search('farm -tree')) == [self.resource.id]
+        assert self.ids(self.search('"tree big"')) == [self.party.id]
+        assert self.ids(self.search('+"tree big" river')) == [self.party.id]
+        assert self.ids(self.search('-"farm river" +river')) == []
+
+    def test_search_ranking(self):
+        # The party matches both terms
+        assert self.ids(self.search('farm big'))[0] == self.party.id
+
+    def test_search_everything(self):
+        assert self.search(' ')['hits']['total'] == 4
+        assert self.search('-tree')['hits']['total'] == 3
+
+    def test_search_paging(self):
+        results = self.search(' ', start=1, size=2)
+        assert results['hits']['total'] == 4
+        assert len(results['hits']['hits']) == 2
+
+        results = self.search(' ', start=10, size=2)
+        assert results['hits']['total'] == 4
+        assert results['hits']['hits'] == []
+
+    def test_search_without_results(self):
+        results = self.search('nothing')
+        assert results == {'hits': {'total': 0, 'hits': []}}
+
+    def test_get_tsqueries(self):
+        match, match_params, rank, rank_params = self.backend.get_tsqueries(
+            'a +b -"c d" e -f')
+        assert match == (
+            "(plainto_tsquery('simple', %s)) && "
+            "(!!(plainto_tsquery('simple', %s) || "
+            "plainto_tsquery('simple', %s)))")
+        assert match_params == ['b', 'c d', 'f']
+        assert rank == (
+            "(plainto_tsquery('simple', %s) || "
+            "plainto_tsquery('simple', %s) || "
+            "plainto_tsquery('simple', %s))")
+        assert rank_params == ['b', 'a', 'e']
+
+    def test_get_tsqueries_without_terms(self):
+        assert self.backend.get_tsqueries(' ') == ('', [], '', [])
@@ -0,0 +1,165 @@
+import json
+import os
+import shutil
+import tempfile
+
+from core.tests.utils.benchmark import benchmark, get_size, measure, report
+from django.contrib.gis.geos import Point
+from django.test import TestCase
+
+from organization.importers.bulk import BulkCreator
+from organization.tests.factories import ProjectFactory
+from party.models import Party
+from party.tests.factories import PartyFactory, TenureRelationshipFactory
+from spatial.models import SpatialUnit
+from spatial.tests.factories import SpatialUnitFactory
+from .. import parser
+from ..backends import PostgresBackend
+from ..export import dump
+from ..export.base import Exporter
+from ..mock_es.views import transform
+
+NUM_ENTITIES = get_size(3000, 1000000)
+NUM_QUERIES = get_size(1000, 100000)
+NUM_SEARCH_ENTITIES = get_size(200, 20000)
+NUM_SEARCHES = get_size(50, 1000)
+
+# Queries typed by users, repeated in turn
+QUERIES = (
+    'r', 'ri', 'riv', 'river',
+    'river +farm', 'river +farm -"north field"',
+    '"main road" household', '+owner -tenant "plot 12"',
+)
+
+
+def write_dump(path, project, num_entities):
+    """Writes a dump of ``num_entities`` locations, parties and tenure
+    relationships in turn, as returned by the mock ES bulk API."""
+    location = SpatialUnitFactory.create(
+        project=project, type='PA', geometry=Point(30, 10, srid=4326))
+    party = PartyFactory.create(project=project)
+    rel = TenureRelationshipFactory.create(
+        project=project, party=party, spatial_unit=location)
+    entities = [
+        ''.join(json.dumps(line) + '\n' for line in transform(e, bulk=True))
+        for e in (location, party, rel)
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(num_entities):
+            f.write(entities[i % len(entities)])
+
+
+@benchmark
+class DumpReaderBenchmark(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.project = ProjectFactory.create()
+        self.path = os.path.join(self.dir, 'dump.esjson')
+        write_dump(self.path, self.project, NUM_ENTITIES)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read_lines(self):
+        """Reads the dump two lines at a time, as the exporters used to."""
+        exporter = Exporter(self.project)
+        count = 0
+
+        def callback(source, metadatum):
+            nonlocal count
+            count += 1
+
+        with open(self.path, encoding='utf-8') as f:
+            while True:
+                type_line = f.readline()
+                source_line = f.readline()
+                if not type_line:
+                    break
+                exporter.process_entity(type_line, source_line, callback)
+        assert count == NUM_ENTITIES
+
+    def read_batches(self, workers):
+        batches = dump.iter_batches(self.path, workers=workers,
+                                    parallel_size=0)
+        assert sum(len(batch) for batch in batches) == NUM_ENTITIES
+
+    def test_entities_per_second(self):
+        results = []
+        for name, read in (
+                ('per entity', self.read_lines),
+                ('batched', lambda: self.read_batches(1)),
+                ('4 processes', lambda: self.read_batches(4))):
+            elapsed = measure(read)
+            results.append((
+                name,
+                '{:.2f}'.format(elapsed),
+                '{:.0f}'.format(NUM_ENTITIES / elapsed),
+            ))
+
+        report('ES dump reader ({} entities, JSON backend {})'.format(
+                   NUM_ENTITIES, dump.loads.__module__),
+               ('reader', 'time (s)', 'entities/s'), results)
+
+
+@benchmark
+class QueryParserBenchmark(TestCase):
+
+    def parse_pyparsing(self):
+        for i in range(NUM_QUERIES):
+            parser.query.parseString(QUERIES[i % len(QUERIES)]).asList()
+
+    def parse_tokenizer(self):
+        for i in range(NUM_QUERIES):
+            parser.tokenize(QUERIES[i % len(QUERIES)])
+
+    def parse_query_cached(self):
+        parser.parse_normalized_query.cache_clear()
+        for i in range(NUM_QUERIES):
+            parser.parse_query(QUERIES[i % len(QUERIES)])
+
+    def test_queries_per_second(self):
+        results = []
+        for name, parse in (
+                ('pyparsing', self.parse_pyparsing),
+                ('tokenizer', self.parse_tokenizer),
+                ('parse_query (cached)', self.parse_query_cached)):
+            elapsed = measure(parse)
+            results.append((
+                name,
+                '{:.2f}'.format(elapsed),
+                '{:.0f}'.format(NUM_QUERIES / elapsed),
+            ))
+
+        report('Query parser ({} queries)'.format(NUM_QUERIES),
+               ('parser', 'time (s)', 'queries/s'), results)
+
+
+@benchmark
+class PostgresBackendBenchmark(TestCase):
+
+    def setUp(self):
+        self.project = ProjectFactory.create()
+        words = ' '.join(q for q in QUERIES if ' ' not in q).split()
+        creator = BulkCreator((SpatialUnit, Party), batch_size=1000)
+        for i in range(NUM_SEARCH_ENTITIES // 2):
+            creator.add(SpatialUnit(
+                project=self.project, type='PA',
+                geometry='SRID=4326;POINT(30 10)'))
+            creator.add(Party(
+                project=self.project, type='IN',
+                name='{} {}'.format(words[i % len(words)], i)))
+        creator.flush()
+
+    def search(self):
+        backend = PostgresBackend()
+        for i in range(NUM_SEARCHES):
+            backend.search(self.project.id, QUERIES[i % len(QUERIES)], 0, 10)
+
+    def test_searches_per_second(self):
+        elapsed = measure(self.search)
+        report('Postgres search backend ({} searches of {} entities)'.format(
+                   NUM_SEARCHES, NUM_SEARCH_ENTITIES),
+               ('time (s)', 'searches/s'),
+               [('{:.2f}'.format(elapsed),
+                 '{:.0f}'.format(NUM_SEARCHES / elapsed))])
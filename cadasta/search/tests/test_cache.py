@@ -0,0 +1,43 @@
+from django.core.cache import caches
+from django.test import TestCase
+
+from ..cache import PageCache, normalize_query
+
+
+class PageCacheTest(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.cache = PageCache(timeout=60, timestamp_timeout=60)
+        self.page = {'recordsTotal': 1, 'data': [['<tr></tr>']]}
+
+    def test_normalize_query(self):
+        assert normalize_query('  river   "big tree"\n') == (
+            'river\n"big tree"')
+
+    def test_get_cached_page(self):
+        assert self.cache.get('prj', 'river', 0, 10) is None
+        self.cache.set('prj', 'river', 0, 10, 'T1', self.page)
+
+        assert self.cache.get('prj', ' river ', 0, 10) == self.page
+        assert self.cache.get('prj', 'river', 10, 10) is None
+        assert self.cache.get('prj', 'river', 0, 20) is None
+        assert self.cache.get('other', 'river', 0, 10) is None
+        assert self.cache.stats() == {'hits': 1, 'misses': 4}
+
+    def test_pages_invalidated_by_new_timestamp(self):
+        self.cache.set('prj', 'river', 0, 10, 'T1', self.page)
+        self.cache.set('prj', 'tree', 0, 10, 'T2', {'data': []})
+
+        assert self.cache.get('prj', 'river', 0, 10) is None
+        assert self.cache.get('prj', 'tree', 0, 10) == {'data': []}
+
+    def test_timestamp_expiry(self):
+        cache = PageCache(timeout=60, timestamp_timeout=0)
+        cache.set('prj', 'river', 0, 10, 'T1', self.page)
+        assert cache.get('prj', 'river', 0, 10) is None
+
+    def test_reset_stats(self):
+        self.cache.get('prj', 'river', 0, 10)
+        self.cache.reset_stats()
+        assert self.cache.stats() == {'hits': 0, 'misses': 0}
@@ -0,0 +1,158 @@
+import pytest
+import requests
+from django.test import TestCase
+from requests.adapters import BaseAdapter
+from unittest.mock import patch
+
+from organization.tests.factories import ProjectFactory
+from spatial.tests.factories import SpatialUnitFactory
+from .. import client as es_client
+from ..client import CircuitBreaker, ESClient, LatencyStats, get_client
+from ..exceptions import ESUnavailableError
+from .es_adapter import mock_es_client
+
+
+class RefusingAdapter(BaseAdapter):
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+        raise requests.exceptions.ConnectionError("Connection refused")
+
+    def close(self):
+        pass
+
+
+class Clock():
+
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+class CircuitBreakerTest(TestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(2, 30, clock=Clock())
+        breaker.failure()
+        assert not breaker.is_open
+        assert breaker.allow()
+        breaker.failure()
+        assert breaker.is_open
+        assert not breaker.allow()
+
+    def test_success_resets_failures(self):
+        breaker = CircuitBreaker(2, 30, clock=Clock())
+        breaker.failure()
+        breaker.success()
+        breaker.failure()
+        assert not breaker.is_open
+
+    def test_trial_call_after_reset_timeout(self):
+        clock = Clock()
+        breaker = CircuitBreaker(1, 30, clock=clock)
+        breaker.failure()
+        clock.time = 29
+        assert not breaker.allow()
+        clock.time = 30
+        assert breaker.allow()
+        assert not breaker.allow()
+
+        breaker.failure()
+        clock.time = 60
+        assert breaker.allow()
+        breaker.success()
+        assert not breaker.is_open
+        assert breaker.allow()
+
+
+class LatencyStatsTest(TestCase):
+
+    def test_snapshot(self):
+        stats = LatencyStats()
+        stats.record('search', 0.1)
+        stats.record('search', 0.3, ok=False)
+        stats.record('msearch', 0.2)
+
+        snapshot = stats.snapshot()
+        assert snapshot['search']['count'] == 2
+        assert snapshot['search']['errors'] == 1
+        assert snapshot['search']['max'] == 0.3
+        assert snapshot['search']['mean'] == pytest.approx(0.2)
+        assert snapshot['msearch']['count'] == 1
+
+        stats.reset()
+        assert stats.snapshot() == {}
+
+
+class ESClientTest(TestCase):
+
+    def setUp(self):
+        self.project = ProjectFactory.create()
+        self.locations = SpatialUnitFactory.create_batch(
+            3, project=self.project)
+        self.client, self.adapter = mock_es_client(self)
+        self.index = 'project-{}'.format(self.project.id)
+
+    def test_search(self):
+        results = self.client.search(
+            self.index, ('spatial', 'party', 'resource'),
+            {'query': {'bool': {}}, 'size': 2})
+        assert results['hits']['total'] == 3
+        assert len(results['hits']['hits']) == 2
+        assert self.adapter.requests == [(
+            'POST',
+            '/{}/spatial,party,resource/_search/'.format(self.index))]
+        assert self.client.stats.snapshot()['search']['count'] == 1
+
+    def test_msearch(self):
+        responses = self.client.msearch(self.index, [
+            ({'type': ['spatial', 'party', 'resource']},
+             {'query': {'bool': {}}}),
+            ({'type': ['project']}, {'query': {'match_all': {}}, 'size': 1}),
+        ])
+        assert len(responses) == 2
+        assert responses[0]['hits']['total'] == 3
+        assert 'hits' in responses[1]
+        assert len(self.adapter.requests) == 1
+
+    def test_request_with_error_status(self):
+        with pytest.raises(ESUnavailableError):
+            self.client.search(self.index, ('spatial', 'party', 'resource'), {
+                'query': {'bool': {'should': [
+                    {'multi_match': {'query': 'error'}}]}},
+            })
+        assert self.client.breaker.failures == 1
+        assert self.client.stats.snapshot()['search']['errors'] == 1
+
+    def test_client_error_does_not_trip_breaker(self):
+        with pytest.raises(ESUnavailableError):
+            self.client.request('POST', 'scroll', '/_search/scroll',
+                                {'scroll_id': 'missing'})
+        assert self.client.breaker.failures == 0
+
+    def test_circuit_opens_when_es_is_down(self):
+        client = ESClient(breaker=CircuitBreaker(2, 30))
+        adapter = RefusingAdapter()
+        client.session.mount(client.api_url, adapter)
+
+        for i in range(3):
+            with pytest.raises(ESUnavailableError):
+                client.msearch(self.index, [({}, {})])
+        assert adapter.calls == 2
+        assert client.breaker.is_open
+        assert client.stats.snapshot()['msearch']['errors'] == 2
+
+
+class GetClientTest(TestCase):
+
+    def test_shared_client(self):
+        with patch.object(es_client, '_client', None):
+            client = get_client()
+            assert isinstance(client, ESClient)
+            assert get_client() is client
@@ -1,9 +1,12 @@
 import csv
+import hashlib
 import io
 import json
 import os
 import pytest
 import shutil
+import time
+from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
@@ -26,10 +29,18 @@ from questionnaires.managers import create_attrs_schema
 from questionnaires.tests import attr_schemas
 from questionnaires.tests.factories import QuestionnaireFactory
 from .fake_results import get_fake_es_api_results
+from .es_adapter import mock_es_client
+from .fileserver import FileServer
+from ..exceptions import (ESUnavailableError, ResourceFetchError,
+                          ResourceMissingError)
+from ..mock_es import views as mock_es_views
 from ..export.base import Exporter
-from ..export.all import AllExporter
+from ..export import dump
+from ..export.all import AllExporter, BatchWriter
+from ..export.fetch import RateLimiter, ResourceFetcher
 from ..export.resource import ResourceExporter
 from ..export.shape import ShapeExporter
+from ..export.source import SearchSource
 from ..export.xls import XLSExporter
 from ..export.utils import (convert_postgis_ewkb_to_ewkt,
                             NotWgs84EwkbValueError)
@@ -37,6 +48,14 @@ from ..export.utils import (convert_postgis_ewkb_to_ewkt,
 
 test_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
 
+# Resource files in the test ES dumps are fetched from a local server
+EXAMPLE_URL = 'https://example.com/'
+RESOURCE_FILES = {
+    'text.csv': b'a,b\n1,2\n',
+    'text1.csv': b'a,b\n1,2\n',
+    'text2.csv': b'c,d\n3,4\n',
+}
+
 
 class BaseTestClass(UserTestCase, TestCase):
     """Base test class that uses the "standard" test project schema."""
@@ -550,6 +569,11 @@ class XLSExporterTest(BaseTestClass):
 @pytest.mark.usefixtures('make_dirs')
 class ResourceExporterTest(BaseTestClass):
 
+    def setUp(self):
+        super().setUp()
+        self.server = FileServer(RESOURCE_FILES).__enter__()
+        self.addCleanup(self.server.__exit__)
+
     def test_make_download(self):
         res = ResourceFactory.create(project=self.project)
         loc1 = SpatialUnitFactory.create(project=self.project)
@@ -570,12 +594,14 @@ class ResourceExporterTest(BaseTestClass):
         es_dump_path = os.path.join(test_dir, 'test-res1-orig.esjson')
         shutil.copy(original_es_dump_path, es_dump_path)
 
-        # Rewrite the ES dump file to inject the resource ID
+        # Rewrite the ES dump file to inject the resource ID and to fetch
+        # the resource files from the local server
         with open(es_dump_path, 'r') as infile:
             es_dump_path = os.path.join(test_dir, 'test-res1.esjson')
             fwrite = open(es_dump_path, 'w')
             for line in infile:
-                fwrite.write(line.replace('ID3', res.id))
+                line = line.replace('ID3', res.id)
+                fwrite.write(line.replace(EXAMPLE_URL, self.server.url('')))
             fwrite.close()
 
         exporter = ResourceExporter(self.project)
@@ -589,6 +615,7 @@ class ResourceExporterTest(BaseTestClass):
             assert len(files) == 2
             assert 'resources.xlsx' in files
             assert 'resources/baby_goat.jpeg' in files
+            assert myzip.read('resources/baby_goat.jpeg') == b'a,b\n1,2\n'
 
             myzip.extract('resources.xlsx', test_dir)
             wb = load_workbook(os.path.join(test_dir, 'resources.xlsx'))
@@ -620,7 +647,11 @@ class ResourceExporterTest(BaseTestClass):
             'search/tests/files/test_es_dump_dupe_resources.esjson'
         )
         es_dump_path = os.path.join(test_dir, 'test-res2.esjson')
-        shutil.copy(original_es_dump_path, es_dump_path)
+        with open(original_es_dump_path, 'r') as infile:
+            with open(es_dump_path, 'w') as fwrite:
+                for line in infile:
+                    fwrite.write(
+                        line.replace(EXAMPLE_URL, self.server.url('')))
 
         exporter = ResourceExporter(self.project)
         zip_path, mime_type = exporter.make_download(es_dump_path)
@@ -634,6 +665,8 @@ class ResourceExporterTest(BaseTestClass):
             assert 'resources.xlsx' in files
             assert 'resources/text.csv' in files
             assert 'resources/text (2).csv' in files
+            assert myzip.read('resources/text.csv') == b'a,b\n1,2\n'
+            assert myzip.read('resources/text (2).csv') == b'c,d\n3,4\n'
 
             myzip.extract('resources.xlsx', test_dir)
             wb = load_workbook(os.path.join(test_dir, 'resources.xlsx'))
@@ -654,6 +687,8 @@ class ResourceExporterTest(BaseTestClass):
             assert ws['E2'].value is None
             assert ws['F2'].value is None
             assert ws['G2'].value is None
+            assert ws['H1'].value == 'md5'
+            assert ws['I1'].value == 'missing'
             assert ws['A3'].value == 'ID4'
             assert ws['B3'].value == "File 2"
             assert ws['C3'].value == "Description 2"
@@ -661,6 +696,95 @@ class ResourceExporterTest(BaseTestClass):
             assert ws['E3'].value is None
             assert ws['F3'].value is None
             assert ws['G3'].value is None
+            assert ws['H2'].value == hashlib.md5(b'a,b\n1,2\n').hexdigest()
+            assert ws['I2'].value is False
+            assert ws['H3'].value == hashlib.md5(b'c,d\n3,4\n').hexdigest()
+            assert ws['I3'].value is False
+
+    def test_make_download_with_missing_file(self):
+        ensure_dirs()
+        original_es_dump_path = os.path.join(
+            os.path.dirname(settings.BASE_DIR),
+            'search/tests/files/test_es_dump_dupe_resources.esjson'
+        )
+        es_dump_path = os.path.join(test_dir, 'test-res-missing.esjson')
+        with open(original_es_dump_path, 'r') as infile:
+            with open(es_dump_path, 'w') as fwrite:
+                for line in infile:
+                    line = line.replace('text1.csv', 'missing.csv')
+                    fwrite.write(
+                        line.replace(EXAMPLE_URL, self.server.url('')))
+
+        exporter = ResourceExporter(self.project)
+        zip_path, _ = exporter.make_download(es_dump_path)
+
+        with ZipFile(zip_path) as myzip:
+            files = myzip.namelist()
+            assert len(files) == 2
+            assert 'resources.xlsx' in files
+            assert myzip.read('resources/text.csv') == b'c,d\n3,4\n'
+
+            myzip.extract('resources.xlsx', test_dir)
+            wb = load_workbook(os.path.join(test_dir, 'resources.xlsx'))
+            ws = wb['resources']
+            assert ws['A2'].value == 'ID3'
+            assert ws['D2'].value == 'text.csv'
+            assert ws['H2'].value is None
+            assert ws['I2'].value is True
+            assert ws['A3'].value == 'ID4'
+            assert ws['D3'].value == 'text.csv'
+            assert ws['H3'].value == hashlib.md5(b'c,d\n3,4\n').hexdigest()
+            assert ws['I3'].value is False
+        assert sorted(self.server.requests) == ['missing.csv', 'text2.csv']
+
+    def test_make_download_resolves_links_in_chunks(self):
+        resources = ResourceFactory.create_batch(5, project=self.project)
+        for res in resources:
+            ContentObject.objects.create(
+                resource=res,
+                content_object=SpatialUnitFactory.create(
+                    project=self.project))
+
+        ensure_dirs()
+        es_dump_path = os.path.join(test_dir, 'test-res4.esjson')
+        with open(es_dump_path, 'w') as f:
+            for res in resources:
+                f.write(json.dumps({'index': {'_type': 'resource'}}) + '\n')
+                f.write(json.dumps({
+                    'id': res.id, 'name': res.name, 'description': '',
+                    'file': self.server.url('text.csv'),
+                    'original_file': 'text.csv'}) + '\n')
+
+        exporter = ResourceExporter(self.project)
+        with patch('search.export.resource.LINK_CHUNK_SIZE', 2):
+            with self.assertNumQueries(3):
+                zip_path, _ = exporter.make_download(es_dump_path)
+
+        with ZipFile(zip_path) as myzip:
+            myzip.extract('resources.xlsx', test_dir)
+        ws = load_workbook(os.path.join(test_dir, 'resources.xlsx'))[
+            'resources']
+        for row, res in enumerate(resources, start=2):
+            assert ws['A{}'.format(row)].value == res.id
+            assert ws['E{}'.format(row)].value == (
+                res.content_objects.get().object_id)
+
+    def test_get_links(self):
+        res = ResourceFactory.create(project=self.project)
+        unlinked = ResourceFactory.create(project=self.project)
+        loc = SpatialUnitFactory.create(project=self.project)
+        par = PartyFactory.create(project=self.project)
+        rel = TenureRelationshipFactory.create(project=self.project)
+        ContentObject.objects.create(resource=res, content_object=loc)
+        ContentObject.objects.create(resource=res, content_object=par)
+        ContentObject.objects.create(resource=res, content_object=rel)
+        ContentObject.objects.create(resource=res,
+                                     content_object=self.project)
+
+        exporter = ResourceExporter(self.project)
+        with self.assertNumQueries(1):
+            links = exporter.get_links([res.id, unlinked.id])
+        assert links == {res.id: ([loc.id], [par.id], [rel.id])}
 
     def test_make_download_empty(self):
         ensure_dirs()
@@ -683,6 +807,11 @@ class ResourceExporterTest(BaseTestClass):
 @pytest.mark.usefixtures('make_dirs')
 class AllExporterTest(BaseTestClass):
 
+    def setUp(self):
+        super().setUp()
+        self.server = FileServer(RESOURCE_FILES).__enter__()
+        self.addCleanup(self.server.__exit__)
+
     def test_make_download(self):
         res = ResourceFactory.create(project=self.project)
         loc1 = SpatialUnitFactory.create(project=self.project)
@@ -703,12 +832,14 @@ class AllExporterTest(BaseTestClass):
         es_dump_path = os.path.join(test_dir, 'test-all1-orig.esjson')
         shutil.copy(original_es_dump_path, es_dump_path)
 
-        # Rewrite the ES dump file to inject the resource ID
+        # Rewrite the ES dump file to inject the resource ID and to fetch
+        # the resource files from the local server
         with open(es_dump_path, 'r') as infile:
             es_dump_path = os.path.join(test_dir, 'test-all1.esjson')
             fwrite = open(es_dump_path, 'w')
             for line in infile:
-                fwrite.write(line.replace('ID3', res.id))
+                line = line.replace('ID3', res.id)
+                fwrite.write(line.replace(EXAMPLE_URL, self.server.url('')))
             fwrite.close()
 
         exporter = AllExporter(self.project)
@@ -723,6 +854,7 @@ class AllExporterTest(BaseTestClass):
             assert 'data.xlsx' in files
             assert 'resources.xlsx' in files
             assert 'resources/baby_goat.jpeg' in files
+            assert myzip.read('resources/baby_goat.jpeg') == b'a,b\n1,2\n'
             assert 'shape_files/README.txt' in files
             assert 'shape_files/point.dbf' in files
             assert 'shape_files/point.prj' in files
@@ -826,6 +958,261 @@ class AllExporterTest(BaseTestClass):
             assert sheetnames == ['Sheet']
             assert wb['Sheet']['A1'].value is None
 
+    def test_make_download_reads_dump_once(self):
+        ensure_dirs()
+        original_es_dump_path = os.path.join(
+            os.path.dirname(settings.BASE_DIR),
+            'search/tests/files/test_es_dump_dupe_resources.esjson'
+        )
+        es_dump_path = os.path.join(test_dir, 'test-all3.esjson')
+        with open(original_es_dump_path, 'r') as infile:
+            with open(es_dump_path, 'w') as fwrite:
+                for line in infile:
+                    fwrite.write(
+                        line.replace(EXAMPLE_URL, self.server.url('')))
+
+        exporter = AllExporter(self.project)
+        with patch('search.export.dump.read_batches',
+                   wraps=dump.read_batches) as read_batches:
+            zip_path, _ = exporter.make_download(es_dump_path)
+        assert read_batches.call_count == 1
+
+        with ZipFile(zip_path) as myzip:
+            assert sorted(myzip.namelist()) == [
+                'data.xlsx', 'resources.xlsx', 'resources/text (2).csv',
+                'resources/text.csv']
+        assert exporter.xls_exporter.schema_attrs is (
+            exporter.shp_exporter.schema_attrs)
+        assert not os.path.exists(os.path.join(test_dir, 'test-all3.xlsx'))
+        assert not os.path.exists(
+            os.path.join(test_dir, 'test-all3-shp-dir'))
+
+
+class BatchWriterTest(TestCase):
+
+    def test_write(self):
+        written = []
+        writer = BatchWriter(written.append)
+        writer.start()
+        writer.put([1, 2])
+        writer.put([3])
+        writer.stop()
+        assert written == [[1, 2], [3]]
+        assert writer.error is None
+
+    def test_write_error(self):
+        def write_batch(batch):
+            raise ValueError(batch)
+
+        writer = BatchWriter(write_batch)
+        writer.start()
+        writer.put([1])
+        writer.stop()
+        assert isinstance(writer.error, ValueError)
+        with pytest.raises(ValueError):
+            writer.put([2])
+
+
+class DumpTest(TestCase):
+
+    def setUp(self):
+        self.es_dump_path = os.path.join(
+            os.path.dirname(settings.BASE_DIR),
+            'search/tests/files/test_es_dump_basic.esjson'
+        )
+
+    def test_get_type(self):
+        assert dump.get_type('{"index": {"_type": "spatial"} }') == 'spatial'
+        assert dump.get_type('{"index": {"_type" : "party"}}') == 'party'
+        # Falls back to parsing the line as JSON
+        assert dump.get_type(
+            '{"index": {"\\u005ftype": "party"}}') == 'party'
+
+    def test_read_batches(self):
+        batches = list(dump.read_batches(self.es_dump_path, 2))
+        assert [[es_type for es_type, _ in b] for b in batches] == [
+            ['spatial', 'party'], ['party']]
+        assert json.loads(batches[0][0][1])['id'] == 'ID0'
+
+    def test_iter_batches(self):
+        batches = list(dump.iter_batches(self.es_dump_path, workers=1,
+                                         batch_size=2))
+        assert len(batches) == 2
+        entities = [e for batch in batches for e in batch]
+        assert [kind for kind, _ in entities] == [
+            'location', 'party', 'tenure_rel']
+
+        kind, location = entities[0]
+        assert location['id'] == 'ID0'
+        assert location['geometry.ewkt'] == 'SRID=4326;POINT (1 1)'
+        assert location['geometry.wkt'] == 'POINT (1 1)'
+        assert location['attributes']['quality'] == 'point'
+
+        kind, rel = entities[2]
+        assert rel['id'] == 'ID2'
+        assert rel['party_id'] == 'ID1'
+        assert rel['tenure_type.label'] == 'Customary Rights'
+
+    def test_iter_batches_in_processes(self):
+        inline = list(dump.iter_batches(self.es_dump_path, workers=1,
+                                        batch_size=1))
+        parallel = list(dump.iter_batches(self.es_dump_path, workers=2,
+                                          batch_size=1, parallel_size=0))
+        assert parallel == inline
+
+
+class SearchSourceTest(UserTestCase, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.project = ProjectFactory.create()
+        self.locations = SpatialUnitFactory.create_batch(
+            5, project=self.project, geometry='SRID=4326;POINT(1 1)')
+        self.parties = PartyFactory.create_batch(3, project=self.project)
+        ResourceFactory.create(project=self.project)
+
+        self.client, self.adapter = mock_es_client(self)
+
+        ensure_dirs()
+        self.base_path = os.path.join(test_dir, 'test-source')
+
+    def test_batches(self):
+        source = SearchSource(self.project.id, 'test', self.base_path,
+                              page_size=2)
+        batches = list(source.batches())
+
+        assert all(len(batch) <= 2 for batch in batches)
+        entities = [e for batch in batches for e in batch]
+        assert sorted(s['id'] for k, s in entities if k == 'location') == (
+            sorted(loc.id for loc in self.locations))
+        assert sorted(s['id'] for k, s in entities if k == 'party') == (
+            sorted(party.id for party in self.parties))
+        assert len(entities) == 8
+        assert entities[0][1]['geometry.ewkt'] == 'SRID=4326;POINT (1 1)'
+
+        # 9 results in pages of 2, then the scroll is cleared
+        methods = [method for method, _ in self.adapter.requests]
+        assert methods == ['POST'] * 6 + ['DELETE']
+        assert mock_es_views.scrolls == {}
+
+    def test_batches_of_type(self):
+        source = SearchSource(self.project.id, 'test', self.base_path)
+        batches = list(source.batches(types=('resource',)))
+        assert len(batches) == 1
+        assert [kind for kind, _ in batches[0]] == ['resource']
+
+    def test_batches_with_error(self):
+        source = SearchSource(self.project.id, 'error', self.base_path)
+        with pytest.raises(ESUnavailableError):
+            list(source.batches())
+
+    def test_make_download(self):
+        source = SearchSource(self.project.id, 'test', self.base_path,
+                              page_size=3)
+        xls_path, _ = XLSExporter(self.project).make_download(source)
+
+        assert xls_path == self.base_path + '.xlsx'
+        wb = load_workbook(xls_path)
+        assert wb.get_sheet_names() == ['locations', 'parties']
+        assert wb['locations'].max_row == 6
+        assert wb['parties'].max_row == 4
+
+
+class ResourceFetcherTest(TestCase):
+
+    def test_fetch(self):
+        with FileServer(RESOURCE_FILES, etags={'text.csv': True}) as server:
+            download = ResourceFetcher().fetch(server.url('text.csv'))
+
+        with download.file as f:
+            assert f.read() == b'a,b\n1,2\n'
+        assert download.size == 8
+        assert download.md5 == hashlib.md5(b'a,b\n1,2\n').hexdigest()
+
+    def test_fetch_retries_server_errors(self):
+        with FileServer(RESOURCE_FILES, failures={'text.csv': 2}) as server:
+            fetcher = ResourceFetcher(attempts=3, backoff=0)
+            download = fetcher.fetch(server.url('text.csv'))
+
+        with download.file as f:
+            assert f.read() == b'a,b\n1,2\n'
+        assert server.requests == ['text.csv'] * 3
+
+    def test_fetch_gives_up_after_attempts(self):
+        with FileServer(RESOURCE_FILES, failures={'text.csv': 2}) as server:
+            fetcher = ResourceFetcher(attempts=2, backoff=0)
+            with pytest.raises(ResourceFetchError):
+                fetcher.fetch(server.url('text.csv'))
+        assert server.requests == ['text.csv'] * 2
+
+    def test_fetch_missing_file(self):
+        with FileServer(RESOURCE_FILES) as server:
+            fetcher = ResourceFetcher(attempts=3, backoff=0)
+            with pytest.raises(ResourceMissingError):
+                fetcher.fetch(server.url('missing.csv'))
+            assert fetcher.fetch_existing(server.url('missing.csv')) is None
+        assert server.requests == ['missing.csv'] * 2
+
+    def test_fetch_checksum_mismatch(self):
+        etags = {'text.csv': hashlib.md5(b'other').hexdigest()}
+        with FileServer(RESOURCE_FILES, etags=etags) as server:
+            fetcher = ResourceFetcher(attempts=2, backoff=0)
+            with pytest.raises(ResourceFetchError):
+                fetcher.fetch(server.url('text.csv'))
+        assert server.requests == ['text.csv'] * 2
+
+    def test_fetch_all(self):
+        files = {'{}.txt'.format(i): str(i).encode() for i in range(20)}
+        items = ['{}.txt'.format(i) for i in range(20)]
+        with FileServer(files) as server:
+            fetcher = ResourceFetcher(workers=3)
+            results = []
+            for item, download in fetcher.fetch_all(items, server.url):
+                with download.file as f:
+                    results.append((item, f.read()))
+
+        assert results == [(item, files[item]) for item in items]
+
+    def test_fetch_all_with_missing_file(self):
+        files = {'{}.txt'.format(i): str(i).encode() for i in range(3)}
+        items = ['0.txt', 'missing.txt', '2.txt']
+        with FileServer(files) as server:
+            fetcher = ResourceFetcher(workers=2, attempts=3, backoff=0)
+            results = []
+            for item, download in fetcher.fetch_all(items, server.url):
+                if download is None:
+                    results.append((item, None))
+                    continue
+                with download.file as f:
+                    results.append((item, f.read()))
+
+        assert results == [('0.txt', b'0'), ('missing.txt', None),
+                           ('2.txt', b'2')]
+        assert server.requests.count('missing.txt') == 1
+
+    def test_fetch_all_reads_items_ahead(self):
+        read = []
+
+        def items():
+            for i in range(10):
+                read.append(i)
+                yield 'text.csv'
+
+        with FileServer(RESOURCE_FILES) as server:
+            downloads = ResourceFetcher(workers=2).fetch_all(items(),
+                                                             server.url)
+            next(downloads)[1].file.close()
+            assert read == [0, 1, 2, 3]
+            downloads.close()
+
+    def test_rate_limiter(self):
+        limiter = RateLimiter(1000)
+        start = time.monotonic()
+        limiter.consume(1000)
+        assert time.monotonic() - start < 0.1
+        limiter.consume(200)
+        assert time.monotonic() - start >= 0.15
+
 
 class UtilsTest(TestCase):
 
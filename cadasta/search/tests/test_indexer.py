@@ -0,0 +1,201 @@
+from io import StringIO
+from uuid import uuid4
+
+import pytest
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from unittest.mock import patch
+
+from organization.importers.bulk import BulkCreator
+from organization.tests.factories import ProjectFactory
+from party.models import Party
+from party.tests.factories import PartyFactory, TenureRelationshipFactory
+from spatial.models import SpatialUnit
+from spatial.tests.factories import SpatialUnitFactory
+from .. import indexer
+from ..documents import transform
+from ..exceptions import ESUnavailableError
+from ..mock_es import views as mock_es
+from ..models import IndexChange
+from .es_adapter import mock_es_client
+
+
+@override_settings(SEARCH_INDEX_CHANGES=True)
+class RecordChangesTest(TestCase):
+
+    def setUp(self):
+        self.project = ProjectFactory.create()
+
+    def test_save_records_change(self):
+        location = SpatialUnitFactory.create(project=self.project)
+        changes = list(IndexChange.objects.all())
+        assert len(changes) == 1
+        assert changes[0].project_id == self.project.id
+        assert changes[0].model == 'spatial.spatialunit'
+        assert changes[0].object_id == location.id
+        assert changes[0].deleted is False
+
+    def test_changes_are_coalesced(self):
+        location = SpatialUnitFactory.create(project=self.project)
+        location.type = 'BU'
+        location.save()
+        location_id = location.id
+        location.delete()
+
+        changes = list(IndexChange.objects.all())
+        assert len(changes) == 1
+        assert changes[0].object_id == location_id
+        assert changes[0].deleted is True
+
+    def test_unindexed_models_are_ignored(self):
+        indexer.record_changes([self.project])
+        assert IndexChange.objects.count() == 0
+
+    @override_settings(SEARCH_INDEX_CHANGES=False)
+    def test_disabled(self):
+        SpatialUnitFactory.create(project=self.project)
+        assert IndexChange.objects.count() == 0
+
+    def test_bulk_created_instances(self):
+        creator = BulkCreator((SpatialUnit, Party), batch_size=10,
+                              auto_flush=False)
+        creator.add(SpatialUnit(project=self.project, type='PA',
+                                geometry='SRID=4326;POINT(0 0)'))
+        creator.add(Party(project=self.project, name='Party', type='IN'))
+        assert IndexChange.objects.count() == 0
+
+        creator.flush()
+        assert sorted(IndexChange.objects.values_list('model', flat=True)) == [
+            'party.party', 'spatial.spatialunit']
+
+    def test_flush_scheduled_on_commit(self):
+        with patch('search.indexer.transaction.on_commit') as on_commit:
+            SpatialUnitFactory.create(project=self.project)
+        on_commit.assert_called_once_with(indexer.schedule_flush)
+
+
+@override_settings(SEARCH_INDEX_CHANGES=True)
+class FlushChangesTest(TestCase):
+
+    def setUp(self):
+        self.project = ProjectFactory.create()
+        self.index = 'project-{}'.format(self.project.id)
+        self.client, self.adapter = mock_es_client(self)
+        mock_es.bulk_actions.clear()
+        self.addCleanup(mock_es.bulk_actions.clear)
+
+    def test_flush_changes(self):
+        location = SpatialUnitFactory.create(project=self.project)
+        deleted = SpatialUnitFactory.create(project=self.project)
+        deleted_id = deleted.id
+        deleted.delete()
+
+        assert indexer.flush_changes() == 2
+        assert IndexChange.objects.count() == 0
+        assert self.adapter.requests == [('POST', '/_bulk')]
+
+        actions = [(action, metadata['_type'], metadata['_id'])
+                   for action, metadata, source in mock_es.bulk_actions]
+        assert actions == [
+            ('index', 'spatial', location.id),
+            ('delete', 'spatial', deleted_id),
+            ('update', 'project', self.project.id),
+        ]
+        action, metadata, source = mock_es.bulk_actions[0]
+        assert metadata['_index'] == self.index
+        assert source['id'] == location.id
+        assert source['type'] == location.type
+        action, metadata, source = mock_es.bulk_actions[2]
+        assert metadata['_index'] == self.index
+        assert source['doc']['@timestamp'] == (
+            mock_es.bulk_actions[0][2]['@timestamp'])
+        assert source['doc_as_upsert'] is True
+
+    def test_flush_in_batches(self):
+        SpatialUnitFactory.create_batch(3, project=self.project)
+        assert indexer.flush_changes(batch_size=2) == 3
+        assert len(self.adapter.requests) == 2
+        assert IndexChange.objects.count() == 0
+
+    def test_flush_without_changes(self):
+        assert indexer.flush_changes() == 0
+        assert self.adapter.requests == []
+
+    def test_party_change_reindexes_tenure_relationships(self):
+        with override_settings(SEARCH_INDEX_CHANGES=False):
+            tenure_rel = TenureRelationshipFactory.create(
+                project=self.project)
+        party = tenure_rel.party
+        party.name = 'New name'
+        party.save()
+
+        indexer.flush_changes()
+        indexed = {
+            metadata['_id']: source
+            for action, metadata, source in mock_es.bulk_actions
+            if action == 'index'
+        }
+        assert indexed[party.id]['name'] == 'New name'
+        assert indexed[party.id]['tenure_id'] is None
+        assert indexed[tenure_rel.id]['name'] == 'New name'
+        assert indexed[tenure_rel.id]['tenure_id'] == tenure_rel.id
+
+    def get_documents(self):
+        """Returns the entity documents that the bulk actions sent to the
+        mock ES leave in the index, by ES type and ``_id``."""
+        documents = {}
+        for action, metadata, source in mock_es.bulk_actions:
+            if metadata['_type'] == 'project':
+                continue
+            # ES generates the ids of documents indexed without one
+            key = (metadata['_type'], metadata.get('_id') or uuid4().hex)
+            if action == 'delete':
+                documents.pop(key, None)
+            else:
+                documents[key] = source
+        return documents
+
+    def test_changes_after_full_index(self):
+        with override_settings(SEARCH_INDEX_CHANGES=False):
+            location = SpatialUnitFactory.create(project=self.project,
+                                                 type='PA')
+            party = PartyFactory.create(project=self.project)
+
+        # Index the whole project, as a full reindex does
+        lines = []
+        for entity in (location, party):
+            action, source = transform(entity, bulk=True)
+            action['index']['_index'] = self.index
+            lines.extend([action, source])
+        self.client.request('POST', 'bulk', '/_bulk', lines, ndjson=True)
+        assert set(self.get_documents()) == {('spatial', location.id),
+                                             ('party', party.id)}
+
+        location.type = 'BU'
+        location.save()
+        indexer.flush_changes()
+        documents = self.get_documents()
+        assert set(documents) == {('spatial', location.id),
+                                  ('party', party.id)}
+        assert documents[('spatial', location.id)]['type'] == 'BU'
+
+        location.delete()
+        indexer.flush_changes()
+        assert set(self.get_documents()) == {('party', party.id)}
+
+    def test_changes_kept_when_es_is_unavailable(self):
+        SpatialUnitFactory.create(project=self.project)
+        with patch.object(self.client.breaker, 'allow', return_value=False):
+            with pytest.raises(ESUnavailableError):
+                indexer.flush_changes()
+            indexer.run_flush()
+        assert IndexChange.objects.count() == 1
+
+    def test_flushsearchindex_command(self):
+        PartyFactory.create(project=self.project)
+        out = StringIO()
+        call_command('flushsearchindex', stdout=out)
+        assert out.getvalue() == "Flushed 1 search index changes\n"
+        assert IndexChange.objects.count() == 0
+        assert mock_es.bulk_actions[0][0] == 'index'
@@ -69,6 +69,119 @@ class ParserTest(TestCase):
         assert p('+a   "-b+c"').asList() == [['+', 'a'], '"-b+c"']
         assert p('-a   "+b-c"').asList() == [['-', 'a'], '"+b-c"']
 
+    def test_tokenize(self):
+        queries = [
+            'a', '    a    ', 'a b', 'a___ b--- c+++', '"a    b"', '"a b" c',
+            '+a', '-a', '+"a  b"', 'b +a', '"b -a"', 'b+a', '+a b c',
+            '+a -"b +c"', '+a-"b +c"', '-a   +"b-c"', '+a   "-b+c"',
+            '+ a', '+', 'a +', '"a b', '"a"b', '""', '+""', '++a', '+-a',
+            'a\tb', '"a\tb"', '"a\nb"', '"a\\"b"', '"a b"c', '"a""b"',
+        ]
+        for q in queries:
+            assert parser.tokenize(q) == parser.query.parseString(q).asList()
+
+        assert parser.tokenize('') == []
+        assert parser.tokenize(' \t\n') == []
+
+    def test_normalize_query(self):
+        assert parser.normalize_query('  a   +b  "c  d" - e') == (
+            'a\n+b\n"c  d"\n-e')
+        # A term starting with a quote does not become part of a phrase
+        query = '"a\nb "'
+        assert parser.tokenize(parser.normalize_query(query)) == (
+            parser.tokenize(query))
+
+    def test_split_terms(self):
+        assert parser.split_terms('a +b -"c d" e - f') == (
+            ['b'], ['"c d"', 'f'], ['a', 'e'])
+        assert parser.split_terms(' ') == ([], [], [])
+
+    def test_parse_query_cached(self):
+        parser.parse_normalized_query.cache_clear()
+        dsl = parser.parse_query('a  +bc')
+        dsl['bool']['must'].clear()
+
+        assert parser.parse_query(' a +bc ') == parser.parse_query('a +bc')
+        assert len(parser.parse_query('a +bc')['bool']['must']) == 2
+        info = parser.parse_normalized_query.cache_info()
+        assert info.misses == 1
+        assert info.hits == 3
+
+    def test_parse_query_with_blank_string(self):
+        assert parser.parse_query(' ') == {
+            'bool': {'must_not': [{'match': {'archived': True}}]},
+        }
+
+    def test_parse_query_merges_clauses(self):
+        f = parser.fields
+
+        assert parser.parse_query('ab ab -c -"d e" -fg') == {
+            'bool': {
+                'should': [
+                    {'multi_match': {'query': 'ab', 'fields': f, 'boost': 20}},
+                    {'multi_match': {
+                        'query': 'ab',
+                        'fields': f,
+                        'fuzziness': 1,
+                        'prefix_length': 1,
+                        'boost': 2,
+                    }},
+                ],
+                'must_not': [
+                    {'multi_match': {
+                        'query': 'c fg',
+                        'fields': f,
+                        'boost': 1,
+                    }},
+                    {'multi_match': {
+                        'query': 'd e',
+                        'fields': f,
+                        'type': 'phrase',
+                        'boost': 1,
+                    }},
+                    {'match': {'archived': True}},
+                ],
+            }
+        }
+
+    def test_merge_clauses(self):
+        f = parser.fields
+        dsl = parser.transform_to_dsl(['ab', '"c"', 'ab', '"c"'])
+        assert parser.merge_clauses(dsl) == [
+            {'multi_match': {'query': 'ab', 'fields': f, 'boost': 20}},
+            {'multi_match': {
+                'query': 'ab',
+                'fields': f,
+                'fuzziness': 1,
+                'prefix_length': 1,
+                'boost': 2,
+            }},
+            {'multi_match': {
+                'query': 'c',
+                'fields': f,
+                'type': 'phrase',
+                'boost': 20,
+            }},
+        ]
+        # The clauses passed are not changed
+        assert dsl[0]['multi_match']['boost'] == 10
+        assert parser.merge_clauses(parser.transform_to_dsl(['ab'])) == (
+            parser.transform_to_dsl(['ab']))
+
+    def test_merge_excluded_terms(self):
+        f = parser.fields
+        dsl = parser.transform_to_dsl(['"a"', 'b', 'c'], has_fuzziness=False)
+        assert parser.merge_excluded_terms(dsl) == [
+            {'multi_match': {
+                'query': 'a',
+                'fields': f,
+                'type': 'phrase',
+                'boost': 1,
+            }},
+            {'multi_match': {'query': 'b c', 'fields': f, 'boost': 1}},
+        ]
+        assert dsl[1]['multi_match']['query'] == 'b'
+
     def test_parse_query(self):
         f = parser.fields
 
@@ -3,20 +3,21 @@
 import json
 import os
 # import pytest
-import requests
 import shutil
 import subprocess
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 # from django.core.exceptions import PermissionDenied
 # from django.core.urlresolvers import reverse
 # from django.http import Http404
 from django.template.loader import render_to_string
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 # from openpyxl import load_workbook
 from rest_framework.exceptions import PermissionDenied as APIPermissionDenied
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 # from urllib.parse import quote as url_quote
 # from zipfile import ZipFile
 
@@ -30,7 +31,7 @@ from core.tests.utils.files import make_dirs  # noqa
 from organization.tests.factories import ProjectFactory
 from spatial.models import SpatialUnit
 from spatial.tests.factories import SpatialUnitFactory
-from party.models import Party, TenureRelationship
+from party.models import Party, TenureRelationship, TenureRelationshipType
 from party.tests.factories import PartyFactory, TenureRelationshipFactory
 from resources.models import Resource
 from resources.tests.factories import ResourceFactory
@@ -39,8 +40,11 @@ from resources.utils.io import ensure_dirs
 from questionnaires.managers import create_attrs_schema
 from questionnaires.tests import attr_schemas
 from questionnaires.tests.factories import QuestionnaireFactory
+from ..cache import page_cache
+from ..exceptions import ESUnavailableError, SearchUnavailableError
 from ..parser import parse_query
 from ..views import async
+from .es_adapter import mock_es_client
 from .fake_results import get_fake_es_api_results
 
 
@@ -48,6 +52,9 @@ api_url = (
     settings.ES_SCHEME + '://' + settings.ES_HOST + ':' + settings.ES_PORT)
 test_dir = os.path.join(settings.MEDIA_ROOT, 'temp')
 
+ES_ONLY = ('search.backends.ElasticsearchBackend',)
+POSTGRES_ONLY = ('search.backends.PostgresBackend',)
+
 
 def assign_policies(user):
     clauses = {
@@ -65,10 +72,6 @@ def assign_policies(user):
     assign_user_policies(user, policy)
 
 
-def mock_request_with_exception(*args, **kwargs):
-    raise requests.exceptions.ConnectionError
-
-
 class SearchAPITest(APITestCase, UserTestCase, TestCase):
 
     view_class = async.Search
@@ -134,9 +137,11 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
             'size': 20,
             'sort': {'_score': {'order': 'desc'}},
         }
-        url = '{}/project-{}/spatial,party,resource/_search/'
-        self.es_endpoint = url.format(api_url, self.project.id)
-        self.es_body = json.dumps(self.query_body, sort_keys=True)
+        self.es_index = 'project-{}'.format(self.project.id)
+        self.es_searches = [
+            ({'type': ['spatial', 'party', 'resource']}, self.query_body),
+            ({'type': ['project']}, {'query': {'match_all': {}}, 'size': 1}),
+        ]
 
     def setup_url_kwargs(self):
         return {
@@ -144,23 +149,23 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
             'project': self.project.slug,
         }
 
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_results(self, mock_post, mock_get):
-        mock_post.return_value.status_code = 200
-        mock_post.return_value.json.return_value = {
-            'hits': {
-                'total': 100,
-                'hits': [{
-                    '_type': 'spatial',
-                    '_source': {
-                        'id': self.su.id,
-                        'type': 'AP',
-                        '@timestamp': 'TIMESTAMP',
-                    },
-                }],
+    def msearch_responses(self, hits, total=100):
+        return [
+            {'hits': {'total': total, 'hits': hits}},
+            {'hits': {'hits': [{'_source': {'@timestamp': 'INDEX_TIME'}}]}},
+        ]
+
+    @patch('search.backends.get_client')
+    def test_post_with_results(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = self.msearch_responses([{
+            '_type': 'spatial',
+            '_source': {
+                'id': self.su.id,
+                'type': 'AP',
+                '@timestamp': 'TIMESTAMP',
             },
-        }
+        }])
 
         response = self.request(user=self.user, method='POST')
         expected_html = render_to_string(
@@ -178,31 +183,19 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
         assert response.content['recordsFiltered'] == 100
         assert response.content['draw'] == 40
         assert response.content['timestamp'] == 'TIMESTAMP'
-        mock_post.assert_called_once_with(
-            self.es_endpoint,
-            data=self.es_body,
-            headers={'content-type': 'application/json'},
-            timeout=10,
-        )
-        mock_get.assert_not_called()
-
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_over_max_results(self, mock_post, mock_get):
-        mock_post.return_value.status_code = 200
-        mock_post.return_value.json.return_value = {
-            'hits': {
-                'total': settings.ES_MAX_RESULTS + 1000,
-                'hits': [{
-                    '_type': 'spatial',
-                    '_source': {
-                        'id': self.su.id,
-                        'type': 'AP',
-                        '@timestamp': 'TIMESTAMP',
-                    },
-                }],
+        msearch.assert_called_once_with(self.es_index, self.es_searches)
+
+    @patch('search.backends.get_client')
+    def test_post_with_over_max_results(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = self.msearch_responses([{
+            '_type': 'spatial',
+            '_source': {
+                'id': self.su.id,
+                'type': 'AP',
+                '@timestamp': 'TIMESTAMP',
             },
-        }
+        }], total=settings.ES_MAX_RESULTS + 1000)
 
         response = self.request(user=self.user, method='POST')
         expected_html = render_to_string(
@@ -220,34 +213,12 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
         assert response.content['recordsFiltered'] == settings.ES_MAX_RESULTS
         assert response.content['draw'] == 40
         assert response.content['timestamp'] == 'TIMESTAMP'
-        mock_post.assert_called_once_with(
-            self.es_endpoint,
-            data=self.es_body,
-            headers={'content-type': 'application/json'},
-            timeout=10,
-        )
-        mock_get.assert_not_called()
-
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_no_results(self, mock_post, mock_get):
-        mock_post.return_value.status_code = 200
-        mock_post.return_value.json.return_value = {
-            'hits': {
-                'total': 100,
-                'hits': [],
-            },
-        }
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {
-            'hits': {
-                'hits': [{
-                    '_source': {
-                        '@timestamp': 'TIMESTAMP',
-                    },
-                }],
-            },
-        }
+        msearch.assert_called_once_with(self.es_index, self.es_searches)
+
+    @patch('search.backends.get_client')
+    def test_post_with_no_results(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = self.msearch_responses([])
 
         response = self.request(user=self.user, method='POST')
         assert response.status_code == 200
@@ -255,35 +226,18 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
         assert response.content['recordsTotal'] == 100
         assert response.content['recordsFiltered'] == 100
         assert response.content['draw'] == 40
-        assert response.content['timestamp'] == 'TIMESTAMP'
-        mock_post.assert_called_once_with(
-            self.es_endpoint,
-            data=self.es_body,
-            headers={'content-type': 'application/json'},
-            timeout=10,
-        )
-        mock_get.assert_called_once_with(
-            '{}/project-{}/project/_search/?q=*'.format(
-                api_url, self.project.id
-            ),
-            timeout=10,
-        )
-
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_project_result(self, mock_post, mock_get):
-        mock_post.return_value.status_code = 200
-        mock_post.return_value.json.return_value = {
-            'hits': {
-                'total': 100,
-                'hits': [{
-                    '_type': 'project',
-                    '_source': {
-                        '@timestamp': 'TIMESTAMP',
-                    },
-                }],
+        assert response.content['timestamp'] == 'INDEX_TIME'
+        msearch.assert_called_once_with(self.es_index, self.es_searches)
+
+    @patch('search.backends.get_client')
+    def test_post_with_project_result(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = self.msearch_responses([{
+            '_type': 'project',
+            '_source': {
+                '@timestamp': 'TIMESTAMP',
             },
-        }
+        }])
 
         response = self.request(user=self.user, method='POST')
         assert response.status_code == 200
@@ -292,30 +246,18 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
         assert response.content['recordsFiltered'] == 100
         assert response.content['draw'] == 40
         assert response.content['timestamp'] == 'TIMESTAMP'
-        mock_post.assert_called_once_with(
-            self.es_endpoint,
-            data=self.es_body,
-            headers={'content-type': 'application/json'},
-            timeout=10,
-        )
-        mock_get.assert_not_called()
-
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_null_id(self, mock_post, mock_get):
-        mock_post.return_value.status_code = 200
-        mock_post.return_value.json.return_value = {
-            'hits': {
-                'total': 100,
-                'hits': [{
-                    '_type': 'spatial',
-                    '_source': {
-                        'id': None,
-                        '@timestamp': 'TIMESTAMP',
-                    },
-                }],
+        msearch.assert_called_once_with(self.es_index, self.es_searches)
+
+    @patch('search.backends.get_client')
+    def test_post_with_null_id(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = self.msearch_responses([{
+            '_type': 'spatial',
+            '_source': {
+                'id': None,
+                '@timestamp': 'TIMESTAMP',
             },
-        }
+        }])
 
         response = self.request(user=self.user, method='POST')
         assert response.status_code == 200
@@ -324,17 +266,10 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
         assert response.content['recordsFiltered'] == 100
         assert response.content['draw'] == 40
         assert response.content['timestamp'] == 'TIMESTAMP'
-        mock_post.assert_called_once_with(
-            self.es_endpoint,
-            data=self.es_body,
-            headers={'content-type': 'application/json'},
-            timeout=10,
-        )
-        mock_get.assert_not_called()
+        msearch.assert_called_once_with(self.es_index, self.es_searches)
 
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_missing_query(self, mock_post, mock_get):
+    @patch('search.backends.get_client')
+    def test_post_with_missing_query(self, get_client):
         response = self.request(
             user=self.user, method='POST', post_data={'q': None})
         assert response.status_code == 200
@@ -343,12 +278,17 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
         assert response.content['recordsFiltered'] == 0
         assert response.content['draw'] == 40
         assert response.content['timestamp'] == ''
-        mock_post.assert_not_called()
-        mock_get.assert_not_called()
+        get_client.assert_not_called()
+
+    @override_settings(SEARCH_BACKENDS=ES_ONLY)
+    @patch('search.backends.get_client')
+    def test_post_with_es_not_ok(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = [
+            {'error': {'type': 'index_not_found_exception'}, 'status': 404},
+            {'error': {'type': 'index_not_found_exception'}, 'status': 404},
+        ]
 
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_es_not_ok(self, mock_post, mock_get):
         response = self.request(user=self.user, method='POST')
         assert response.status_code == 200
         assert response.content['data'] == []
@@ -356,17 +296,14 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
         assert response.content['recordsFiltered'] == 0
         assert response.content['draw'] == 40
         assert response.content['error'] == 'unavailable'
-        mock_post.assert_called_once_with(
-            self.es_endpoint,
-            data=self.es_body,
-            headers={'content-type': 'application/json'},
-            timeout=10,
-        )
-        mock_get.assert_not_called()
+        msearch.assert_called_once_with(self.es_index, self.es_searches)
+
+    @override_settings(SEARCH_BACKENDS=ES_ONLY)
+    @patch('search.backends.get_client')
+    def test_post_with_es_connection_not_ok(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.side_effect = ESUnavailableError('msearch', 'refused')
 
-    @patch('requests.get')
-    @patch('requests.post', new=mock_request_with_exception)
-    def test_post_with_es_connection_not_ok(self, mock_get):
         response = self.request(user=self.user, method='POST')
         assert response.status_code == 200
         assert response.content['data'] == []
@@ -374,118 +311,198 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
         assert response.content['recordsFiltered'] == 0
         assert response.content['draw'] == 40
         assert response.content['error'] == 'unavailable'
-        mock_get.assert_not_called()
 
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_nonexistent_org(self, mock_post, mock_get):
+    @patch('search.backends.get_client')
+    def test_post_with_postgres_fallback(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.side_effect = ESUnavailableError('msearch', 'refused')
+        page_cache.reset_stats()
+
+        response = self.request(user=self.user, method='POST', post_data={
+            'q': 'homeowner', 'start': 0})
+        assert response.status_code == 200
+        assert 'error' not in response.content
+        assert response.content['recordsTotal'] == 1
+        assert len(response.content['data']) == 1
+        assert self.party.get_absolute_url() in (
+            response.content['data'][0][0])
+
+        # Pages not read from an index are not cached
+        self.request(user=self.user, method='POST', post_data={
+            'q': 'homeowner', 'start': 0})
+        assert msearch.call_count == 2
+        assert page_cache.stats() == {'hits': 0, 'misses': 2}
+
+    @override_settings(SEARCH_BACKENDS=POSTGRES_ONLY)
+    def test_post_with_postgres_and_no_results(self):
+        response = self.request(user=self.user, method='POST', post_data={
+            'q': 'nothing', 'start': 0})
+        assert response.status_code == 200
+        assert response.content['data'] == []
+        assert response.content['recordsTotal'] == 0
+        assert response.content['timestamp']
+
+    @patch('search.backends.get_client')
+    def test_post_with_cached_page(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = self.msearch_responses([{
+            '_type': 'spatial',
+            '_source': {
+                'id': self.su.id,
+                'type': 'AP',
+                '@timestamp': 'TIMESTAMP',
+            },
+        }])
+        page_cache.reset_stats()
+
+        response = self.request(user=self.user, method='POST')
+        cached = self.request(user=self.user, method='POST',
+                              post_data={'draw': 41})
+        assert cached.status_code == 200
+        assert cached.content['draw'] == 41
+        assert cached.content['data'] == response.content['data']
+        assert cached.content['timestamp'] == 'TIMESTAMP'
+        msearch.assert_called_once_with(self.es_index, self.es_searches)
+        assert page_cache.stats() == {'hits': 1, 'misses': 1}
+
+    @patch('search.backends.get_client')
+    def test_post_after_reindex(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = self.msearch_responses([])
+        self.request(user=self.user, method='POST')
+
+        # The project was reindexed after its timestamp was cached
+        page_cache.set(self.project.id, 'other query', 0, 10, 'NEW_TIME', {})
+        self.request(user=self.user, method='POST')
+        assert msearch.call_count == 2
+
+    @patch('search.backends.get_client')
+    def test_post_with_unknown_timestamp(self, get_client):
+        msearch = get_client.return_value.msearch
+        msearch.return_value = [
+            {'hits': {'total': 0, 'hits': []}},
+            {'error': {'type': 'index_not_found_exception'}, 'status': 404},
+        ]
+
+        self.request(user=self.user, method='POST')
+        response = self.request(user=self.user, method='POST')
+        assert response.content['timestamp'] == "unknown"
+        assert msearch.call_count == 2
+
+    def test_post_with_mock_es(self):
+        client, adapter = mock_es_client(self)
+        response = self.request(
+            user=self.user, method='POST', post_data={'start': 0})
+        assert response.status_code == 200
+        assert len(response.content['data']) == 4
+        assert response.content['recordsTotal'] == 4
+        assert response.content['timestamp'] == '2017-01-01T01:23:45.678Z'
+        assert adapter.requests == [
+            ('POST', '/project-{}/_msearch'.format(self.project.id))]
+        assert client.stats.snapshot()['msearch']['count'] == 1
+
+    @patch('search.backends.get_client')
+    def test_post_with_nonexistent_org(self, get_client):
         response = self.request(user=self.user,
                                 method='POST',
                                 url_kwargs={'organization': 'evil-corp'})
         assert response.status_code == 404
         assert response.content['detail'] == "Project not found."
-        mock_post.assert_not_called()
-        mock_get.assert_not_called()
+        get_client.assert_not_called()
 
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_nonexistent_project(self, mock_post, mock_get):
+    @patch('search.backends.get_client')
+    def test_post_with_nonexistent_project(self, get_client):
         response = self.request(user=self.user,
                                 method='POST',
                                 url_kwargs={'project': 'world-domination'})
         assert response.status_code == 404
         assert response.content['detail'] == "Project not found."
-        mock_post.assert_not_called()
-        mock_get.assert_not_called()
+        get_client.assert_not_called()
 
-    @patch('requests.get')
-    @patch('requests.post')
-    def test_post_with_unauthorized_user(self, mock_post, mock_get):
+    @patch('search.backends.get_client')
+    def test_post_with_unauthorized_user(self, get_client):
         response = self.request(method='POST')
         assert response.status_code == 403
         assert response.content['detail'] == APIPermissionDenied.default_detail
-        mock_post.assert_not_called()
-        mock_get.assert_not_called()
-
-    @patch('requests.post')
-    def test_query_es(self, mock_post):
-        mock_post.return_value.status_code = 200
-        mock_post.return_value.json.return_value = {
-            'hits': {
-                'total': 0,
-                'hits': [],
-            },
-        }
-
-        raw_results = self.view_class().query_es(
+        get_client.assert_not_called()
+
+    def test_query(self):
+        unavailable = Mock()
+        unavailable.search.side_effect = SearchUnavailableError()
+        available = Mock()
+        available.search.return_value = ({'hits': {}}, 'INDEX_TIME')
+        with patch('search.views.async.get_backends',
+                   return_value=[unavailable, available]):
+            assert self.view_class().query(
+                self.project.id, self.query, 10, 20) == (
+                {'hits': {}}, 'INDEX_TIME')
+        unavailable.search.assert_called_once_with(
             self.project.id, self.query, 10, 20)
-        assert raw_results == mock_post.return_value.json.return_value
-        mock_post.assert_called_once_with(
-            self.es_endpoint,
-            data=self.es_body,
-            headers={'content-type': 'application/json'},
-            timeout=10,
-        )
-
-    @patch('requests.post')
-    def test_query_es_not_ok(self, mock_post):
-        mock_post.return_value.status_code = 404
-
-        raw_results = self.view_class().query_es(
+        available.search.assert_called_once_with(
             self.project.id, self.query, 10, 20)
-        assert raw_results is None
-        mock_post.assert_called_once_with(
-            self.es_endpoint,
-            data=self.es_body,
-            headers={'content-type': 'application/json'},
-            timeout=10,
-        )
 
-    @patch('requests.post', new=mock_request_with_exception)
-    def test_query_es_connection_not_ok(self):
-        raw_results = self.view_class().query_es(
-            self.project.id, self.query, 10, 20)
-        assert raw_results is None
-
-    @patch('requests.get')
-    def test_query_es_timestamp(self, mock_get):
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = {
-            'hits': {
-                'hits': [{
-                    '_source': {
-                        '@timestamp': 'TIMESTAMP',
-                    },
-                }],
-            },
-        }
+    def test_query_unavailable(self):
+        unavailable = Mock()
+        unavailable.search.side_effect = SearchUnavailableError()
+        with patch('search.views.async.get_backends',
+                   return_value=[unavailable]):
+            assert self.view_class().query(
+                self.project.id, self.query, 10, 20) == (None, None)
+
+    def test_hydrate(self):
+        results = self.results['hits']['hits'][1:]
+        with self.assertNumQueries(4):
+            entities = self.view_class().hydrate(results)
+        assert entities[SpatialUnit] == {self.su.id: self.su}
+        assert entities[TenureRelationship] == {
+            self.tenure_rel.id: self.tenure_rel}
+        assert entities[Party] == {self.party.id: self.party}
+        assert entities[Resource] == {self.resource.id: self.resource}
+
+    def test_hydrate_ignores_unsupported_es_types(self):
+        with self.assertNumQueries(0):
+            assert self.view_class().hydrate([self.proj_result]) == {}
+
+    def test_augment_results_from_hydrated_entities(self):
+        view = self.view_class()
+        results = self.results['hits']['hits'][1:]
+        entities = view.hydrate(results)
+        schemas = {}
+        TenureRelationshipType.objects.get_all_cached()
+        with self.assertNumQueries(0):
+            for result in results[1:]:
+                assert view.augment_result(
+                    result, entities=entities, schemas=schemas) is not None
+        augmented_result = view.augment_result(
+            results[0], entities=entities, schemas=schemas)
+        assert augmented_result['url'] == self.su.get_absolute_url()
+        assert augmented_result['attributes'] == []
 
-        timestamp = self.view_class().query_es_timestamp(self.project.id)
-        assert timestamp == 'TIMESTAMP'
-        mock_get.assert_called_once_with(
-            '{}/project-{}/project/_search/?q=*'.format(
-                api_url, self.project.id
-            ),
-            timeout=10,
-        )
+    def test_augment_page_of_locations_with_constant_queries(self):
+        view = self.view_class()
 
-    @patch('requests.get')
-    def test_query_es_timestamp_not_ok(self, mock_get):
-        mock_get.return_value.status_code = 404
-
-        timestamp = self.view_class().query_es_timestamp(self.project.id)
-        assert timestamp == "unknown"
-        mock_get.assert_called_once_with(
-            '{}/project-{}/project/_search/?q=*'.format(
-                api_url, self.project.id
-            ),
-            timeout=10,
-        )
+        def count_queries(results):
+            with CaptureQueriesContext(connection) as queries:
+                entities = view.hydrate(results)
+                schemas = {}
+                for result in results:
+                    view.augment_result(
+                        result, entities=entities, schemas=schemas)
+            return len(queries)
 
-    @patch('requests.get', new=mock_request_with_exception)
-    def test_query_es_timestamp_connection_not_ok(self):
-        timestamp = self.view_class().query_es_timestamp(self.project.id)
-        assert timestamp == "unknown"
+        results = [{
+            '_type': 'spatial',
+            '_source': {'id': su.id, 'type': 'PA'},
+        } for su in SpatialUnitFactory.create_batch(10, project=self.project)]
+        assert count_queries(results) == count_queries(results[:1])
+
+    def test_get_schema_attributes_cached(self):
+        view = self.view_class()
+        schemas = {}
+        attrs = view.get_schema_attributes(self.su, schemas)
+        with self.assertNumQueries(0):
+            assert view.get_schema_attributes(self.su, schemas) == attrs
+        assert list(schemas.values()) == [attrs]
 
     def test_augment_result_location(self):
         augmented_result = self.view_class().augment_result(self.su_result)
@@ -549,6 +566,23 @@ class SearchAPITest(APITestCase, UserTestCase, TestCase):
         assert self.view_class().get_entity(
             'resource', self.resource_result['_source']) == self.resource
 
+    def test_get_entity_from_entities(self):
+        entities = {
+            SpatialUnit: {self.su.id: self.su},
+            Party: {self.party.id: self.party},
+        }
+        with self.assertNumQueries(0):
+            assert self.view_class().get_entity(
+                'spatial', self.su_result['_source'],
+                entities=entities) == self.su
+            # Falls back to the party when the tenure relationship is missing
+            assert self.view_class().get_entity(
+                'party', self.tenure_rel_result['_source'],
+                entities=entities) == self.party
+            assert self.view_class().get_entity(
+                'resource', self.resource_result['_source'],
+                entities=entities) is None
+
     def test_get_entity_null_id(self):
         assert self.view_class().get_entity('spatial', {'id': None}) is None
 
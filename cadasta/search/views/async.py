@@ -1,7 +1,6 @@
-import json
 # import os
-import requests
-# import subprocess
+import logging
+from collections import defaultdict
 # import time
 
 from django.conf import settings
@@ -12,7 +11,6 @@ from django.template.loader import render_to_string
 # from django.views.generic.base import View
 from rest_framework.views import APIView
 from rest_framework.response import Response
-# from urllib.parse import quote as url_quote
 
 from jsonattrs.models import Schema
 from tutelary import mixins as tmixins
@@ -20,20 +18,58 @@ from tutelary import mixins as tmixins
 # from organization import messages as org_messages
 from organization.views.mixins import ProjectMixin
 from spatial.models import SpatialUnit
-from spatial.choices import TYPE_CHOICES as SPATIAL_TYPE_CHOICES
+from spatial.choices import TYPE_CHOICES_DICT as spatial_type_choices
 from party.models import Party, TenureRelationship, TenureRelationshipType
 from resources.models import Resource
-from ..parser import parse_query
+from ..backends import get_backends
+from ..cache import page_cache
+from ..documents import get_timestamp
+from ..exceptions import SearchUnavailableError
 # from ..export.all import AllExporter
 # from ..export.resource import ResourceExporter
 # from ..export.shape import ShapeExporter
+# from ..export.source import SearchSource
 # from ..export.xls import XLSExporter
 
-api_url = (
-    settings.ES_SCHEME + '://' + settings.ES_HOST + ':' + settings.ES_PORT)
-spatial_type_choices = {c[0]: c[1] for c in SPATIAL_TYPE_CHOICES}
+logger = logging.getLogger('search.views')
+
 party_type_choices = {c[0]: c[1] for c in Party.TYPE_CHOICES}
 
+# Models of the results of each ES type, in lookup order, with the field
+# of the source document holding the database ID
+entity_mappings = {
+    'spatial': (
+        {
+            'model': SpatialUnit,
+            'id_field_name': 'id',
+        },
+    ),
+    'party': (
+        {
+            'model': TenureRelationship,
+            'id_field_name': 'tenure_id',
+        },
+        {
+            'model': Party,
+            'id_field_name': 'id',
+        },
+    ),
+    'resource': (
+        {
+            'model': Resource,
+            'id_field_name': 'id',
+        },
+    ),
+}
+
+# Relations used to render the results of each model
+entity_related_fields = {
+    SpatialUnit: ('project__organization',),
+    TenureRelationship: ('project__organization', 'spatial_unit'),
+    Party: ('project__organization',),
+    Resource: ('project__organization',),
+}
+
 
 class Search(tmixins.APIPermissionRequiredMixin, ProjectMixin, APIView):
 
@@ -48,14 +84,19 @@ class Search(tmixins.APIPermissionRequiredMixin, ProjectMixin, APIView):
         page_size = int(request.data.get('length', 10))
         dataTablesDraw = int(request.data['draw'])
 
-        results_as_html = []
-        num_hits = 0
-        timestamp = ''
+        page = {
+            'recordsTotal': 0,
+            'recordsFiltered': 0,
+            'data': [],
+            'timestamp': '',
+        }
 
         if query:
-            raw_results = self.query_es(
-                self.get_project().id, query, start_idx, page_size)
-            if raw_results is None:
+            project_id = self.get_project().id
+            page = page_cache.get(project_id, query, start_idx, page_size)
+            if page is None:
+                page = self.get_page(project_id, query, start_idx, page_size)
+            if page is None:
                 return Response({
                     'draw': dataTablesDraw,
                     'recordsTotal': 0,
@@ -64,74 +105,88 @@ class Search(tmixins.APIPermissionRequiredMixin, ProjectMixin, APIView):
                     'error': 'unavailable',
                 })
 
-            num_hits = min(raw_results['hits']['total'],
-                           settings.ES_MAX_RESULTS)
-            results = raw_results['hits']['hits']
+        return Response(dict(page, draw=dataTablesDraw))
 
-            if len(results) == 0:
-                timestamp = self.query_es_timestamp(self.get_project().id)
-            else:
-                timestamp = results[0]['_source'].get('@timestamp')
+    def get_page(self, project_id, query, start_idx, page_size):
+        """Queries the search backends and renders a page of results. The
+        page is cached if the index timestamp of the project is known.
+        Returns ``None`` if no backend is available."""
+        raw_results, index_timestamp = self.query(
+            project_id, query, start_idx, page_size)
+        if raw_results is None:
+            return None
 
-            for result in results:
-                if result['_type'] == 'project':
-                    continue
-                augmented_result = self.augment_result(result)
-                if augmented_result is None:
-                    continue
-                html = self.htmlize_result(augmented_result)
-                results_as_html.append([html])
+        num_hits = min(raw_results['hits']['total'], settings.ES_MAX_RESULTS)
+        results = raw_results['hits']['hits']
 
-        return Response({
-            'draw': dataTablesDraw,
+        if len(results) > 0:
+            timestamp = results[0]['_source'].get('@timestamp')
+        elif index_timestamp is not None:
+            timestamp = index_timestamp
+        else:
+            # The results were not read from an index, so are up to date
+            timestamp = get_timestamp()
+
+        results_as_html = []
+        results = [r for r in results if r['_type'] != 'project']
+        entities = self.hydrate(results)
+        schemas = {}
+        for result in results:
+            augmented_result = self.augment_result(
+                result, entities=entities, schemas=schemas)
+            if augmented_result is None:
+                continue
+            html = self.htmlize_result(augmented_result)
+            results_as_html.append([html])
+
+        page = {
             'recordsTotal': num_hits,
             'recordsFiltered': num_hits,
             'data': results_as_html,
             'timestamp': timestamp,
-        })
-
-    def query_es(self, project_id, query, start_idx, page_size):
-        """Queries the ES API based on the UI query string and returns the
-        raw ES JSON results."""
-        body = {
-            'query': parse_query(query),
-            'from': start_idx,
-            'size': page_size,
-            'sort': {'_score': {'order': 'desc'}},
         }
-        try:
-            url = '{}/project-{}/spatial,party,resource/_search/'
-            r = requests.post(
-                url.format(api_url, project_id),
-                data=json.dumps(body, sort_keys=True),
-                headers={'content-type': 'application/json'},
-                timeout=10,
-            )
-            if r.status_code == 200:
-                return r.json()
-            else:
-                return None
-        except requests.exceptions.RequestException:
-            return None
+        if index_timestamp not in (None, _("unknown")):
+            page_cache.set(project_id, query, start_idx, page_size,
+                           index_timestamp, page)
+        return page
+
+    def query(self, project_id, query, start_idx, page_size):
+        """Queries the search backends in turn, until one is available.
+        Returns the raw results and the index timestamp of the first one to
+        answer, or ``(None, None)`` if none could."""
+        for backend in get_backends():
+            try:
+                return backend.search(project_id, query, start_idx, page_size)
+            except SearchUnavailableError as e:
+                logger.warning("Search backend %s unavailable: %s",
+                               type(backend).__name__, e)
+        return None, None
+
+    def hydrate(self, results):
+        """Loads the model instances of a page of ES results with one query
+        per model. Returns a dict mapping each model to a dict of its
+        instances by ID."""
+        ids = defaultdict(set)
+        for result in results:
+            for model_map in entity_mappings.get(result['_type'], ()):
+                id = result['_source'].get(model_map['id_field_name'])
+                if id:
+                    ids[model_map['model']].add(id)
 
-    def query_es_timestamp(self, project_id):
-        """Queries the ES API project type to get the index timestamp."""
-        try:
-            url = '{}/project-{}/project/_search/?q=*'
-            r = requests.get(url.format(api_url, project_id), timeout=10)
-            if r.status_code == 200:
-                return r.json()['hits']['hits'][0]['_source'].get('@timestamp')
-            else:
-                return _("unknown")
-        except requests.exceptions.RequestException:
-            return _("unknown")
-
-    def augment_result(self, result):
+        return {
+            model: model.objects.select_related(
+                *entity_related_fields[model]).in_bulk(list(model_ids))
+            for model, model_ids in ids.items()
+        }
+
+    def augment_result(self, result, entities=None, schemas=None):
         """Returns an augmented data suitable for plugging into HTML
-        given the raw ES result."""
+        given the raw ES result. ``entities`` and ``schemas`` are the
+        instances loaded by ``hydrate`` and the schema attributes cache
+        shared by the results of a page."""
         es_type = result['_type']
         source = result['_source']
-        entity = self.get_entity(es_type, source)
+        entity = self.get_entity(es_type, source, entities=entities)
         if entity is None:
             return None
         model = type(entity)
@@ -140,47 +195,32 @@ class Search(tmixins.APIPermissionRequiredMixin, ProjectMixin, APIView):
             'entity_type': entity.ui_class_name,
             'url': entity.get_absolute_url(),
             'main_label': self.get_main_label(model, source),
-            'attributes': self.get_attributes(entity, source),
+            'attributes': self.get_attributes(entity, source,
+                                              schemas=schemas),
         }
         if model == Resource:
             augmented_result['image'] = entity.thumbnail
 
         return augmented_result
 
-    def get_entity(self, es_type, source):
+    def get_entity(self, es_type, source, entities=None):
         """Returns the model instance for a search result given its ES type and
-        the result source document, which should contain the database ID."""
-        mappings = {
-            'spatial': (
-                {
-                    'model': SpatialUnit,
-                    'id_field_name': 'id',
-                },
-            ),
-            'party': (
-                {
-                    'model': TenureRelationship,
-                    'id_field_name': 'tenure_id',
-                },
-                {
-                    'model': Party,
-                    'id_field_name': 'id',
-                },
-            ),
-            'resource': (
-                {
-                    'model': Resource,
-                    'id_field_name': 'id',
-                },
-            ),
-        }
-        mapping = mappings.get(es_type)
+        the result source document, which should contain the database ID.
+        The instance is taken from ``entities`` if given, or else queried."""
+        mapping = entity_mappings.get(es_type)
         if mapping:
             for model_map in mapping:
+                model = model_map['model']
                 id = source.get(model_map['id_field_name'])
-                if id:
+                if not id:
+                    continue
+                if entities is not None:
+                    entity = entities.get(model, {}).get(id)
+                    if entity is not None:
+                        return entity
+                else:
                     try:
-                        return model_map['model'].objects.get(id=id)
+                        return model.objects.get(id=id)
                     except ObjectDoesNotExist:
                         pass
         return None
@@ -191,20 +231,41 @@ class Search(tmixins.APIPermissionRequiredMixin, ProjectMixin, APIView):
             return spatial_type_choices.get(source['type'], '—')
         elif model == TenureRelationship:
             try:
-                rel_type = TenureRelationshipType.objects.get(
-                    id=source['tenure_type_id'])
+                rel_type = TenureRelationshipType.objects.get_cached(
+                    source['tenure_type_id'])
                 return _(rel_type.label)
             except TenureRelationshipType.DoesNotExist:
                 return '—'
         else:  # Party or Resource
             return source.get('name', '—')
 
-    def get_attributes(self, entity, source):
+    def get_schema_attributes(self, entity, schemas=None):
+        """Returns the attributes of the schemas of the entity. Attributes
+        are cached in ``schemas`` by content type and selector values, so
+        the schemas are only looked up once for results sharing them."""
+        label = entity._meta.label_lower
+        key = [label]
+        for selector in settings.JSONATTRS_SCHEMA_SELECTORS.get(label, ()):
+            value = entity
+            for name in selector.split('.'):
+                value = getattr(value, name)
+            key.append(value)
+        key = tuple(key)
+
+        if schemas is None:
+            schemas = {}
+        if key not in schemas:
+            schemas[key] = [
+                a for s in Schema.objects.from_instance(entity)
+                for a in s.attributes.select_related('attr_type')
+            ]
+        return schemas[key]
+
+    def get_attributes(self, entity, source, schemas=None):
         """Returns additional display data for the result."""
         if type(entity) == SpatialUnit:
             attributes = []
-            schema = Schema.objects.from_instance(entity)
-            attrs = [a for s in schema for a in s.attributes.all()]
+            attrs = self.get_schema_attributes(entity, schemas)
             attributes.extend([
                 (a.long_name, a.render(entity.attributes.get(a.name, '—')))
                 for a in attrs if not a.omit and 'name' in a.name
@@ -253,39 +314,16 @@ class Search(tmixins.APIPermissionRequiredMixin, ProjectMixin, APIView):
 #             return HttpResponseBadRequest()
 
 #         project = self.get_project()
-#         es_dump_path = self.query_es(project.id, request.user.id, query)
+#         t = round(time.time() * 1000)
+#         source = SearchSource(project.id, query, os.path.join(
+#             settings.MEDIA_ROOT,
+#             'temp/{}-{}-{}'.format(project.id, request.user.id, t)
+#         ))
 #         exporter = self.exporters[export_format](project)
-#         path, mime_type = exporter.make_download(es_dump_path)
+#         path, mime_type = exporter.make_download(source)
 
 #         ext = os.path.splitext(path)[1]
 #         response = HttpResponse(open(path, 'rb'), content_type=mime_type)
 #         response['Content-Disposition'] = ('attachment; filename=' +
 #                                            project.slug + ext)
 #         return response
-
-#     def query_es(self, project_id, user_id, query):
-#         """Run a curl command to ES and dump the results into a temp file."""
-
-#         query_dsl = {
-#             'query': parse_query(query),
-#             'from': 0,
-#             'size': settings.ES_MAX_RESULTS,
-#             'sort': {'_score': {'order': 'desc'}},
-#         }
-#         query_dsl_param = url_quote(json.dumps(query_dsl), safe='')
-#         t = round(time.time() * 1000)
-#         es_dump_path = os.path.join(
-#             settings.MEDIA_ROOT,
-#             'temp/{}-{}-{}.esjson'.format(project_id, user_id, t)
-#         )
-#         subprocess.run([
-#             'curl',
-#             '-o', es_dump_path,
-#             '-f',
-#             '-XGET',
-#             (
-#                 '{}/project-{}/spatial,party,resource/_data/'
-#                 '?format=json&source={}'
-#             ).format(api_url, project_id, query_dsl_param)
-#         ]).check_returncode()
-#         return es_dump_path
@@ -10,3 +10,5 @@ TYPE_CHOICES = (('PA', _('Parcel')),
                 ('UC', _('Utility corridor')),
                 ('NP', _('National park boundary')),
                 ('MI', _('Miscellaneous')))
+
+TYPE_CHOICES_DICT = dict(TYPE_CHOICES)
@@ -2,11 +2,11 @@ from django.core.exceptions import ValidationError, PermissionDenied
 from django.core.files.storage import get_storage_class
 from django.db import transaction
 from django.utils.translation import ugettext as _
-from jsonattrs.models import Attribute, AttributeType
-from tutelary.models import Policy
+from core.policies import get_user_roles
 from party.models import Party, TenureRelationship, TenureRelationshipType
 from pyxform.xform2json import XFormToDict
 from questionnaires.models import Questionnaire
+from questionnaires.schemas import decode_answer, get_submission_schema
 from resources.models import Resource
 from spatial.models import SpatialUnit
 from xforms.exceptions import InvalidXMLSubmission
@@ -14,8 +14,9 @@ from xforms.models import XFormSubmission
 from xforms.utils import odk_geom_to_wkt
 
 
-def get_policy_instance(policy_name, variables=None):
-    return (Policy.objects.get(name=policy_name), variables)
+# Roles allowed to contribute data to a project
+CONTRIBUTOR_ROLES = frozenset((
+    'superuser', 'org-admin', 'project-manager', 'data-collector'))
 
 
 class ModelHelper():
@@ -23,22 +24,7 @@ class ModelHelper():
         self.arg = arg
 
     def _check_perm(self, user, project):
-        superuser = get_policy_instance('superuser')
-        org_admin = get_policy_instance('org-admin', {
-            'organization': project.organization.slug
-        })
-        prj_manager = get_policy_instance('project-manager', {
-            'organization': project.organization.slug,
-            'project': project.slug
-        })
-        data_collector = get_policy_instance('data-collector', {
-            'organization': project.organization.slug,
-            'project': project.slug
-        })
-
-        roles = [superuser, org_admin, prj_manager, data_collector]
-        assigned_policies = user.assigned_policies()
-        if not any(role in assigned_policies for role in roles):
+        if not get_user_roles(user, project) & CONTRIBUTOR_ROLES:
             raise PermissionDenied(_("You don't have permission to contribute"
                                      " data to this project."))
 
@@ -47,10 +33,11 @@ class ModelHelper():
             id_string=data['id'], version=data['version']
         )
         self._check_perm(user, questionnaire.project)
+        schema = get_submission_schema(questionnaire)
 
         # If xform has already been submitted, check for additional resources
         additional_resources = self.check_for_duplicate_submission(
-                        data, questionnaire)
+                        data, questionnaire, schema=schema)
         if additional_resources:
             return additional_resources
 
@@ -61,13 +48,15 @@ class ModelHelper():
 
         parties, party_resources = self.create_party(
             data=data,
-            project=project
+            project=project,
+            schema=schema
         )
 
         locations, location_resources = self.create_spatial_unit(
             data=data,
             project=project,
-            party=parties
+            party=parties,
+            schema=schema
         )
 
         (tenure_relationships,
@@ -75,7 +64,8 @@ class ModelHelper():
             data=data,
             project=project,
             parties=parties,
-            locations=locations
+            locations=locations,
+            schema=schema
         )
 
         return (questionnaire,
@@ -83,7 +73,8 @@ class ModelHelper():
                 locations, location_resources,
                 tenure_relationships, tenure_resources)
 
-    def check_for_duplicate_submission(self, data, questionnaire):
+    def check_for_duplicate_submission(self, data, questionnaire,
+                                       schema=None):
         previous_submission = XFormSubmission.objects.filter(
             instanceID=data['meta']['instanceID']
         )
@@ -92,30 +83,35 @@ class ModelHelper():
             return None
 
         previous_submission = previous_submission[0]
+        if schema is None:
+            schema = get_submission_schema(questionnaire)
 
         party_objects, party_resources = self.create_party(
             data=data,
             project=questionnaire.project,
-            duplicate=previous_submission)
+            duplicate=previous_submission,
+            schema=schema)
 
         location_objects, location_resources = self.create_spatial_unit(
             data=data,
             project=questionnaire.project,
-            duplicate=previous_submission)
+            duplicate=previous_submission,
+            schema=schema)
 
         tenure_objects, tenure_resources = self.create_tenure_relationship(
             data=data,
             project=questionnaire.project,
             parties=party_objects,
             locations=location_objects,
-            duplicate=previous_submission)
+            duplicate=previous_submission,
+            schema=schema)
 
         return (questionnaire,
                 party_objects, party_resources,
                 location_objects, location_resources,
                 tenure_objects, tenure_resources)
 
-    def create_party(self, data, project, duplicate=None):
+    def create_party(self, data, project, duplicate=None, schema=None):
         party_objects = []
         party_resources = []
 
@@ -131,7 +127,7 @@ class ModelHelper():
                     project=project,
                     name=group['party_name'],
                     type=group['party_type'],
-                    attributes=self._get_attributes(group, 'party')
+                    attributes=self._get_attributes(group, 'party', schema)
                 )
 
                 party_resources.append(
@@ -145,7 +141,7 @@ class ModelHelper():
         return party_objects, party_resources
 
     def create_spatial_unit(self, data, project,
-                            party=None, duplicate=None):
+                            party=None, duplicate=None, schema=None):
         location_resources = []
         location_objects = []
 
@@ -163,7 +159,8 @@ class ModelHelper():
                     project=project,
                     type=group['location_type'],
                     geometry=geom,
-                    attributes=self._get_attributes(group, 'location')
+                    attributes=self._get_attributes(
+                        group, 'location', schema)
                 )
 
                 location_resources.append(
@@ -177,7 +174,7 @@ class ModelHelper():
         return location_objects, location_resources
 
     def create_tenure_relationship(self, data, parties, locations, project,
-                                   duplicate=None):
+                                   duplicate=None, schema=None):
         tenure_resources = []
         tenure_objects = []
 
@@ -204,11 +201,12 @@ class ModelHelper():
                         project=project,
                         party=party,
                         spatial_unit=location,
-                        tenure_type=TenureRelationshipType.objects.get(
-                            id=tenure_group[t]['tenure_type']),
+                        tenure_type=TenureRelationshipType.objects.get_cached(
+                            tenure_group[t]['tenure_type']),
                         attributes=self._get_attributes(
                             tenure_group[t],
-                            'tenure_relationship')
+                            'tenure_relationship',
+                            schema)
                     )
                     tenure_objects.append(tenure)
                     tenure_resources.append(
@@ -392,19 +390,16 @@ class ModelHelper():
         except Questionnaire.DoesNotExist:
             raise ValidationError(_('Questionnaire not found.'))
 
-    def _get_attributes(self, data, model_type):
+    def _get_attributes(self, data, model_type, schema=None):
+        """Returns the attributes of the answers to the attribute groups of
+        the model type, decoded by the submission schema of the
+        questionnaire."""
         attributes = {}
         for attr_group in data:
             if '{model}_attributes'.format(model=model_type) in attr_group:
                 for item in data[attr_group]:
-                    if Attribute.objects.filter(
-                        name=item,
-                        attr_type=AttributeType.objects.get(
-                            name='select_multiple')).exists():
-                        answers = data[attr_group][item].split(' ')
-                        attributes[item] = answers
-                    else:
-                        attributes[item] = data[attr_group][item]
+                    attributes[item] = decode_answer(
+                        schema or {}, attr_group, item, data[attr_group][item])
         return attributes
 
     def _get_resource_files(self, data, model_type):
@@ -15,13 +15,15 @@ from core.tests.factories import PolicyFactory
 from party.tests.factories import PartyFactory, TenureRelationshipFactory
 from organization.tests.factories import ProjectFactory
 from spatial.tests.factories import SpatialUnitFactory
+from questionnaires.schemas import cache_submission_schema
 from questionnaires.tests.factories import (QuestionnaireFactory,
-                                            QuestionFactory,)
+                                            QuestionFactory,
+                                            QuestionGroupFactory)
 
 from party.models import (Party, TenureRelationship,
                           load_tenure_relationship_types,
                           TenureRelationshipType)
-from organization.models import OrganizationRole
+from organization.models import OrganizationRole, ProjectRole
 from resources.models import Resource
 from spatial.models import SpatialUnit
 from xforms.models import XFormSubmission
@@ -932,6 +934,34 @@ class XFormModelHelperTest(TestCase):
         assert 'party_name' not in attributes
         assert 'party_type' not in attributes
 
+    def test_get_attributes_with_schema(self):
+        group = QuestionGroupFactory.create(
+            name='party_attributes_default',
+            questionnaire=self.questionnaire)
+        QuestionFactory.create(
+            name='crops', type='SM', question_group=group,
+            questionnaire=self.questionnaire)
+        QuestionFactory.create(
+            name='notes', type='TX', question_group=group,
+            questionnaire=self.questionnaire)
+        schema = cache_submission_schema(self.questionnaire)
+
+        data = {
+            'party_name': 'House Party',
+            'party_attributes_default': {
+                'crops': 'maize beans',
+                'notes': 'two crops',
+            },
+        }
+        # Answers are decoded without querying the attribute schemas
+        with self.assertNumQueries(0):
+            attributes = mh._get_attributes(self, data, 'party', schema)
+
+        assert attributes == {
+            'crops': ['maize', 'beans'],
+            'notes': 'two crops',
+        }
+
     def test_get_resource_files(self):
         data = {
             'ardvark': 'Ardvark!',
@@ -984,3 +1014,16 @@ class XFormModelHelperTest(TestCase):
             mh._check_perm(mh, self.user, self.project)
         except PermissionDenied:
             self.fail("PermissionDenied raised unexpectedly")
+
+    def test_check_perm_with_project_role(self):
+        role = ProjectRole.objects.create(
+            project=self.project, user=self.user, role='DC')
+        mh._check_perm(mh, self.user, self.project)
+        # The roles of the user are cached
+        with self.assertNumQueries(0):
+            mh._check_perm(mh, self.user, self.project)
+
+        role.role = 'PU'
+        role.save()
+        with pytest.raises(PermissionDenied):
+            mh._check_perm(mh, self.user, self.project)